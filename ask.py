@@ -0,0 +1,39 @@
+import os
+import sys
+import argparse
+
+# Add the project root to the python path
+sys.path.append(os.getcwd())
+
+from src import config
+from src.client import BackendError, BackendUnavailable, ask_backend
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Answer one question about the codebase, through the resident backend when it is running."
+    )
+    parser.add_argument("question", nargs="+", help="The question (quoting is optional).")
+    parser.add_argument("--socket", default=config.SERVER_SOCKET_PATH,
+                        help="Resident backend socket (start one with `python serve.py --port 0 --socket`).")
+    parser.add_argument("--local", action="store_true", help="Answer in this process even if a backend is running.")
+    args = parser.parse_args()
+    question = " ".join(args.question)
+
+    if not args.local:
+        try:
+            ask_backend(question, args.socket)
+            return
+        except BackendUnavailable:
+            print(f"No backend running on {args.socket}; answering in this process "
+                  f"(start one with `python serve.py --port 0 --socket` to skip start-up).", file=sys.stderr)
+        except BackendError as e:
+            if e.status != 503:
+                sys.exit(f"The backend could not answer: {e}")
+            print("The backend is overloaded; answering in this process.", file=sys.stderr)
+    # Only now pay for the retrieval stack and model clients
+    from src.retriever import generate_answer_with_logging
+
+    generate_answer_with_logging(question)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import os
+import sys
+import json
+import argparse
+
+# Add the project root to the python path
+sys.path.append(os.getcwd())
+
+from src.batch import run_batch
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions against the codebase.")
+    parser.add_argument("input", help='JSONL of questions: {"id": ..., "question": ...} or bare strings.')
+    parser.add_argument("output", help="JSONL file answers are appended to as they finish.")
+    parser.add_argument("--concurrency", type=int, default=None, help="Concurrent LLM generations.")
+    parser.add_argument("--wave-size", type=int, default=None, help="Questions embedded and searched per batch.")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Truncate the output and answer every question again.")
+    args = parser.parse_args()
+
+    stats = run_batch(args.input, args.output, concurrency=args.concurrency,
+                      wave_size=args.wave_size, resume=not args.no_resume)
+    print(json.dumps(stats, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import json
+import argparse
+
+# Add the project root to the python path
+sys.path.append(os.getcwd())
+
+from src import config
+from src.vector_store import get_vector_store
+from src.mmap_index import (
+    MmapVectorIndex, export_collection, mmap_index_exists, benchmark_against_chroma, benchmark_quantization,
+)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the memory-mapped vector index against Chroma.")
+    parser.add_argument("--queries", type=int, default=200, help="Number of benchmark queries.")
+    parser.add_argument("--k", type=int, default=4, help="Results per query.")
+    parser.add_argument("--batch-size", type=int, default=32, help="Queries per batched mmap search.")
+    parser.add_argument("--export", action="store_true", help="Re-export the snapshot before benchmarking.")
+    parser.add_argument("--quantization", action="store_true",
+                        help="Report recall, memory and latency of int8 tiers instead.")
+    parser.add_argument("--dims", default="all,512,256,128",
+                        help="Comma-separated int8 tier dimensions to try ('all' = no truncation).")
+    parser.add_argument("--rescore", default="1,4,10",
+                        help="Comma-separated rescore factors (shortlist = factor * k) to try.")
+    args = parser.parse_args()
+
+    vector_db = get_vector_store()
+    if args.export or not mmap_index_exists():
+        print(f"Exporting collection to {config.MMAP_INDEX_PATH}...")
+        export_collection(vector_db)
+
+    index = MmapVectorIndex()
+    if args.quantization:
+        dims = [None if d.strip() == "all" else int(d) for d in args.dims.split(",")]
+        factors = [int(f) for f in args.rescore.split(",")]
+        results = benchmark_quantization(vector_db, index, dims, factors, queries=args.queries, k=args.k)
+        print(f"{'tier':<8} {'dims':>5} {'rescore':>7} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'memory MB':>10}")
+        for row in results["rows"]:
+            print(f"{row['tier']:<8} {row['dims']:>5} {row['rescore_factor'] or '-':>7} {row['recall']:>7.4f} "
+                  f"{row['latency_ms']['p50']:>8.3f} {row['latency_ms']['p95']:>8.3f} "
+                  f"{row['memory_bytes'] / 2**20:>10.2f}")
+    else:
+        results = benchmark_against_chroma(vector_db, index, queries=args.queries, k=args.k,
+                                           batch_size=args.batch_size)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
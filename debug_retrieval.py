@@ -4,17 +4,17 @@ import sys
 # Add the project root to the python path
 sys.path.append(os.getcwd())
 
-from src.retriever import get_retriever, create_rag_chain
+from src.retriever import get_retrieval_service
 
 def debug_retrieval(question):
     print(f"Debugging retrieval for question: '{question}'")
     
     try:
-        retriever = get_retriever()
+        service = get_retrieval_service()
         
         # 1. Check retrieved documents directly
         print("\n--- Retrieved Documents ---")
-        docs = retriever.invoke(question)
+        docs = service.retrieve(question)
         if not docs:
             print("WARNING: No documents retrieved!")
         else:
@@ -24,8 +24,7 @@ def debug_retrieval(question):
         
         # 2. Check RAG Chain Answer
         print("\n--- RAG Chain Answer ---")
-        rag_chain = create_rag_chain(retriever)
-        response = rag_chain.invoke(question)
+        response = service.generate(question, docs)
         print(response)
         
     except Exception as e:
@@ -0,0 +1,87 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+# Add the project root to the python path
+sys.path.append(os.getcwd())
+
+from src import config
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    pick = lambda p: ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+    return {f"p{p}": round(pick(p), 3) for p in (50, 95, 99)}
+
+async def ask(args, question: str) -> dict:
+    """Sends one question and reads the streamed NDJSON events."""
+    start = time.perf_counter()
+    if args.socket:
+        reader, writer = await asyncio.open_unix_connection(args.socket)
+    else:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    body = json.dumps({"question": question}).encode("utf-8")
+    writer.write(b"POST /query HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 b"Content-Length: %d\r\n\r\n%s" % (len(body), body))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    while (await reader.readline()) not in (b"\r\n", b""):
+        pass
+    result = {"status": status, "first_token": None}
+    if status == 200:
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            if not size:
+                break
+            event = json.loads(await reader.readexactly(size))
+            await reader.readline()
+            if event["event"] == "token" and result["first_token"] is None:
+                result["first_token"] = time.perf_counter() - start
+            elif event["event"] in ("done", "error"):
+                result["event"] = event
+    result["seconds"] = time.perf_counter() - start
+    writer.close()
+    return result
+
+async def run(args):
+    questions = [f"How does component {i % args.distinct} handle its inputs?" for i in range(args.requests)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def client(question):
+        async with semaphore:
+            return await ask(args, question)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(client(q) for q in questions))
+    elapsed = time.perf_counter() - start
+    ok = [r for r in results if r["status"] == 200]
+    return {
+        "requests": len(results),
+        "concurrency": args.concurrency,
+        "ok": len(ok),
+        "shed": sum(1 for r in results if r["status"] == 503),
+        "errors": sum(1 for r in results if r["status"] not in (200, 503)) + sum(
+            1 for r in ok if r.get("event", {}).get("event") == "error"),
+        "requests_per_sec": round(len(results) / elapsed, 2),
+        "first_token_seconds": percentiles([r["first_token"] for r in ok if r["first_token"] is not None]),
+        "total_seconds": percentiles([r["seconds"] for r in ok]),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test a running query server (see serve.py).")
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--socket", default=None, help="Connect over this Unix socket instead of TCP.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent clients.")
+    parser.add_argument("--distinct", type=int, default=1000,
+                        help="Distinct questions; fewer means more answer-cache hits.")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,16 @@
 # main.py
 import os
 from src import config
-from src.data_loader import load_and_chunk_codebase
-from src.vector_store import build_vector_store
-from src.retriever import generate_answer_with_logging # <-- IMPORT THE NEW FUNCTION
+from src.client import BackendError, BackendUnavailable, ask_backend, backend_available
+# The ingestion and retrieval modules (and the model clients they load) are imported
+# on first use, so the prompt comes up at once and backend-only sessions never load them
 
 def run_ingestion():
-    """Runs the full data ingestion and vectorization pipeline."""
+    """Runs the incremental data ingestion and vectorization pipeline."""
+    from src.ingest import sync_codebase
+
     print("--- Running Ingestion Pipeline ---")
-    documents = load_and_chunk_codebase(config.CODEBASE_ROOT)
-    if documents:
-        build_vector_store(documents)
+    sync_codebase(config.CODEBASE_ROOT)
     print("--- Ingestion Complete ---")
 
 def main():
@@ -24,30 +24,56 @@ def main():
             if choice in ['r', 'q']:
                 break
             print("Invalid choice. Please enter 'r' or 'q'.")
-        
+
         if choice == 'r':
             run_ingestion()
     else:
         print("No existing database found. Starting the ingestion process.")
         run_ingestion()
-        
+
     print("\n--- Starting Interactive Query Session ---")
     print("Enter 'exit' to end the session.")
-    
+    # Questions go to the resident backend (serve.py --socket) while one is running
+    use_backend = backend_available()
+    if use_backend:
+        print(f"Answering through the resident backend at {config.SERVER_SOCKET_PATH}.")
+    answered_locally = False
+
     try:
         while True:
             question = input("\nAsk a question about the codebase: ")
             if question.lower() == 'exit':
+                if answered_locally:
+                    from src.answer_cache import get_answer_cache
+
+                    cache = get_answer_cache()
+                    print(f"Answer cache hit rate: {cache.hit_rate():.0%} ({cache.stats})")
                 print("Exiting query session. Goodbye!")
                 break
             if not question.strip():
                 continue
-            
+
+            if use_backend:
+                try:
+                    ask_backend(question)
+                    continue
+                except BackendUnavailable:
+                    print("The resident backend has stopped; answering in this process from now on.")
+                    use_backend = False
+                except BackendError as e:
+                    if e.status != 503:
+                        print(f"\nThe resident backend could not answer: {e}")
+                        continue
+                    print("The resident backend is overloaded; answering this question in this process.")
+
             # Call our new logging and answering function
+            from src.retriever import generate_answer_with_logging
+
             generate_answer_with_logging(question)
+            answered_locally = True
 
     except Exception as e:
         print(f"\nAn error occurred during the query session: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,36 +1,42 @@
-import shutil
 import os
 import sys
+import argparse
 
 # Add the project root to the python path
 sys.path.append(os.getcwd())
 
-from src import config
-from src.data_loader import load_and_chunk_codebase
-from src.vector_store import build_vector_store
+from src import config, db_versions
+from src.ingest import sync_codebase
 
-def reingest():
+def reingest(full: bool = False):
     print("Starting Re-ingestion Process...")
-    
-    # 1. Clear existing DB to remove stale data
-    if os.path.exists(config.CHROMA_DB_PATH):
-        print(f"Removing existing DB at '{config.CHROMA_DB_PATH}' to ensure clean slate...")
-        shutil.rmtree(config.CHROMA_DB_PATH)
-    else:
-        print(f"No existing DB found at '{config.CHROMA_DB_PATH}'.")
-    
-    # 2. Load and Chunk Documents
     # config.CODEBASE_ROOT is already set to "/home/srikanth/Work/Angular/angular-tailwind/"
     print(f"Target Codebase: {config.CODEBASE_ROOT}")
-    documents = load_and_chunk_codebase(config.CODEBASE_ROOT)
-    
-    if not documents:
-        print("ERROR: No documents found! Please check if the path exists and contains supported files.")
+    if not os.path.isdir(config.CODEBASE_ROOT):
+        print("ERROR: Codebase path does not exist! Please check config.CODEBASE_ROOT.")
         return
 
-    # 3. Build Vector Store
-    build_vector_store(documents)
+    if full:
+        # Build a fresh store next to the live one, validate it and switch to it
+        # atomically; queries keep being served from the live store meanwhile.
+        try:
+            db_versions.build_version(config.CODEBASE_ROOT)
+        except db_versions.ValidationError as e:
+            print(f"ERROR: The rebuilt store failed validation ({e}); the live store was kept.")
+            return
+    else:
+        # The manifest lets us re-embed just the files that changed, in the live store
+        sync_codebase(config.CODEBASE_ROOT)
     print("Re-ingestion complete.")
 
 if __name__ == "__main__":
-    reingest()
+    parser = argparse.ArgumentParser(description="Re-ingest the codebase into the vector store.")
+    parser.add_argument("--full", action="store_true",
+                        help="Rebuild everything from scratch into a new store version, then switch to it.")
+    parser.add_argument("--rollback", action="store_true",
+                        help="Switch back to the previous store version.")
+    args = parser.parse_args()
+    if args.rollback:
+        db_versions.rollback()
+    else:
+        reingest(full=args.full)
@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import argparse
+
+# Add the project root to the python path
+sys.path.append(os.getcwd())
+
+from src.benchmark import DEFAULT_CORPUS_PATH, bench_startup, check_startup_budgets, run_benchmarks, compare_results
+
+def report_budgets(startup: dict) -> bool:
+    """Prints entry points over their import time budget (config.STARTUP_IMPORT_BUDGETS)."""
+    over = check_startup_budgets(startup)
+    if not over:
+        print("\nAll entry points import within budget.")
+        return True
+    print("\nImport time over budget:")
+    for line in over:
+        print(f"  {line}")
+    return False
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion and query benchmarks (fake models, JSON output).")
+    parser.add_argument("--files", type=int, default=200, help="Files in the synthetic tree.")
+    parser.add_argument("--functions-per-file", type=int, default=20)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS_PATH, help="Extra corpus to benchmark ('' to skip).")
+    parser.add_argument("--queries", type=int, default=100, help="Retrieval queries per kind.")
+    parser.add_argument("--answers", type=int, default=20, help="End-to-end answers for time-to-first-token.")
+    parser.add_argument("--repeats", type=int, default=3, help="Chunking repeats (median is reported).")
+    parser.add_argument("--workers", type=int, default=None, help="Chunking processes (default: config).")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Fake embedding latency per call (s).")
+    parser.add_argument("--llm-first-token", type=float, default=0.05, help="Fake LLM time to first token (s).")
+    parser.add_argument("--llm-token", type=float, default=0.0, help="Fake LLM delay per token (s).")
+    parser.add_argument("--quota", action="store_true",
+                        help="Apply the configured embedding requests/tokens-per-minute limits.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write results JSON here as well as stdout.")
+    parser.add_argument("--compare", default=None, help="Baseline results JSON; exit 1 on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown before flagging.")
+    parser.add_argument("--startup", action="store_true",
+                        help="Only measure entry point import times; exit 1 if one exceeds its budget.")
+    args = parser.parse_args()
+
+    if args.startup:
+        startup = bench_startup()
+        print(json.dumps(startup, indent=2))
+        if not report_budgets(startup):
+            sys.exit(1)
+        return
+
+    results = run_benchmarks(
+        files=args.files, functions_per_file=args.functions_per_file, corpus_path=args.corpus or None,
+        queries=args.queries, answers=args.answers, repeats=args.repeats, workers=args.workers,
+        embed_latency=args.embed_latency, llm_first_token=args.llm_first_token, llm_token=args.llm_token,
+        quota=args.quota, seed=args.seed,
+    )
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    within_budget = report_budgets(results["startup"])
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare_results(json.load(f), results, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline.")
+    if not within_budget:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import os
+import sys
+import asyncio
+import argparse
+
+# Add the project root to the python path
+sys.path.append(os.getcwd())
+
+from src import config
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve codebase questions over HTTP with streamed answers.")
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT, help="TCP port (0 disables TCP).")
+    parser.add_argument("--socket", nargs="?", const=config.SERVER_SOCKET_PATH, default=None,
+                        help="Also listen on this Unix socket path (default path: the resident backend's, "
+                             "which main.py and ask.py connect to).")
+    parser.add_argument("--backend", choices=["vertex", "fake"], default=config.MODEL_BACKEND,
+                        help="Model backend; 'fake' runs fully offline for load tests.")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="Concurrent LLM generations.")
+    parser.add_argument("--max-queued", type=int, default=None, help="Requests waiting before load is shed.")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep the index in sync with config.CODEBASE_ROOT while serving.")
+    args = parser.parse_args()
+
+    config.MODEL_BACKEND = args.backend
+    if args.socket and os.path.dirname(args.socket):
+        os.makedirs(os.path.dirname(args.socket), exist_ok=True)
+    from src.server import run_server
+
+    watcher = None
+    if args.watch:
+        from src.watcher import CodebaseWatcher
+        watcher = CodebaseWatcher(config.CODEBASE_ROOT)
+        watcher.start()
+    try:
+        asyncio.run(run_server(args.host, args.port, args.socket,
+                               max_in_flight=args.max_in_flight, max_queued=args.max_queued))
+    except KeyboardInterrupt:
+        print("Server stopped.")
+    finally:
+        if watcher is not None:
+            watcher.stop()
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
-import subprocess
+import sys
 import os
 
+# Ensure the project root is in the path to import src modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+
+from src import config
+from src.exec_pool import get_exec_pool
+
 def create_file(path: str, content: str) -> str:
     """
     Creates a file at the specified path with the given content.
@@ -24,6 +30,12 @@ def create_file(path: str, content: str) -> str:
     except Exception as e:
         return f"Error creating file: {str(e)}"
 
+def _format_result(result) -> str:
+    output = f"--- STDOUT ---\n{result.stdout}\n"
+    if result.stderr:
+        output += f"\n--- STDERR ---\n{result.stderr}"
+    return output + f"\n--- {result.timings()} ---"
+
 def execute_python_file(path: str) -> str:
     """
     Executes a Python script located at the specified path.
@@ -32,26 +44,17 @@ def execute_python_file(path: str) -> str:
         path: The path to the Python file to execute.
         
     Returns:
-        The combined stdout and stderr of the execution.
+        The combined stdout and stderr of the execution, and its exit code and timings.
     """
     try:
         if not os.path.exists(path):
             return f"Error: File not found at {path}"
-            
-        result = subprocess.run(
-            ["python3", path],
-            capture_output=True,
-            text=True,
-            timeout=30  # Safety timeout
-        )
-        
-        output = f"--- STDOUT ---\n{result.stdout}\n"
-        if result.stderr:
-            output += f"\n--- STDERR ---\n{result.stderr}"
-            
-        return output
-    except subprocess.TimeoutExpired:
-        return "Error: Execution timed out after 30 seconds."
+
+        # Runs in a warm, pre-forked interpreter (see src/exec_pool.py)
+        result = get_exec_pool().run_python(path)
+        if result.timed_out:
+            return f"Error: Execution timed out after {config.EXEC_TIMEOUT_SECONDS} seconds.\n" + _format_result(result)
+        return _format_result(result)
     except Exception as e:
         return f"Error executing file: {str(e)}"
 
@@ -63,25 +66,15 @@ def run_command(command: str) -> str:
         command: The shell command to execute.
         
     Returns:
-        The combined stdout and stderr of the command.
+        The combined stdout and stderr of the command, and its exit code and timings.
     """
     try:
         # Split command for safety if simple, but shell=True is often needed for complex commands
         # For an agent, we'll use shell=True but warn about security in a real prod env
-        result = subprocess.run(
-            command,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        output = f"--- STDOUT ---\n{result.stdout}\n"
-        if result.stderr:
-            output += f"\n--- STDERR ---\n{result.stderr}"
-            
-        return output
-    except subprocess.TimeoutExpired:
-        return "Error: Command timed out after 30 seconds."
+        # (runs in a warm worker, in its own process group; see src/exec_pool.py)
+        result = get_exec_pool().run_shell(command)
+        if result.timed_out:
+            return f"Error: Command timed out after {config.EXEC_TIMEOUT_SECONDS} seconds.\n" + _format_result(result)
+        return _format_result(result)
     except Exception as e:
         return f"Error running command: {str(e)}"
@@ -1,27 +1,85 @@
 import sys
 import os
+import time
+
+from google.adk.tools import ToolContext
 
 # Ensure the project root is in the path to import src modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
-from src.retriever import get_retriever, create_rag_chain
+from src import config, db_versions
+
+# Session state key holding this tool's result cache
+CACHE_STATE_KEY = "query_codebase_cache"
+MODES = ("snippets", "answer")
+
+def _index_generation() -> str:
+    """The live store and when ingestion last wrote its manifest; any sync changes it."""
+    db_versions.refresh()
+    try:
+        synced = os.stat(config.MANIFEST_PATH).st_mtime_ns
+    except OSError:
+        synced = 0
+    return f"{config.CHROMA_DB_PATH}@{synced}"
+
+def _cache_key(mode: str, question: str) -> str:
+    """Questions that differ only in case or whitespace share a cache entry (per index generation)."""
+    return f"{_index_generation()}|{mode}|{' '.join(question.lower().split())}"
+
+def _cached(tool_context: ToolContext, key: str):
+    entry = tool_context.state.get(CACHE_STATE_KEY, {}).get(key)
+    if entry and time.time() - entry["at"] < config.TOOL_CACHE_TTL_SECONDS:
+        return entry["result"]
+    return None
 
-def query_codebase(question: str) -> str:
+def _store(tool_context: ToolContext, key: str, result: str):
+    # Reassign rather than mutate, so ADK records the state change
+    cache = dict(tool_context.state.get(CACHE_STATE_KEY, {}))
+    cache.pop(key, None)
+    cache[key] = {"at": time.time(), "result": result}
+    while len(cache) > config.TOOL_CACHE_MAX_ENTRIES:
+        cache.pop(next(iter(cache)))
+    tool_context.state[CACHE_STATE_KEY] = cache
+
+def query_codebase(question: str, mode: str, tool_context: ToolContext) -> str:
     """
-    Queries the codebase using semantic search and RAG to answer a question.
-    
+    Searches the codebase for a question.
+
+    In "snippets" mode (preferred), returns the most relevant code and docs as
+    ranked snippets, each headed by its file, line range, how it matched and a
+    relevance score, for you to read and reason over directly. In "answer"
+    mode, a separate model writes an answer from the same search results,
+    which is slower; use it only for broad questions that need a summary.
+
+    Definition questions ("Where is X defined?") are resolved from the symbol
+    index instantly in either mode. Repeated searches within a session are
+    served from a cache until the codebase is re-indexed.
+
     Args:
-        question: The question to ask about the codebase.
-        
+        question: The question or search query about the codebase.
+        mode: "snippets" for ranked code snippets, or "answer" for a written answer.
+
     Returns:
-        The answer generated by the RAG pipeline.
+        The ranked snippets, or the generated answer.
     """
+    mode = mode if mode in MODES else "snippets"
+    key = _cache_key(mode, question)
+    cached = _cached(tool_context, key) if tool_context is not None else None
+    if cached is not None:
+        return cached
     try:
-        retriever = get_retriever()
-        rag_chain = create_rag_chain(retriever)
-        
-        # Invoke the chain
-        response = rag_chain.invoke(question)
-        return response
+        # Imported on the first call, so loading the agent doesn't wait on the retrieval stack
+        from src.context import format_snippets
+        from src.retriever import get_retrieval_service
+
+        # The service keeps its clients warm across tool calls
+        service = get_retrieval_service()
+        if mode == "answer":
+            result, _ = service.answer(question)
+        else:
+            result = format_snippets(service.retrieve(question, k=config.SNIPPET_K)) or "No matching code found."
     except Exception as e:
         return f"Error querying codebase: {str(e)}"
+    if tool_context is not None:
+        _store(tool_context, key, result)
+    return result
@@ -0,0 +1,167 @@
+# src/answer_cache.py
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from src import config, telemetry
+
+@dataclass
+class CachedAnswer:
+    """A generated answer together with the question and context it came from."""
+    question: str
+    vector: np.ndarray
+    docs: List[Document]
+    answer: str
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def chunk_ids(self) -> List[str]:
+        return [doc.id for doc in self.docs if doc.id]
+
+    @property
+    def sources(self) -> set:
+        return {doc.metadata.get("source") for doc in self.docs}
+
+class SemanticAnswerCache:
+    """
+    In-memory cache of answers, matched by question-embedding similarity.
+
+    A new question reuses a cached answer when its embedding's cosine
+    similarity to a cached question is at least `threshold`, the entry is
+    younger than `ttl_seconds`, and (if a validator is supplied) the chunks
+    the answer was based on still exist unchanged. Chunk IDs are derived from
+    chunk content, so a re-ingested file yields new IDs and fails validation.
+    Entries are evicted least-recently-used beyond `max_entries`, and can be
+    dropped eagerly with `invalidate_sources` when ingestion touches a file.
+    """
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+    ):
+        self.threshold = config.ANSWER_CACHE_SIMILARITY_THRESHOLD if threshold is None else threshold
+        self.ttl_seconds = config.ANSWER_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_entries = max_entries or config.ANSWER_CACHE_MAX_ENTRIES
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        # Stacked, normalized question vectors; rebuilt lazily after changes
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[int] = []
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "expired": 0, "evictions": 0, "invalidated": 0}
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop(self, key: int):
+        self._entries.pop(key, None)
+        self._matrix = None
+
+    def _similarities(self, vector: np.ndarray):
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries)
+            self._matrix = (
+                np.stack([self._entries[key].vector for key in self._matrix_keys])
+                if self._matrix_keys else None
+            )
+        if self._matrix is None:
+            return [], np.empty(0, dtype=np.float32)
+        return self._matrix_keys, self._matrix @ vector
+
+    def lookup(
+        self, question_vector, validate: Optional[Callable[[List[str]], bool]] = None
+    ) -> Optional[CachedAnswer]:
+        """
+        Returns the best cached answer for a question embedding, or None.
+
+        Args:
+            question_vector: Embedding of the new question.
+            validate: Called with the cached entry's chunk IDs; returning False
+                marks the entry stale and drops it.
+        """
+        vector = self._normalize(question_vector)
+        with self._lock:
+            keys, scores = self._similarities(vector)
+            now = time.time()
+            for index in np.argsort(-scores):
+                if scores[index] < self.threshold:
+                    break
+                key = keys[index]
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if now - entry.created_at > self.ttl_seconds:
+                    self.stats["expired"] += 1
+                    self._drop(key)
+                    continue
+                if validate is not None and not validate(entry.chunk_ids):
+                    self.stats["stale"] += 1
+                    self._drop(key)
+                    continue
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                telemetry.count("answer_cache_hits")
+                return entry
+            self.stats["misses"] += 1
+            telemetry.count("answer_cache_misses")
+            return None
+
+    def store(self, question: str, question_vector, docs: List[Document], answer: str):
+        with self._lock:
+            self._entries[self._next_key] = CachedAnswer(
+                question=question, vector=self._normalize(question_vector), docs=list(docs), answer=answer
+            )
+            self._next_key += 1
+            self._matrix = None
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate_sources(self, sources: Iterable[str]) -> int:
+        """Drops every entry whose answer drew on any of `sources`. Returns the number dropped."""
+        sources = set(sources)
+        with self._lock:
+            doomed = [key for key, entry in self._entries.items() if entry.sources & sources]
+            for key in doomed:
+                self._drop(key)
+            self.stats["invalidated"] += len(doomed)
+            return len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """Returns the process-wide semantic answer cache."""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = SemanticAnswerCache()
+        return _answer_cache
+
+def invalidate_sources(sources: Iterable[str]) -> int:
+    """Drops cached answers that used any of `sources`, if the cache has been created."""
+    if _answer_cache is None:
+        return 0
+    return _answer_cache.invalidate_sources(sources)
@@ -0,0 +1,194 @@
+# src/batch.py
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from langchain.docstore.document import Document
+
+from src import config
+from src.retriever import RetrievalService, get_retrieval_service
+
+def load_questions(input_path: str) -> List[dict]:
+    """
+    Reads questions from a JSONL file.
+
+    Each line is either a JSON object with a "question" (and optional "id")
+    or a bare JSON string. Questions without an ID get one derived from
+    their text, so re-runs line up for resume.
+    """
+    questions = []
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"question": record}
+            record.setdefault("id", hashlib.sha256(record["question"].encode("utf-8")).hexdigest()[:16])
+            questions.append(record)
+    return questions
+
+def load_completed_ids(output_path: str) -> set:
+    """IDs already answered successfully in a previous run's output."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a truncated last line
+                continue
+            if "error" not in record:
+                completed.add(record["id"])
+    return completed
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+class BatchRunner:
+    """
+    Answers a batch of questions with batched embedding and retrieval.
+
+    Questions are processed in waves: each wave embeds all of its questions
+    in one batched call (after the lexical fast path and semantic answer
+    cache have had their chance), runs one batched vector search, and fans
+    generation out over a bounded thread pool. At most two waves are in
+    flight, so retrieval for one overlaps generation for the previous one and
+    memory stays flat on large inputs. Answers are appended to the output
+    JSONL as each one finishes.
+    """
+
+    def __init__(
+        self,
+        service: Optional[RetrievalService] = None,
+        concurrency: Optional[int] = None,
+        wave_size: Optional[int] = None,
+    ):
+        self.service = service or get_retrieval_service()
+        self.concurrency = concurrency or config.BATCH_CONCURRENCY
+        self.wave_size = wave_size or config.BATCH_WAVE_SIZE
+        self._write_lock = threading.Lock()
+        self._latencies: List[float] = []
+        self.stats = {"answered": 0, "failed": 0, "cached": 0, "lexical": 0, "skipped": 0}
+
+    def run(self, input_path: str, output_path: str, resume: bool = True) -> dict:
+        questions = load_questions(input_path)
+        if resume:
+            completed = load_completed_ids(output_path)
+            self.stats["skipped"] = sum(1 for q in questions if q["id"] in completed)
+            questions = [q for q in questions if q["id"] not in completed]
+        else:
+            open(output_path, "w").close()
+
+        print(f"Answering {len(questions)} questions ({self.stats['skipped']} already done)...")
+        start = time.perf_counter()
+        with open(output_path, "a", encoding="utf-8") as out, \
+                ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch-llm") as executor:
+            previous = []
+            for i in range(0, len(questions), self.wave_size):
+                wave = questions[i:i + self.wave_size]
+                # Retrieval for this wave overlaps with generation for the previous one
+                futures = [executor.submit(self._answer, record, vector, docs, cached, out)
+                           for record, vector, docs, cached in self._retrieve_wave(wave)]
+                self._wait(previous, start)
+                previous = futures
+            self._wait(previous, start)
+
+        elapsed = time.perf_counter() - start
+        done = self.stats["answered"] + self.stats["failed"]
+        self.stats.update({
+            "seconds": round(elapsed, 3),
+            "questions_per_sec": round(done / elapsed, 2) if elapsed else 0.0,
+            "generation_p50_seconds": round(_percentile(self._latencies, 50), 3),
+            "generation_p95_seconds": round(_percentile(self._latencies, 95), 3),
+        })
+        return self.stats
+
+    def _retrieve_wave(self, wave: List[dict]):
+        """Yields (record, vector, docs, cached_answer) for each question in the wave."""
+        results = {}
+        pending = []
+        for record in wave:
+            docs = self.service.lexical_lookup(record["question"])
+            if docs is not None:
+                self.stats["lexical"] += 1
+                results[record["id"]] = (record, None, docs, None)
+            else:
+                pending.append(record)
+
+        if pending:
+            texts = [record["question"] for record in pending]
+            vectors = self.service.embed_questions(texts)
+            to_search = []
+            for record, vector in zip(pending, vectors):
+                cached = self.service.cached_answer(vector)
+                if cached is not None:
+                    results[record["id"]] = (record, vector, cached.docs, cached)
+                else:
+                    to_search.append((record, vector))
+            if to_search:
+                retrieved = self.service.retrieve_many_by_vector(
+                    [vector for _, vector in to_search],
+                    questions=[record["question"] for record, _ in to_search],
+                )
+                for (record, vector), docs in zip(to_search, retrieved):
+                    results[record["id"]] = (record, vector, docs, None)
+
+        for record in wave:
+            yield results[record["id"]]
+
+    def _answer(self, record: dict, vector: Optional[List[float]], docs: List[Document], cached, out):
+        result = {"id": record["id"], "question": record["question"]}
+        start = time.perf_counter()
+        try:
+            if cached is not None:
+                answer = cached.answer
+            else:
+                answer = self.service.generate(record["question"], docs)
+                self.service.remember(record["question"], vector, docs, answer)
+            result.update({
+                "answer": answer,
+                "sources": [doc.metadata.get("source") for doc in docs],
+                "chunk_ids": [doc.id for doc in docs],
+                "cached": cached is not None,
+            })
+        except Exception as e:
+            result["error"] = str(e)
+        result["latency_seconds"] = round(time.perf_counter() - start, 3)
+
+        with self._write_lock:
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            if "error" in result:
+                self.stats["failed"] += 1
+            else:
+                self.stats["answered"] += 1
+                self.stats["cached"] += int(cached is not None)
+                if cached is None:
+                    self._latencies.append(result["latency_seconds"])
+
+    def _wait(self, futures, start: float):
+        """Waits for a wave's generations, then reports progress."""
+        if not futures:
+            return
+        for future in futures:
+            future.result()
+        done = self.stats["answered"] + self.stats["failed"]
+        elapsed = time.perf_counter() - start
+        print(f"   ...{done} answered ({self.stats['failed']} failed) in {elapsed:.1f}s "
+              f"({done / elapsed if elapsed else 0:.2f} questions/sec)")
+
+def run_batch(input_path: str, output_path: str, concurrency: Optional[int] = None,
+              wave_size: Optional[int] = None, resume: bool = True) -> dict:
+    """Answers every question in `input_path`, appending results to `output_path`."""
+    return BatchRunner(concurrency=concurrency, wave_size=wave_size).run(input_path, output_path, resume=resume)
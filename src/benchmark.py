@@ -0,0 +1,417 @@
+# src/benchmark.py
+"""
+Offline benchmarks for the ingestion and query hot paths.
+
+Everything runs against the fake models in src/fakes.py inside a scratch
+directory, so results are reproducible and need no credentials. Latency of
+the fakes is configurable to approximate the real services. Results are
+plain JSON so runs can be diffed with `compare_results`.
+"""
+import io
+import os
+import re
+import sys
+import time
+import random
+import shutil
+import platform
+import tempfile
+import subprocess
+from contextlib import contextmanager, redirect_stdout
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src import config
+
+WORDS = """
+agent session event tool runner model memory artifact state callback config plan request response
+stream token cache index vector query chunk source file parser schema context prompt answer
+retry limit batch queue worker service client server handler router registry loader manifest
+""".split()
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CORPUS_PATH = os.path.join(PROJECT_ROOT, "llms-full.txt")
+
+SNAKE_IDENTIFIER_RE = re.compile(r"\b[a-z][a-z0-9]*(?:_[a-z0-9]+)+\b")
+
+def make_synthetic_tree(root: str, files: int = 200, functions_per_file: int = 20, seed: int = 0) -> str:
+    """
+    Writes a deterministic tree of Python, TypeScript and Markdown files.
+
+    Returns:
+        The tree's root directory.
+    """
+    rng = random.Random(seed)
+    for i in range(files):
+        package = os.path.join(root, f"pkg{i % 10}", f"mod{i % 7}")
+        os.makedirs(package, exist_ok=True)
+        kind = i % 4
+        lines = []
+        for j in range(functions_per_file):
+            a, b, c = rng.sample(WORDS, 3)
+            if kind == 3:
+                lines += [f"## {a.title()} {b}", "", f"The {a} {b} keeps a {c} for every {rng.choice(WORDS)}.",
+                          f"Call `{a}_{b}_{j}` to refresh it.", ""]
+            elif kind == 2:
+                lines += [f"export function {a}{b.title()}{j}({c}: string): number {{",
+                          f"  const {b} = {c}.length * {j};", f"  return {b} + {rng.randint(0, 99)};", "}", ""]
+            else:
+                lines += [f"def {a}_{b}_{j}({c}, {rng.choice(WORDS)}=None):",
+                          f'    """Returns the {b} of a {c}."""',
+                          f"    {b} = [{c} for _ in range({rng.randint(1, 9)})]",
+                          f"    return len({b}) + {j}", "", ""]
+        ext = {0: ".py", 1: ".py", 2: ".ts", 3: ".md"}[kind]
+        with open(os.path.join(package, f"file{i}{ext}"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+    return root
+
+def make_corpus_tree(root: str, corpus_path: str) -> str:
+    """Copies a text corpus (e.g. llms-full.txt) into a tree as Markdown, which ingestion supports."""
+    os.makedirs(root, exist_ok=True)
+    name = os.path.splitext(os.path.basename(corpus_path))[0]
+    shutil.copyfile(corpus_path, os.path.join(root, f"{name}.md"))
+    return root
+
+def sample_identifiers(tree: str, count: int, seed: int = 0) -> List[str]:
+    """Deterministically samples snake_case identifiers that occur in the tree."""
+    found = set()
+    for dirpath, _, filenames in os.walk(tree):
+        for filename in filenames:
+            with open(os.path.join(dirpath, filename), "r", encoding="utf-8", errors="ignore") as f:
+                found.update(SNAKE_IDENTIFIER_RE.findall(f.read()))
+    ordered = sorted(found)
+    return random.Random(seed).sample(ordered, min(count, len(ordered)))
+
+def make_questions(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [f"How does the {rng.choice(WORDS)} {rng.choice(WORDS)} handle a {rng.choice(WORDS)}? (#{i})"
+            for i in range(count)]
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean of samples in seconds, reported in milliseconds."""
+    if not samples:
+        return {}
+    values = np.asarray(samples) * 1000
+    summary = {f"p{p}": round(float(np.percentile(values, p)), 3) for p in (50, 95, 99)}
+    summary["mean"] = round(float(values.mean()), 3)
+    return summary
+
+class _FirstTokenClock(io.TextIOBase):
+    """Stand-in stdout that records when the first answer token is printed."""
+
+    def __init__(self):
+        self.answer_started = False
+        self.first_token_at: Optional[float] = None
+
+    def write(self, text: str) -> int:
+        if self.answer_started and self.first_token_at is None and text.strip():
+            self.first_token_at = time.perf_counter()
+        if "--- Answer ---" in text:
+            self.answer_started = True
+        return len(text)
+
+@contextmanager
+def isolated_run(workdir: str, embed_latency: float, llm_first_token: float, llm_token: float,
+                 quota: bool = False):
+    """
+    Points every store at `workdir`, switches to the fake models and resets
+    process-wide singletons; everything is restored afterwards.
+
+    Unless `quota` is set, the embedding scheduler's per-minute limits are
+    lifted so results measure this code rather than the configured quota.
+    """
+    from src import retriever, answer_cache, embedding_cache, chunk_store, query_log
+
+    db_path = os.path.join(workdir, "db")
+    overrides = {
+        # Absolute paths: Chroma caches clients by path string, so "db" would be shared across runs
+        "DB_ROOT": db_path,
+        "DB_POINTER_PATH": os.path.join(db_path, os.path.basename(config.DB_POINTER_PATH)),
+        "CHROMA_DB_PATH": db_path,
+        "MANIFEST_PATH": os.path.join(db_path, os.path.basename(config.MANIFEST_PATH)),
+        "LEXICAL_INDEX_PATH": os.path.join(db_path, os.path.basename(config.LEXICAL_INDEX_PATH)),
+        "SYMBOL_INDEX_PATH": os.path.join(db_path, os.path.basename(config.SYMBOL_INDEX_PATH)),
+        "DEDUP_INDEX_PATH": os.path.join(db_path, os.path.basename(config.DEDUP_INDEX_PATH)),
+        "MMAP_INDEX_PATH": os.path.join(db_path, os.path.basename(config.MMAP_INDEX_PATH)),
+        "BLOB_STORE_PATH": os.path.join(db_path, os.path.basename(config.BLOB_STORE_PATH)),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, config.EMBEDDING_CACHE_PATH),
+        "MODEL_BACKEND": "fake",
+        "FAKE_EMBEDDING_LATENCY_SECONDS": embed_latency,
+        "FAKE_LLM_FIRST_TOKEN_SECONDS": llm_first_token,
+        "FAKE_LLM_TOKEN_SECONDS": llm_token,
+        # Every question is new, and a cached answer would hide generation time
+        "ANSWER_CACHE_ENABLED": False,
+    }
+    if not quota:
+        overrides["EMBEDDING_REQUESTS_PER_MINUTE"] = 1e12
+        overrides["EMBEDDING_TOKENS_PER_MINUTE"] = 1e12
+    saved = {name: getattr(config, name) for name in overrides}
+    cwd = os.getcwd()
+    os.makedirs(workdir, exist_ok=True)
+    # Query logs are written relative to the working directory
+    os.chdir(workdir)
+    for name, value in overrides.items():
+        setattr(config, name, value)
+    retriever._service = None
+    answer_cache._answer_cache = None
+    embedding_cache._shared_cache = None
+    chunk_store._chunk_store = None
+    query_log._query_logger = None
+    try:
+        yield
+    finally:
+        if embedding_cache._shared_cache is not None:
+            embedding_cache._shared_cache.close()
+        if chunk_store._chunk_store is not None:
+            chunk_store._chunk_store.close()
+        if query_log._query_logger is not None:
+            query_log._query_logger.close()
+        retriever._service = None
+        embedding_cache._shared_cache = None
+        chunk_store._chunk_store = None
+        query_log._query_logger = None
+        for name, value in saved.items():
+            setattr(config, name, value)
+        os.chdir(cwd)
+
+def bench_chunking(tree: str, workers: Optional[int], repeats: int) -> dict:
+    from src.data_loader import load_and_chunk_codebase
+
+    total_bytes = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(tree) for f in files)
+    timings, chunks = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            chunks = load_and_chunk_codebase(tree, workers=workers)
+        timings.append(time.perf_counter() - start)
+    files = len({chunk.metadata["source"] for chunk in chunks})
+    seconds = float(np.median(timings))
+    return {
+        "files": files,
+        "bytes": total_bytes,
+        "chunks": len(chunks),
+        "seconds": round(seconds, 4),
+        "files_per_sec": round(files / seconds, 1),
+        "chunks_per_sec": round(len(chunks) / seconds, 1),
+        "mb_per_sec": round(total_bytes / seconds / 1e6, 2),
+    }, chunks
+
+def bench_build_vector_store(chunks) -> dict:
+    from src.vector_store import build_vector_store
+    from src.lexical_index import LexicalIndex
+
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        stored = build_vector_store(chunks)
+    seconds = time.perf_counter() - start
+    # Not part of build_vector_store, but hybrid retrieval below needs it
+    lexical_start = time.perf_counter()
+    index = LexicalIndex(config.LEXICAL_INDEX_PATH)
+    index.add_chunks(stored)
+    index.close()
+    return {
+        "chunks": len(chunks),
+        "stored_chunks": len(stored),
+        "seconds": round(seconds, 4),
+        "chunks_per_sec": round(len(chunks) / seconds, 1),
+        "lexical_index_seconds": round(time.perf_counter() - lexical_start, 4),
+    }
+
+def bench_retrieval(questions: List[str], identifiers: List[str], warmup: int = 5) -> dict:
+    from src.retriever import get_retrieval_service
+
+    service = get_retrieval_service()
+    with redirect_stdout(io.StringIO()):
+        for question in make_questions(warmup, seed=-1):
+            service.retrieve(question)
+
+    def timed(items):
+        samples = []
+        for item in items:
+            start = time.perf_counter()
+            service.retrieve(item)
+            samples.append(time.perf_counter() - start)
+        return latency_summary(samples)
+
+    return {"question": timed(questions), "identifier": timed(f"`{name}`" for name in identifiers)}
+
+def bench_time_to_first_token(questions: List[str]) -> dict:
+    from src.retriever import generate_answer_with_logging
+
+    first_token, total = [], []
+    for question in questions:
+        clock = _FirstTokenClock()
+        start = time.perf_counter()
+        with redirect_stdout(clock):
+            generate_answer_with_logging(question)
+        total.append(time.perf_counter() - start)
+        if clock.first_token_at is not None:
+            first_token.append(clock.first_token_at - start)
+    return {"first_token_ms": latency_summary(first_token), "total_ms": latency_summary(total)}
+
+def _parse_importtime(stderr: str) -> List[tuple]:
+    """(name, nesting level, self seconds, cumulative seconds) per line of `python -X importtime` output."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|", 2)
+        # One space after the separator, then two per nesting level
+        name = name[1:]
+        level = (len(name) - len(name.lstrip(" "))) // 2
+        entries.append((name.strip(), level, int(own) / 1e6, int(cumulative) / 1e6))
+    return entries
+
+def bench_startup(budgets: Optional[Dict[str, float]] = None, repeats: int = 3) -> dict:
+    """
+    Import time of each entry point in a fresh interpreter, against its budget.
+
+    Every module in `budgets` (config.STARTUP_IMPORT_BUDGETS by default) is
+    imported `repeats` times under `python -X importtime`; the median import
+    time and process wall time are reported, with the module's slowest direct
+    imports. Modules that cannot be imported here report the error instead.
+    """
+    budgets = config.STARTUP_IMPORT_BUDGETS if budgets is None else budgets
+    results = {}
+    for module, budget in budgets.items():
+        import_times, wall_times, entries = [], [], []
+        error = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                  capture_output=True, text=True, cwd=PROJECT_ROOT)
+            wall_times.append(time.perf_counter() - start)
+            if proc.returncode != 0:
+                error = (proc.stderr.strip().splitlines() or ["import failed"])[-1]
+                break
+            entries = _parse_importtime(proc.stderr)
+            # The module and the packages above it, each counted where it was first imported
+            import_times.append(sum(cumulative for name, level, _, cumulative in entries
+                                    if level == 0 and (module == name or module.startswith(name + "."))))
+        if error:
+            results[module] = {"error": error, "budget_seconds": budget}
+            continue
+        # Direct imports are the ones a lazy import can move; they print just before the module's own line
+        position = next(i for i, entry in enumerate(entries) if entry[0] == module)
+        own_level = entries[position][1]
+        direct = []
+        for name, level, _, cumulative in reversed(entries[:position]):
+            if level <= own_level:
+                break
+            if level == own_level + 1:
+                direct.append((name, cumulative))
+        import_seconds = float(np.median(import_times))
+        results[module] = {
+            "import_seconds": round(import_seconds, 4),
+            "wall_seconds": round(float(np.median(wall_times)), 4),
+            "budget_seconds": budget,
+            "within_budget": import_seconds <= budget,
+            "slowest_imports": [[name, round(seconds, 4)]
+                                for name, seconds in sorted(direct, key=lambda item: -item[1])[:5]],
+        }
+    return results
+
+def check_startup_budgets(startup: dict) -> List[str]:
+    """Lists entry points whose import time exceeds their budget (see bench_startup)."""
+    return [
+        f"{module}: imports in {result['import_seconds']}s, budget {result['budget_seconds']}s "
+        f"(slowest: {', '.join(f'{name} {seconds}s' for name, seconds in result['slowest_imports'][:3])})"
+        for module, result in startup.items()
+        if "error" not in result and not result["within_budget"]
+    ]
+
+def run_dataset(tree: str, workdir: str, options: dict) -> dict:
+    """Runs every benchmark against one tree and returns its results."""
+    with isolated_run(workdir, options["embed_latency"], options["llm_first_token"], options["llm_token"],
+                      quota=options["quota"]):
+        chunking, chunks = bench_chunking(tree, options["workers"], options["repeats"])
+        build = bench_build_vector_store(chunks)
+        questions = make_questions(options["queries"], seed=options["seed"])
+        identifiers = sample_identifiers(tree, options["queries"], seed=options["seed"])
+        retrieval = bench_retrieval(questions, identifiers)
+        ttft = bench_time_to_first_token(make_questions(options["answers"], seed=options["seed"] + 1))
+    return {"load_and_chunk_codebase": chunking, "build_vector_store": build,
+            "retrieval_ms": retrieval, "generate_answer_with_logging": ttft}
+
+def environment_info() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True, cwd=PROJECT_ROOT).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": sys.version.split()[0], "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def run_benchmarks(
+    files: int = 200,
+    functions_per_file: int = 20,
+    corpus_path: Optional[str] = DEFAULT_CORPUS_PATH,
+    queries: int = 100,
+    answers: int = 20,
+    repeats: int = 3,
+    workers: Optional[int] = None,
+    embed_latency: float = 0.0,
+    llm_first_token: float = 0.05,
+    llm_token: float = 0.0,
+    quota: bool = False,
+    seed: int = 0,
+    startup: bool = True,
+) -> dict:
+    """
+    Benchmarks a synthetic tree and, if `corpus_path` exists, the bundled corpus,
+    plus (with `startup`) the import time of each entry point.
+
+    Returns:
+        {"environment": ..., "options": ..., "datasets": {name: results}, "startup": {module: results}}
+    """
+    options = {"files": files, "functions_per_file": functions_per_file, "queries": queries,
+               "answers": answers, "repeats": repeats, "workers": workers, "embed_latency": embed_latency,
+               "llm_first_token": llm_first_token, "llm_token": llm_token, "quota": quota, "seed": seed}
+    results = {"environment": environment_info(), "options": options, "datasets": {}}
+    scratch = tempfile.mkdtemp(prefix="rag-bench-")
+    try:
+        tree = make_synthetic_tree(os.path.join(scratch, "synthetic"), files, functions_per_file, seed)
+        results["datasets"]["synthetic"] = run_dataset(tree, os.path.join(scratch, "run-synthetic"), options)
+        if corpus_path and os.path.exists(corpus_path):
+            tree = make_corpus_tree(os.path.join(scratch, "corpus"), os.path.abspath(corpus_path))
+            name = os.path.splitext(os.path.basename(corpus_path))[0]
+            results["datasets"][name] = run_dataset(tree, os.path.join(scratch, "run-corpus"), options)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    if startup:
+        results["startup"] = bench_startup()
+    return results
+
+def _flatten(results: dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+def compare_results(baseline: dict, current: dict, tolerance: float = 0.10) -> List[str]:
+    """
+    Lists metrics that got worse by more than `tolerance` (a fraction).
+
+    Throughput metrics (`*_per_sec`) should not drop and latency metrics
+    (`*_ms`, `seconds`) should not rise; size metrics are ignored.
+    """
+    old, new = _flatten(baseline.get("datasets", {})), _flatten(current.get("datasets", {}))
+    regressions = []
+    for path in sorted(old.keys() & new.keys()):
+        before, after = old[path], new[path]
+        if not before:
+            continue
+        if path.endswith("_per_sec"):
+            change = (before - after) / before
+        elif "_ms." in path or path.endswith("seconds"):
+            change = (after - before) / before
+        else:
+            continue
+        if change > tolerance:
+            regressions.append(f"{path}: {before} -> {after} ({change:+.0%} worse)")
+    return regressions
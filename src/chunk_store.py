@@ -0,0 +1,175 @@
+# src/chunk_store.py
+import os
+import mmap
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+
+from src import config, telemetry
+
+# Memory maps kept open at once; least recently used blobs are dropped beyond this and
+# unmapped once no reader still holds them
+MAX_OPEN_BLOBS = 128
+
+class BlobStore:
+    """
+    Content-addressed copies of ingested files, one per distinct content hash.
+
+    Blobs are laid out as `<path>/ab/abcdef...` and written once through a
+    temporary file and a rename, so a blob is never modified after it appears
+    and is always safe to memory-map. Identical files share one blob.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or config.BLOB_STORE_PATH
+
+    def path_for(self, content_hash: str) -> str:
+        return os.path.join(self.path, content_hash[:2], content_hash)
+
+    def has(self, content_hash: str) -> bool:
+        return os.path.exists(self.path_for(content_hash))
+
+    def put(self, content_hash: str, data) -> bool:
+        """Stores `data` (bytes or an mmap) under its hash. Returns False if it was already stored."""
+        blob_path = self.path_for(content_hash)
+        if os.path.exists(blob_path):
+            return False
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        tmp_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, blob_path)
+        return True
+
+    def hashes(self) -> List[str]:
+        if not os.path.isdir(self.path):
+            return []
+        return [name for prefix in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, prefix))
+                for name in os.listdir(os.path.join(self.path, prefix)) if not name.endswith(".tmp")]
+
+    def prune(self, keep: set) -> int:
+        """Deletes blobs whose hash is not in `keep`. Returns the number removed."""
+        removed = 0
+        for content_hash in self.hashes():
+            if content_hash not in keep:
+                os.remove(self.path_for(content_hash))
+                removed += 1
+        return removed
+
+class ChunkTextStore:
+    """
+    Rehydrates chunk text from (content hash, byte offset, byte length).
+
+    Text is sliced from the memory-mapped blob for the chunk's content hash.
+    Without a blob, the source file is read instead, but only while its
+    content still hashes to the chunk's content hash; the hash is computed
+    once per (mtime, size) of the file. Source files are read with `pread`
+    rather than mapped, since a file truncated under a live mapping would
+    crash the process.
+    """
+
+    def __init__(self, blobs: Optional[BlobStore] = None):
+        self.blobs = blobs or BlobStore()
+        self._lock = threading.Lock()
+        self._maps: "OrderedDict[str, mmap.mmap]" = OrderedDict()
+        # source path -> (mtime_ns, size, content hash)
+        self._source_hashes: Dict[str, Tuple[int, int, str]] = {}
+        self.stats = {"blob": 0, "source": 0, "missing": 0}
+
+    def read(self, metadata: dict) -> Optional[str]:
+        """Returns the chunk's text, or None when neither its blob nor an unchanged source exists."""
+        content_hash = metadata.get("content_hash")
+        offset, length = metadata.get("byte_offset"), metadata.get("byte_length")
+        if not content_hash or offset is None or length is None:
+            return None
+        mapping = self._blob(content_hash)
+        if mapping is not None:
+            self.stats["blob"] += 1
+            return mapping[offset:offset + length].decode("utf-8")
+        source = metadata.get("source")
+        if source and self._source_hash(source) == content_hash:
+            fd = os.open(source, os.O_RDONLY)
+            try:
+                data = os.pread(fd, length, offset)
+            finally:
+                os.close(fd)
+            self.stats["source"] += 1
+            return data.decode("utf-8")
+        self.stats["missing"] += 1
+        return None
+
+    def rehydrate(self, docs: List[Document]) -> List[Document]:
+        """Fills in the text of chunks stored as offsets; chunks that carry their own text are left alone."""
+        for doc in docs:
+            if doc.page_content or "byte_offset" not in doc.metadata:
+                continue
+            text = self.read(doc.metadata)
+            if text is None:
+                telemetry.count("chunk_text_missing")
+                print(f"   !!! No text for chunk {doc.id} of {doc.metadata.get('source')}; re-ingest to restore it.")
+                continue
+            doc.page_content = text
+        return docs
+
+    def _blob(self, content_hash: str) -> Optional[mmap.mmap]:
+        with self._lock:
+            mapping = self._maps.get(content_hash)
+            if mapping is not None:
+                self._maps.move_to_end(content_hash)
+                return mapping
+            try:
+                with open(self.blobs.path_for(content_hash), "rb") as f:
+                    mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # Missing blob, or an empty file (which can't be mapped and has no chunks)
+                return None
+            self._maps[content_hash] = mapping
+            if len(self._maps) > MAX_OPEN_BLOBS:
+                # Not closed here: another thread may be slicing it outside the lock.
+                # Dropping the reference unmaps it when the last reader lets go.
+                self._maps.popitem(last=False)
+            return mapping
+
+    def _source_hash(self, source: str) -> Optional[str]:
+        try:
+            st = os.stat(source)
+        except OSError:
+            return None
+        cached = self._source_hashes.get(source)
+        if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self._source_hashes[source] = (st.st_mtime_ns, st.st_size, digest.hexdigest())
+        return digest.hexdigest()
+
+    def close(self):
+        """Drops every mapping; each is unmapped once in-flight reads of it finish."""
+        with self._lock:
+            self._maps.clear()
+
+def stores_text_inline() -> bool:
+    """True when chunk text is copied into Chroma and the lexical index, not only referenced by offset."""
+    return config.CHUNK_TEXT_STORAGE == "inline"
+
+_chunk_store: Optional[ChunkTextStore] = None
+_chunk_store_lock = threading.Lock()
+
+def get_chunk_store() -> ChunkTextStore:
+    """Returns the process-wide chunk text store, so blob mappings are shared across queries."""
+    global _chunk_store
+    with _chunk_store_lock:
+        if _chunk_store is None:
+            _chunk_store = ChunkTextStore()
+        return _chunk_store
+
+def rehydrate(docs: List[Document]) -> List[Document]:
+    """Fills in the text of any chunks stored as offsets (see ChunkTextStore)."""
+    if any(not doc.page_content and "byte_offset" in doc.metadata for doc in docs):
+        get_chunk_store().rehydrate(docs)
+    return docs
@@ -0,0 +1,126 @@
+# src/client.py
+"""
+Client for the resident query backend: serve.py listening on a Unix socket.
+
+A warm backend has already paid for interpreter start-up, the model and
+vector store imports and client initialization, so a CLI question sent to
+it costs only retrieval and generation. This module imports nothing beyond
+the standard library and config, to keep the client side of that cheap.
+"""
+import os
+import json
+import socket
+import http.client
+from typing import Iterator, Optional
+
+from src import config
+
+# Seconds allowed to connect; answers themselves stream for as long as they take
+CONNECT_TIMEOUT_SECONDS = 1.0
+
+class BackendUnavailable(Exception):
+    """Raised when no backend is listening on the socket."""
+
+class BackendError(RuntimeError):
+    """
+    Raised when the backend rejects a question or fails answering it.
+
+    `status` is the HTTP status of a rejection (503 when overloaded), or
+    None for an error reported mid-answer.
+    """
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str):
+        super().__init__("localhost", timeout=CONNECT_TIMEOUT_SECONDS)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise BackendUnavailable(f"no backend listening on {self.socket_path}: {e}") from e
+        sock.settimeout(None)
+        self.sock = sock
+
+def backend_available(socket_path: Optional[str] = None) -> bool:
+    """True if a backend answers health checks on `socket_path` (config.SERVER_SOCKET_PATH by default)."""
+    socket_path = socket_path or config.SERVER_SOCKET_PATH
+    if not os.path.exists(socket_path):
+        return False
+    connection = _UnixHTTPConnection(socket_path)
+    try:
+        connection.request("GET", "/health")
+        return connection.getresponse().status == 200
+    except (BackendUnavailable, OSError, http.client.HTTPException):
+        return False
+    finally:
+        connection.close()
+
+def stream_events(question: str, socket_path: Optional[str] = None) -> Iterator[dict]:
+    """
+    Sends a question to the backend and returns an iterator over its events
+    (see QueryServer). The connection is made before this returns, so a
+    missing backend raises BackendUnavailable here rather than mid-answer.
+
+    Raises:
+        BackendUnavailable: Nothing is listening on the socket.
+        BackendError: The backend rejected the request (e.g. 503 when overloaded).
+    """
+    connection = _UnixHTTPConnection(socket_path or config.SERVER_SOCKET_PATH)
+    try:
+        connection.request("POST", "/query", body=json.dumps({"question": question}),
+                           headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+    except BackendUnavailable:
+        connection.close()
+        raise
+    except (OSError, http.client.HTTPException) as e:
+        connection.close()
+        raise BackendUnavailable(f"backend did not respond: {e}") from e
+    if response.status != 200:
+        try:
+            error = json.loads(response.read() or b"{}").get("error")
+        finally:
+            connection.close()
+        raise BackendError(f"backend returned {response.status}: {error}", response.status)
+
+    def events():
+        try:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            connection.close()
+    return events()
+
+def ask_backend(question: str, socket_path: Optional[str] = None) -> str:
+    """
+    Streams the backend's answer to stdout the way generate_answer_with_logging
+    does in-process, and returns it. The backend writes the query log record.
+
+    Raises:
+        BackendUnavailable: Nothing is listening on the socket.
+        BackendError: The backend rejected the question or failed answering it.
+    """
+    events = stream_events(question, socket_path)
+    print(f"\n> Processing question: '{question}'...")
+    print("\n--- Answer ---")
+    parts = []
+    for event in events:
+        if event["event"] == "token":
+            parts.append(event["text"])
+            print(event["text"], end="", flush=True)
+        elif event["event"] == "error":
+            print()
+            raise BackendError(event["error"])
+        elif event["event"] == "done" and event.get("cached"):
+            print(f"\n(cached answer for a similar question: '{event.get('similar_question')}')", end="")
+    print("\n\n--- End of Answer ---")
+    return "".join(parts)
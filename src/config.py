@@ -1,5 +1,7 @@
 # src/config.py
 import os
+import json
+from functools import lru_cache
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -12,28 +14,225 @@ LOCATION = os.getenv("GOOGLE_CLOUD_LOCATION")
 # --- Data Ingestion Configuration ---
 # Path to the codebase to be ingested
 CODEBASE_ROOT = "/home/srikanth/Work/Angular/angular-tailwind/" 
-# Path to the persistent ChromaDB database
-CHROMA_DB_PATH = "db"
+# Directory holding the persistent stores (ChromaDB, manifest, indexes, blobs)
+DB_ROOT = "db"
+# Blue/green builds (reingest.py --full) write a complete new store to DB_ROOT/versions/<id>,
+# validate it, then atomically repoint this file at it (see src/db_versions.py). Without the
+# pointer, the stores live directly in DB_ROOT.
+DB_POINTER_PATH = os.path.join(DB_ROOT, "CURRENT")
+# Retired versions kept for rollback, and how long a retired version stays on disk for
+# readers that still have it open before it may be deleted
+DB_VERSIONS_KEPT = 1
+DB_VERSION_GRACE_SECONDS = 10 * 60
+
+def live_db_path() -> str:
+    """The store directory queries should read: the version DB_POINTER_PATH names, else DB_ROOT."""
+    try:
+        with open(DB_POINTER_PATH, 'r', encoding='utf-8') as f:
+            version = json.load(f)["version"]
+    except (OSError, ValueError, KeyError):
+        return DB_ROOT
+    return os.path.join(DB_ROOT, "versions", version) if version else DB_ROOT
+
+# Path to the persistent ChromaDB database (the live version)
+CHROMA_DB_PATH = live_db_path()
 # Name of the collection within ChromaDB
 CHROMA_COLLECTION_NAME = "codebase_rag"
+# Per-file ingestion manifest (path, mtime, size, content hash, chunk IDs),
+# stored next to the ChromaDB files so incremental runs only touch changed files
+MANIFEST_PATH = os.path.join(CHROMA_DB_PATH, "ingest_manifest.json")
+# Persistent BM25 inverted index built alongside the vector store
+LEXICAL_INDEX_PATH = os.path.join(CHROMA_DB_PATH, "lexical_index.sqlite3")
+# Symbol table (name -> file, line span, kind, parent) built from the structural chunker
+SYMBOL_INDEX_PATH = os.path.join(CHROMA_DB_PATH, "symbol_index.sqlite3")
+# Duplicate chunks (vendored copies, generated files, licence headers) are embedded and stored
+# once per cluster (see src/dedup.py): "near" finds identical text and MinHash/LSH near-duplicates,
+# "exact" identical text only, "off" stores every chunk
+DEDUP_MODE = "near"
+DEDUP_INDEX_PATH = os.path.join(CHROMA_DB_PATH, "dedup_index.sqlite3")
+# Word shingles of this many tokens; MinHash signatures of DEDUP_NUM_PERM values, split into
+# DEDUP_BANDS LSH bands. Candidates sharing a band are merged when their estimated Jaccard
+# similarity is at least DEDUP_THRESHOLD; chunks under DEDUP_MIN_SHINGLES shingles only as exact copies
+DEDUP_SHINGLE_SIZE = 5
+DEDUP_NUM_PERM = 128
+DEDUP_BANDS = 16
+DEDUP_THRESHOLD = 0.85
+DEDUP_MIN_SHINGLES = 20
+# Memory-mapped snapshot of the collection for in-process vector search
+MMAP_INDEX_PATH = os.path.join(CHROMA_DB_PATH, "mmap_index")
+# How chunk text is stored. "offsets": chunks record (content hash, byte offset, length, line range)
+# and their text is read back at query time from the blob store below; "inline": the text is also
+# copied into Chroma and the lexical index (as before)
+CHUNK_TEXT_STORAGE = "offsets"
+# Content-addressed copy of every ingested file, memory-mapped at query time to rehydrate chunk text
+BLOB_STORE_PATH = os.path.join(CHROMA_DB_PATH, "blobs")
+# Files at least this large are chunked window by window through mmap instead of being read whole
+MMAP_CHUNKING_MIN_BYTES = 512 * 1024
+MMAP_CHUNKING_WINDOW_BYTES = 256 * 1024
+# Watch mode (watch.py, serve.py --watch): "auto" uses inotify through the optional watchdog
+# package when installed, else polls; "inotify" or "polling" force one
+WATCH_BACKEND = "auto"
+# A burst of changes is synced once no change has arrived for WATCH_DEBOUNCE_SECONDS,
+# or WATCH_MAX_DELAY_SECONDS after its first change at the latest
+WATCH_DEBOUNCE_SECONDS = 1.0
+WATCH_MAX_DELAY_SECONDS = 10.0
+WATCH_POLL_INTERVAL_SECONDS = 2.0
+# Number of processes used to load and chunk files (None = one per CPU core, 1 = serial)
+CHUNKING_WORKERS = None
+# Capacity of each bounded queue between ingestion pipeline stages (chunk -> embed -> upsert)
+PIPELINE_QUEUE_SIZE = 8
+# Minimum seconds between manifest checkpoints while ingestion is running
+MANIFEST_SAVE_INTERVAL_SECONDS = 2
 
 # --- Embedding Model Configuration ---
 # See a list of available models here: https://cloud.google.com/vertex-ai/docs/generative-ai/model-garden/model-versions
 EMBEDDING_MODEL_NAME = "text-embedding-004"
 
-EMBEDDING_BATCH_SIZE = 5
+# Embedding scheduler: quota, concurrency and per-request limits.
+# Batches are sized against the per-request limits, requests/tokens per minute
+# are enforced with token buckets, and concurrency backs off on 429/quota errors.
+EMBEDDING_REQUESTS_PER_MINUTE = 60
+EMBEDDING_TOKENS_PER_MINUTE = 200_000
+EMBEDDING_MAX_IN_FLIGHT = 4
+EMBEDDING_MAX_BATCH_TEXTS = 250
+EMBEDDING_MAX_BATCH_TOKENS = 20_000
+EMBEDDING_MAX_RETRIES = 8
 
-EMBEDDING_REQUEST_DELAY_SECONDS = 3
+# Persistent embedding cache keyed by (model, task, normalized text hash).
+# Kept outside CHROMA_DB_PATH so it survives full rebuilds.
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = os.path.join(".cache", "embeddings.sqlite3")
+# LRU bound; a 768-dim float32 vector is ~3 KB, so 100k entries is ~300 MB
+EMBEDDING_CACHE_MAX_ENTRIES = 100_000
 
 GENERATIVE_MODEL_NAME = "gemini-2.5-flash"
 
-# --- Authentication ---
-from google.oauth2 import service_account
+# --- Model Backend ---
+# "vertex" uses Vertex AI; "fake" uses the offline models in src/fakes.py (no
+# credentials or network) for load tests. Query with the backend you ingested
+# with: fake vectors are not comparable to Vertex AI vectors.
+MODEL_BACKEND = os.getenv("RAG_MODEL_BACKEND", "vertex")
+FAKE_EMBEDDING_LATENCY_SECONDS = 0.02
+FAKE_LLM_FIRST_TOKEN_SECONDS = 0.3
+FAKE_LLM_TOKEN_SECONDS = 0.02
+FAKE_LLM_TOKENS = 50
+
+# --- Retrieval Configuration ---
+# Vector search backend: "chroma", or "mmap" for the in-process NumPy index
+# (re-exported at the end of every ingestion run when selected)
+VECTOR_BACKEND = "chroma"
+# Optional compressed first-pass tier of the mmap index: "int8" scalar quantization, or None.
+# Queries scan the int8 codes, then re-score a shortlist of MMAP_RESCORE_FACTOR * k rows in float32.
+# Compare settings with `python benchmark_index.py --quantization`.
+MMAP_QUANTIZATION = None
+# Leading dimensions kept in the int8 tier (None = all); text-embedding-004 vectors rank well truncated
+MMAP_QUANTIZED_DIMS = None
+MMAP_RESCORE_FACTOR = 10
+# "hybrid" fuses BM25 and vector results with reciprocal rank fusion; "vector" is dense-only
+RETRIEVAL_MODE = "hybrid"
+# Candidates fetched from each retriever before fusion
+HYBRID_FETCH_K = 10
+RRF_K = 60
+# Questions that name an exact identifier (`build_vector_store`) are answered
+# from the lexical index alone, without an embedding call
+LEXICAL_FAST_PATH = True
+# Definition questions ("Where is X defined?") are answered from the symbol
+# index alone, with no embedding or LLM call
+SYMBOL_FAST_PATH = True
+
+# Token budget for the retrieved context in the prompt (estimated at ~4 characters per token).
+# Neighbouring chunks are merged and de-overlapped before packing, see src/context.py
+CONTEXT_TOKEN_BUDGET = 3000
+
+# --- Agent Tools ---
+# query_codebase in "snippets" mode returns up to SNIPPET_K ranked chunks, packed into
+# SNIPPET_TOKEN_BUDGET, for the agent model to read directly (no nested LLM call)
+SNIPPET_K = 8
+SNIPPET_TOKEN_BUDGET = 2000
+# Per-session cache of query_codebase results, kept in the ADK session state;
+# questions with the same words (in any order or case) share an entry
+TOOL_CACHE_MAX_ENTRIES = 32
+TOOL_CACHE_TTL_SECONDS = 600
+
+# execute_python_file / run_command run in pre-forked worker interpreters (src/exec_pool.py),
+# forked from a server that has already imported EXEC_PRELOAD_MODULES
+EXEC_POOL_WORKERS = 2
+EXEC_PRELOAD_MODULES = ["numpy"]
+EXEC_TIMEOUT_SECONDS = 30
+# Address space limit per execute_python_file job (0 = unlimited); run_command jobs are not limited,
+# since JVMs, Node and similar runtimes reserve far more virtual memory than they use
+EXEC_MEMORY_LIMIT_MB = 2048
+# Output kept per stream; beyond this only the first and last halves are returned
+EXEC_OUTPUT_MAX_CHARS = 20_000
+
+# --- Semantic Answer Cache ---
+# Reuse an answer when a new question's embedding is at least this cosine-similar
+# to a cached question and the chunks behind the answer are unchanged
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_SIMILARITY_THRESHOLD = 0.95
+ANSWER_CACHE_TTL_SECONDS = 3600
+ANSWER_CACHE_MAX_ENTRIES = 1000
 
+# --- Batch Question Answering ---
+# Concurrent LLM generations, and questions embedded and searched per batched call
+BATCH_CONCURRENCY = 8
+BATCH_WAVE_SIZE = 64
+
+# --- Query Server ---
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8765
+# Concurrent LLM generations per model backend; further requests wait for a slot
+SERVER_MAX_IN_FLIGHT_LLM = 8
+# Requests allowed to wait for a slot; beyond this, new requests get 503 immediately
+SERVER_MAX_QUEUED = 32
+# Longest a request waits for a generation slot before it is shed with 503
+SERVER_QUEUE_TIMEOUT_SECONDS = 10
+# Resident backend: `python serve.py --port 0 --socket` listens here, and main.py / ask.py send
+# questions through it when it is running, skipping interpreter start-up, imports and client set-up
+SERVER_SOCKET_PATH = os.path.join(".cache", "server.sock")
+
+# --- Start-up ---
+# Import time budget (seconds, fresh interpreter) per entry point; `python run_benchmarks.py --startup`
+# fails when one is exceeded. Heavy clients (Vertex AI, Chroma, text splitters) are imported on first use
+STARTUP_IMPORT_BUDGETS = {
+    "main": 0.5,
+    "ask": 0.5,
+    "serve": 0.5,
+    "software_engineer.tools.rag_tool": 0.5,
+    "src.retriever": 1.5,
+    "src.ingest": 2.0,
+}
+
+# --- Telemetry ---
+# Per-stage spans and counters (src/telemetry.py); when disabled they cost one flag check
+TELEMETRY_ENABLED = os.getenv("RAG_TELEMETRY", "0") == "1"
+# Each span is appended here as a JSON line while telemetry is enabled (None = in memory only)
+TELEMETRY_JSONL_PATH = os.path.join("logs", "telemetry.jsonl")
+# Prometheus textfile written at exit (None = not written); the query server also serves GET /metrics
+TELEMETRY_PROMETHEUS_PATH = os.path.join("logs", "metrics.prom")
+
+# --- Query Log ---
+# Every answered question is appended here as a JSON line by a background writer (src/query_log.py)
+QUERY_LOG_PATH = os.path.join("logs", "queries.jsonl")
+# The log is rotated (and the old file gzipped) once it reaches this size or age
+QUERY_LOG_MAX_BYTES = 50 * 1024 * 1024
+QUERY_LOG_MAX_AGE_SECONDS = 24 * 60 * 60
+# Number of rotated, gzipped logs kept
+QUERY_LOG_BACKUPS = 10
+# Records waiting to be written; beyond this, new records are dropped rather than blocking a request
+QUERY_LOG_QUEUE_SIZE = 10_000
+
+# --- Authentication ---
 SERVICE_ACCOUNT_KEY_PATH = "service-account-key.json"
 
+@lru_cache(maxsize=None)
 def get_credentials():
-    """Loads the service account credentials from the key file."""
+    """
+    Loads the service account credentials from the key file, once, on first
+    use: importing config must stay cheap for commands that never call a model.
+    """
+    from google.oauth2 import service_account
+
     if os.path.exists(SERVICE_ACCOUNT_KEY_PATH):
         return service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_KEY_PATH)
     else:
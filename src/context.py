@@ -0,0 +1,201 @@
+# src/context.py
+import os
+import json
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from langchain.docstore.document import Document
+
+from src import config, telemetry
+from src.data_loader import CHUNK_OVERLAP
+from src.embedding_scheduler import estimate_tokens
+
+# Overlaps shorter than this are not stripped when chunks lack a start_index;
+# a short suffix/prefix match is as likely to be coincidence as real overlap
+MIN_OVERLAP_CHARS = 8
+# A span is truncated to fit the remaining budget only if at least this many tokens remain
+MIN_TRUNCATED_TOKENS = 64
+# Other locations of a deduplicated chunk listed in its header
+MAX_LISTED_COPIES = 3
+
+def _display_path(source: str) -> str:
+    root = config.CODEBASE_ROOT
+    if root and source.startswith(root):
+        return os.path.relpath(source, root)
+    return source
+
+@dataclass
+class ContextSpan:
+    """A contiguous run of chunks from one source, with overlap removed."""
+    source: str
+    first_index: int
+    last_index: int
+    text: str
+    # Best (lowest) retrieval rank among the merged chunks
+    rank: int
+    start_index: Optional[int] = None
+    chunk_ids: List[str] = field(default_factory=list)
+    # 1-based line range in the source, when the chunks recorded one
+    start_line: Optional[int] = None
+    end_line: Optional[int] = None
+    # [source, start_line, end_line] of the first chunk's duplicates (see DedupIndex)
+    duplicates: List[list] = field(default_factory=list)
+
+    def header(self) -> str:
+        source = _display_path(self.source)
+        if self.start_line is not None and self.end_line is not None:
+            header = f"### {source} (lines {self.start_line}-{self.end_line})"
+        elif self.first_index < 0:
+            header = f"### {source}"
+        elif self.first_index == self.last_index:
+            header = f"### {source} (chunk {self.first_index})"
+        else:
+            header = f"### {source} (chunks {self.first_index}-{self.last_index})"
+        return header + self._copies()
+
+    def _copies(self) -> str:
+        if not self.duplicates:
+            return ""
+        listed = [f"{_display_path(source or '')}:{start}-{end}" if start is not None else _display_path(source or "")
+                  for source, start, end in self.duplicates[:MAX_LISTED_COPIES]]
+        more = len(self.duplicates) - len(listed)
+        return f" (also in {', '.join(listed)}{f' and {more} more' if more else ''})"
+
+def _overlap_length(previous: Document, following: Document) -> int:
+    """Characters at the start of `following` that repeat the end of `previous`."""
+    prev_start = previous.metadata.get("start_index")
+    next_start = following.metadata.get("start_index")
+    if prev_start is not None and next_start is not None:
+        return max(0, min(len(following.page_content), prev_start + len(previous.page_content) - next_start))
+    prev_text, next_text = previous.page_content, following.page_content
+    # The splitter may overlap by up to CHUNK_OVERLAP characters (plus trimmed whitespace)
+    for length in range(min(len(prev_text), len(next_text), CHUNK_OVERLAP * 2), MIN_OVERLAP_CHARS - 1, -1):
+        if prev_text.endswith(next_text[:length]):
+            return length
+    return 0
+
+def dedupe_chunks(docs: List[Document]) -> List[Document]:
+    """Drops repeated chunks (same ID, or identical text from another file), keeping the first."""
+    seen_ids, seen_text, unique = set(), set(), []
+    for doc in docs:
+        digest = hashlib.sha256(doc.page_content.strip().encode("utf-8")).digest()
+        if (doc.id and doc.id in seen_ids) or digest in seen_text:
+            continue
+        seen_ids.add(doc.id)
+        seen_text.add(digest)
+        unique.append(doc)
+    return unique
+
+def merge_chunks(docs: List[Document]) -> List[ContextSpan]:
+    """
+    Merges chunks with consecutive `chunk_index` values from the same source.
+
+    The overlap the splitter repeats between neighbours is stripped. Spans are
+    returned in retrieval order, ranked by their best chunk.
+    """
+    by_source: Dict[str, List[tuple]] = {}
+    for rank, doc in enumerate(docs):
+        by_source.setdefault(doc.metadata.get("source", ""), []).append((rank, doc))
+
+    spans: List[ContextSpan] = []
+    for source, ranked in by_source.items():
+        # Chunks without an index can't be placed relative to their neighbours
+        ranked.sort(key=lambda item: (item[1].metadata.get("chunk_index") is None,
+                                      item[1].metadata.get("chunk_index", 0), item[0]))
+        current: Optional[ContextSpan] = None
+        previous: Optional[Document] = None
+        for rank, doc in ranked:
+            index = doc.metadata.get("chunk_index")
+            if current is not None and index is not None and index == current.last_index:
+                # The same chunk retrieved twice
+                continue
+            if current is not None and index is not None and index == current.last_index + 1:
+                overlap = _overlap_length(previous, doc)
+                current.text += ("" if overlap else "\n") + doc.page_content[overlap:]
+                current.last_index = index
+                current.rank = min(current.rank, rank)
+                current.chunk_ids.append(doc.id)
+                current.end_line = doc.metadata.get("end_line", current.end_line)
+            else:
+                current = ContextSpan(
+                    source=source, first_index=index if index is not None else -1,
+                    last_index=index if index is not None else -1, text=doc.page_content, rank=rank,
+                    start_index=doc.metadata.get("start_index"), chunk_ids=[doc.id],
+                    start_line=doc.metadata.get("start_line"), end_line=doc.metadata.get("end_line"),
+                    duplicates=json.loads(doc.metadata.get("duplicates") or "[]"),
+                )
+                spans.append(current)
+            previous = doc
+    spans.sort(key=lambda span: span.rank)
+    return spans
+
+def _truncate_to_tokens(text: str, tokens: int) -> str:
+    """Cuts text to roughly `tokens` tokens, at a line boundary where possible."""
+    cut = text[:tokens * 4]
+    newline = cut.rfind("\n")
+    if newline > len(cut) // 2:
+        cut = cut[:newline]
+    return cut + "\n..."
+
+def pack_spans(spans: List[ContextSpan], budget_tokens: int) -> List[tuple]:
+    """
+    Greedily packs spans, best-ranked first, into a token budget.
+
+    A span that no longer fits is truncated if enough budget is left,
+    otherwise skipped in favour of smaller, lower-ranked spans.
+
+    Returns:
+        (span, text) pairs in packing order.
+    """
+    packed, remaining = [], budget_tokens
+    for span in spans:
+        header_tokens = estimate_tokens(span.header()) + 1
+        text_tokens = estimate_tokens(span.text)
+        if header_tokens + text_tokens <= remaining:
+            packed.append((span, span.text))
+            remaining -= header_tokens + text_tokens
+        elif remaining - header_tokens >= MIN_TRUNCATED_TOKENS:
+            packed.append((span, _truncate_to_tokens(span.text, remaining - header_tokens)))
+            remaining = 0
+        if remaining <= 0:
+            break
+    return packed
+
+def assemble_context(docs: List[Document], budget_tokens: Optional[int] = None) -> str:
+    """
+    Turns retrieved chunks into the prompt's context block.
+
+    Duplicates are dropped, neighbouring chunks from the same file are merged
+    into one span without their repeated overlap, and the spans are packed
+    into `budget_tokens` (CONTEXT_TOKEN_BUDGET by default), each under a
+    compact source header.
+    """
+    budget_tokens = budget_tokens or config.CONTEXT_TOKEN_BUDGET
+    packed = pack_spans(merge_chunks(dedupe_chunks(docs)), budget_tokens)
+    context = "\n\n".join(f"{span.header()}\n{text}" for span, text in packed)
+    if telemetry.enabled():
+        telemetry.count("context_tokens", estimate_tokens(context))
+        telemetry.count("context_tokens_saved",
+                        max(0, sum(estimate_tokens(doc.page_content) for doc in docs) - estimate_tokens(context)))
+    return context
+
+def format_snippets(docs: List[Document], budget_tokens: Optional[int] = None) -> str:
+    """
+    Ranked, compact snippets for an agent to reason over directly, instead of
+    a generated answer.
+
+    Chunks are de-duplicated, merged and packed like the prompt context
+    (into SNIPPET_TOKEN_BUDGET by default). Each span is numbered by rank,
+    and its header gives the source, line range, and how its best chunk was
+    matched, with that chunk's score (see retriever.mark_match).
+    """
+    budget_tokens = budget_tokens or config.SNIPPET_TOKEN_BUDGET
+    unique = dedupe_chunks(docs)
+    packed = pack_spans(merge_chunks(unique), budget_tokens)
+    snippets = []
+    for position, (span, text) in enumerate(packed, start=1):
+        best = unique[span.rank].metadata
+        match = f" [{best['match']}, score {best['score']}]" if "match" in best else ""
+        snippets.append(f"[{position}] {span.header().removeprefix('### ')}{match}\n{text}")
+    return "\n\n".join(snippets)
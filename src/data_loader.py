@@ -1,64 +1,457 @@
 # src/data_loader.py
 import os
-from typing import List
-from langchain.text_splitter import RecursiveCharacterTextSplitter, Language
-from langchain_community.document_loaders import TextLoader
+import re
+import ast
+import mmap
+import time
+import hashlib
+import multiprocessing
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
 from langchain.docstore.document import Document
 
+from src import config, telemetry
+from src.chunk_store import BlobStore, stores_text_inline
+from src.symbols import attach_symbols, definition_start, parse_python, python_symbols, regex_symbols
+
+# Splitter settings; neighbouring chunks repeat up to CHUNK_OVERLAP characters
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+BLANK_LINES_RE = re.compile(r"(?:[ \t]*\r?\n)*")
+# Bumped whenever chunk boundaries change, so ingestion re-chunks files it would otherwise skip
+CHUNKER_VERSION = 2
+# Settings chunking workers read, handed to each worker explicitly since callers may have
+# repointed them (e.g. at a new store version) after config was imported
+WORKER_SETTINGS = ("BLOB_STORE_PATH", "CHUNK_TEXT_STORAGE", "MMAP_CHUNKING_MIN_BYTES", "MMAP_CHUNKING_WINDOW_BYTES")
+
 # Define the file extensions we want to process and their corresponding languages
+# (langchain's Language values; the text splitters are imported only once a file is split)
 SUPPORTED_EXTENSIONS = {
-    ".py": Language.PYTHON,
-    ".md": Language.MARKDOWN,
-    ".js": Language.JS,
-    ".ts": Language.TS,
-    ".java": Language.JAVA,
-    ".go": Language.GO,
-    # ".yaml": Language.YAML,
-    # ".json": Language.JSON,
+    ".py": "python",
+    ".md": "markdown",
+    ".js": "js",
+    ".ts": "ts",
+    ".java": "java",
+    ".go": "go",
+    # ".yaml": "yaml",
+    # ".json": "json",
 }
 
-def load_and_chunk_codebase(directory_path: str) -> List[Document]:
+def is_excluded_dir(name: str) -> bool:
+    """Returns True for directories the ingestion walk should never descend into."""
+    return name == 'node_modules' or name.startswith('.')
+
+def iter_source_files(directory_path: str) -> Iterator[str]:
+    """
+    Walks a directory and yields the paths of all supported source files.
+
+    Excludes node_modules and hidden directories.
+    """
+    for root, dirs, files in os.walk(directory_path):
+        # Exclude node_modules and hidden directories
+        dirs[:] = [d for d in dirs if not is_excluded_dir(d)]
+
+        for file in files:
+            ext = os.path.splitext(file)[1]
+            if ext in SUPPORTED_EXTENSIONS:
+                yield os.path.join(root, file)
+
+def is_source_file(file_path: str, directory_path: str) -> bool:
+    """
+    Returns True if `iter_source_files(directory_path)` would yield this path
+    (were it to exist): a supported extension, inside the directory, and not
+    below an excluded directory.
+    """
+    relative = os.path.relpath(file_path, directory_path)
+    if relative.startswith(os.pardir):
+        return False
+    parts = relative.split(os.sep)
+    return os.path.splitext(parts[-1])[1] in SUPPORTED_EXTENSIONS and not any(is_excluded_dir(d) for d in parts[:-1])
+
+def compute_file_hash(file_path: str) -> str:
+    """Returns the SHA-256 hex digest of a file's raw bytes."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def make_chunk_id(source: str, chunk_index: int, text: str) -> str:
+    """
+    Builds a stable, deterministic ID for a chunk.
+
+    The same file content always produces the same IDs, so re-running ingestion
+    upserts in place instead of adding duplicates.
+    """
+    key = f"{source}\x00{chunk_index}\x00{text}".encode('utf-8')
+    return hashlib.sha256(key).hexdigest()[:32]
+
+@lru_cache(maxsize=None)
+def get_splitter(language: str):
+    """
+    Returns the RecursiveCharacterTextSplitter for a language, building it once per process.
+
+    Splitters are stateless once constructed, so every file of the same
+    language (and every worker in the process pool) reuses the same instance.
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter, Language
+
+    return RecursiveCharacterTextSplitter.from_language(
+        language=Language(language), chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+        # Character offsets let context assembly strip the overlap between neighbours exactly
+        add_start_index=True,
+    )
+
+def load_file(file_path: str) -> Document:
+    """Reads a supported file into a single Document, recording the hash of the bytes read."""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    content_hash = hashlib.sha256(data).hexdigest()
+    store_blob(content_hash, data)
+    return Document(page_content=data.decode('utf-8'), metadata={'source': file_path, 'content_hash': content_hash})
+
+def store_blob(content_hash: str, data):
+    """Keeps a content-addressed copy of a file, so chunks can be stored as offsets into it."""
+    if not stores_text_inline():
+        BlobStore().put(content_hash, data)
+
+def add_locations(chunks: List[Document], text: str, char_base: int = 0, byte_base: int = 0, line_base: int = 1):
+    """
+    Records where each chunk sits in its file: byte offset and length, and
+    1-based first and last line. `text` is what the chunks were split from,
+    and the bases locate it within the file.
+    """
+    ascii_only = text.isascii()
+    position = byte_position = 0
+    line = line_base
+    for chunk in chunks:
+        start = chunk.metadata.get('start_index', -1)
+        if start < 0:
+            continue
+        if start < position:
+            # Out of order; count from the top of the text again
+            position, byte_position, line = 0, 0, line_base
+        if not ascii_only:
+            byte_position += len(text[position:start].encode('utf-8'))
+        line += text.count('\n', position, start)
+        position = start
+        content = chunk.page_content
+        chunk.metadata.update(
+            start_index=char_base + start,
+            byte_offset=byte_base + (start if ascii_only else byte_position),
+            byte_length=len(content) if ascii_only else len(content.encode('utf-8')),
+            start_line=line,
+            end_line=line + content.count('\n'),
+        )
+
+def _assign_ids(chunks: List[Document], file_path: str, first_index: int):
+    for index, chunk in enumerate(chunks, start=first_index):
+        chunk.metadata['source'] = file_path # Add source metadata
+        chunk.metadata['chunk_index'] = index
+        chunk.id = make_chunk_id(file_path, index, chunk.page_content)
+
+def split_document(document: Document, first_index: int = 0) -> List[Document]:
+    """Splits a loaded file (or a window of one) into chunks with stable IDs, by characters."""
+    file_path = document.metadata['source']
+    ext = os.path.splitext(file_path)[1]
+    text_splitter = get_splitter(SUPPORTED_EXTENSIONS[ext])
+
+    chunks = text_splitter.split_documents([document])
+    _assign_ids(chunks, file_path, first_index)
+    return chunks
+
+def _python_segments(nodes: list, first_line: int, last_line: int, lines: List[str]) -> List[Tuple[int, int, Optional[ast.AST]]]:
+    """
+    Cuts lines first_line..last_line (1-based, inclusive) into one segment per
+    function or class in `nodes`, plus the code between them. Comment lines
+    directly above a definition go with the definition.
+    """
+    segments = []
+    line = first_line
+    for node in nodes:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            continue
+        start = definition_start(node)
+        while start - 1 >= line and lines[start - 2].lstrip().startswith('#'):
+            start -= 1
+        if start > line:
+            segments.append((line, start - 1, None))
+        segments.append((start, node.end_lineno, node))
+        line = node.end_lineno + 1
+    if line <= last_line:
+        segments.append((line, last_line, None))
+    return segments
+
+def split_python(document: Document, tree: ast.Module, first_index: int = 0) -> List[Document]:
+    """
+    Splits Python source along function and class boundaries.
+
+    Consecutive definitions (and the code between them) are packed into
+    chunks of up to CHUNK_SIZE characters. A class too large for one chunk is
+    split at its methods; any other definition that is too large falls back
+    to the character splitter. Chunks don't overlap.
+    """
+    text = document.page_content
+    file_path = document.metadata['source']
+    lines = [line + '\n' for line in text.split('\n')]
+    lines[-1] = lines[-1][:-1]
+    line_starts = [0]
+    for line in lines:
+        line_starts.append(line_starts[-1] + len(line))
+    spans: List[Tuple[int, int]] = []
+
+    def add_span(start_line: int, end_line: int, oversized: bool = False):
+        start, end = line_starts[start_line - 1], line_starts[end_line]
+        if not oversized:
+            spans.append((start, end))
+            return
+        part = Document(page_content=text[start:end])
+        for piece in get_splitter("python").split_documents([part]):
+            spans.append((start + piece.metadata['start_index'], start + piece.metadata['start_index'] + len(piece.page_content)))
+
+    def pack(segments):
+        current = None
+        for start_line, end_line, node in segments:
+            if line_starts[end_line] - line_starts[start_line - 1] > CHUNK_SIZE:
+                if current:
+                    add_span(*current)
+                    current = None
+                if isinstance(node, ast.ClassDef):
+                    pack(_python_segments(node.body, start_line, end_line, lines))
+                else:
+                    add_span(start_line, end_line, oversized=True)
+            elif current and line_starts[end_line] - line_starts[current[0] - 1] <= CHUNK_SIZE:
+                current[1] = end_line
+            else:
+                if current:
+                    add_span(*current)
+                current = [start_line, end_line]
+        if current:
+            add_span(*current)
+
+    pack(_python_segments(tree.body, 1, len(lines), lines))
+
+    chunks = []
+    for start, end in spans:
+        content = text[start:end]
+        # Drop blank lines around the chunk but keep the first line's indentation
+        blank = BLANK_LINES_RE.match(content).end()
+        content = content[blank:].rstrip()
+        if not content:
+            continue
+        chunks.append(Document(page_content=content, metadata=dict(document.metadata, start_index=start + blank)))
+    _assign_ids(chunks, file_path, first_index)
+    return chunks
+
+def chunk_text(document: Document, first_index: int = 0, char_base: int = 0, byte_base: int = 0,
+               line_base: int = 1) -> List[Document]:
+    """
+    Chunks a loaded file (or one window of it), recording each chunk's location
+    and the symbols defined in it.
+
+    Python is split structurally when it parses; other languages, and Python
+    that doesn't parse, use the character splitter, with regex-based symbols.
+    """
+    text = document.page_content
+    ext = os.path.splitext(document.metadata['source'])[1]
+    tree = parse_python(text) if ext == '.py' else None
+    if tree is not None:
+        chunks = split_python(document, tree, first_index)
+    else:
+        chunks = split_document(document, first_index)
+    add_locations(chunks, text, char_base, byte_base, line_base)
+    symbols = python_symbols(tree, line_base) if tree is not None else regex_symbols(text, ext, line_base)
+    attach_symbols(chunks, symbols)
+    return chunks
+
+def iter_windows(data, window_bytes: int) -> Iterator[Tuple[int, bytes]]:
+    """Yields (byte offset, bytes) windows of `data`, each ending on a line break where possible."""
+    position, size = 0, len(data)
+    while position < size:
+        end = min(size, position + window_bytes)
+        if end < size:
+            newline = data.rfind(b'\n', position, end)
+            if newline > position:
+                end = newline + 1
+            else:
+                # A single line longer than the window; don't cut inside a UTF-8 sequence
+                while end < size and (data[end] & 0xC0) == 0x80:
+                    end += 1
+        yield position, data[position:end]
+        position = end
+
+def chunk_mapped_file(file_path: str) -> List[Document]:
+    """
+    Chunks a large file through mmap, one window at a time.
+
+    Only the current window is decoded, so the file is never held in memory
+    as a whole string. Windows end on line breaks and are split
+    independently, so chunks never straddle two windows.
+    """
+    chunks: List[Document] = []
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        content_hash = hashlib.sha256(data).hexdigest()
+        store_blob(content_hash, data)
+        char_base, line_base = 0, 1
+        for byte_base, window in iter_windows(data, config.MMAP_CHUNKING_WINDOW_BYTES):
+            text = window.decode('utf-8')
+            document = Document(page_content=text, metadata={'source': file_path, 'content_hash': content_hash})
+            chunks.extend(chunk_text(document, len(chunks), char_base, byte_base, line_base))
+            char_base += len(text)
+            line_base += text.count('\n')
+    return chunks
+
+def chunk_file(file_path: str) -> List[Document]:
+    """
+    Loads a single supported file and splits it into chunks with stable IDs.
+
+    Each chunk records the file's content hash, its byte and line range, and
+    the symbols it defines. Files of MMAP_CHUNKING_MIN_BYTES or more are
+    chunked through mmap.
+
+    Args:
+        file_path: Path to the file to chunk.
+
+    Returns:
+        The file's chunks as LangChain Documents.
+    """
+    if os.path.getsize(file_path) >= config.MMAP_CHUNKING_MIN_BYTES:
+        return chunk_mapped_file(file_path)
+    return chunk_text(load_file(file_path))
+
+def _chunk_file_task(file_path: str) -> Tuple[str, List[Document], Optional[str], Tuple[float, float]]:
+    """
+    Process-pool entry point: chunks one file and reports errors instead of raising.
+
+    Load and split times are returned with the result, since telemetry recorded
+    inside a worker process would never reach the parent.
+    """
+    start = time.perf_counter()
+    try:
+        if os.path.getsize(file_path) >= config.MMAP_CHUNKING_MIN_BYTES:
+            # Loading and splitting are interleaved window by window
+            chunks = chunk_mapped_file(file_path)
+            return file_path, chunks, None, (0.0, time.perf_counter() - start)
+        document = load_file(file_path)
+        loaded = time.perf_counter()
+        chunks = chunk_text(document)
+        return file_path, chunks, None, (loaded - start, time.perf_counter() - loaded)
+    except Exception as e:
+        return file_path, [], str(e), (time.perf_counter() - start, 0.0)
+
+def _init_chunking_worker(settings: dict):
+    """Process-pool initializer: applies the parent's chunking settings (see WORKER_SETTINGS)."""
+    for name, value in settings.items():
+        setattr(config, name, value)
+
+def _record_chunking(result) -> Tuple[str, List[Document], Optional[str]]:
+    file_path, chunks, error, (load_seconds, split_seconds) = result
+    if telemetry.enabled():
+        telemetry.observe("load", load_seconds)
+        telemetry.observe("chunk", split_seconds)
+        telemetry.count("files_chunked")
+        telemetry.count("chunks", len(chunks))
+        if error:
+            telemetry.count("file_errors")
+    return file_path, chunks, error
+
+def resolve_workers(workers: Optional[int] = None) -> int:
+    """Resolves a worker count, falling back to config.CHUNKING_WORKERS and then the CPU count."""
+    if workers is None:
+        workers = config.CHUNKING_WORKERS
+    return workers or os.cpu_count() or 1
+
+def chunk_files(
+    file_paths: Iterable[str],
+    workers: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+) -> Iterator[Tuple[str, List[Document], Optional[str]]]:
+    """
+    Chunks many files, spreading the work across a process pool.
+
+    `file_paths` is consumed lazily and at most `max_in_flight` files are
+    queued in the pool at once, so a slow consumer applies back-pressure all
+    the way to the directory walk. Results are yielded in the same order as
+    `file_paths`, whatever order the workers finish in.
+
+    Args:
+        file_paths: Files to chunk.
+        workers: Number of worker processes. 1 runs serially in this process.
+        max_in_flight: Files submitted but not yet consumed. Defaults to 4 per worker.
+
+    Yields:
+        (file_path, chunks, error) tuples; `error` is None on success.
+    """
+    workers = resolve_workers(workers)
+
+    if workers <= 1:
+        for file_path in file_paths:
+            yield _record_chunking(_chunk_file_task(file_path))
+        return
+
+    max_in_flight = max_in_flight or workers * 4
+    pending = deque()
+    # Spawned rather than forked: callers chunk from pipeline threads, and forking a
+    # threaded process can deadlock the child on a lock held by another thread
+    settings = {name: getattr(config, name) for name in WORKER_SETTINGS}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_chunking_worker, initargs=(settings,)) as executor:
+        for file_path in file_paths:
+            pending.append(executor.submit(_chunk_file_task, file_path))
+            if len(pending) >= max_in_flight:
+                yield _record_chunking(pending.popleft().result())
+        while pending:
+            yield _record_chunking(pending.popleft().result())
+
+def report_throughput(label: str, files: int, chunks: int, elapsed: float) -> dict:
+    """Prints and returns files/sec and chunks/sec for a completed stage."""
+    elapsed = max(elapsed, 1e-9)
+    stats = {
+        "files": files,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "files_per_sec": round(files / elapsed, 1),
+        "chunks_per_sec": round(chunks / elapsed, 1),
+    }
+    print(
+        f"{label}: {files} files -> {chunks} chunks in {stats['seconds']}s "
+        f"({stats['files_per_sec']} files/sec, {stats['chunks_per_sec']} chunks/sec)"
+    )
+    return stats
+
+def load_and_chunk_codebase(directory_path: str, workers: Optional[int] = None) -> List[Document]:
     """
     Scans a directory, processes supported files, and chunks their content.
 
     Args:
         directory_path: The path to the codebase directory.
+        workers: Number of chunking processes. Defaults to config.CHUNKING_WORKERS;
+            pass 1 for the serial path.
 
     Returns:
         A list of all text chunks (as LangChain Documents) from the codebase.
     """
     all_chunks = []
-    
-    print(f"Starting ingestion of codebase at: {directory_path}")
+    files = 0
 
-    for root, dirs, files in os.walk(directory_path):
-        # Exclude node_modules and hidden directories
-        dirs[:] = [d for d in dirs if d != 'node_modules' and not d.startswith('.')]
-        
-        for file in files:
-            ext = os.path.splitext(file)[1]
-            if ext in SUPPORTED_EXTENSIONS:
-                file_path = os.path.join(root, file)
-                try:
-                    print(f"-> Processing file: {file_path}")
-                    loader = TextLoader(file_path, encoding="utf-8")
-                    documents = loader.load()
-
-                    language = SUPPORTED_EXTENSIONS[ext]
-                    text_splitter = RecursiveCharacterTextSplitter.from_language(
-                        language=language, chunk_size=1000, chunk_overlap=100
-                    )
-
-                    chunks = text_splitter.split_documents(documents)
-                    
-                    for chunk in chunks:
-                        chunk.metadata['source'] = file_path # Add source metadata
+    print(f"Starting ingestion of codebase at: {directory_path}")
+    start = time.perf_counter()
 
-                    all_chunks.extend(chunks)
-                    print(f"   ...found {len(chunks)} chunks.")
+    # The walk stays lazy: files are chunked while it is still finding more
+    file_paths = telemetry.span_iter("walk", iter_source_files(directory_path))
 
-                except Exception as e:
-                    print(f"   !!! Error processing file {file_path}: {e}")
+    for file_path, chunks, error in chunk_files(file_paths, workers=workers):
+        files += 1
+        print(f"-> Processing file: {file_path}")
+        if error:
+            print(f"   !!! Error processing file {file_path}: {error}")
+            continue
+        all_chunks.extend(chunks)
+        print(f"   ...found {len(chunks)} chunks.")
 
     print(f"\nTotal chunks generated across all files: {len(all_chunks)}")
-    return all_chunks
\ No newline at end of file
+    report_throughput(f"Chunking ({resolve_workers(workers)} workers)", files, len(all_chunks),
+                      time.perf_counter() - start)
+    return all_chunks
@@ -0,0 +1,279 @@
+# src/db_versions.py
+import os
+import json
+import time
+import datetime
+import random
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from src import config
+
+VERSIONS_DIR = "versions"
+# Stored vectors re-queried during validation; each must come back as its own nearest neighbour
+VALIDATION_SAMPLES = 20
+
+class ValidationError(Exception):
+    """A freshly built version failed validation and was not activated."""
+
+def versions_root() -> str:
+    return os.path.join(config.DB_ROOT, VERSIONS_DIR)
+
+def version_path(version: str) -> str:
+    """Directory of a version; "" is the unversioned store directly in DB_ROOT."""
+    return os.path.join(versions_root(), version) if version else config.DB_ROOT
+
+def store_paths(db_path: str) -> Dict[str, str]:
+    """The config paths of every store, for a store directory at `db_path`."""
+    return {
+        "CHROMA_DB_PATH": db_path,
+        "MANIFEST_PATH": os.path.join(db_path, os.path.basename(config.MANIFEST_PATH)),
+        "LEXICAL_INDEX_PATH": os.path.join(db_path, os.path.basename(config.LEXICAL_INDEX_PATH)),
+        "SYMBOL_INDEX_PATH": os.path.join(db_path, os.path.basename(config.SYMBOL_INDEX_PATH)),
+        "DEDUP_INDEX_PATH": os.path.join(db_path, os.path.basename(config.DEDUP_INDEX_PATH)),
+        "MMAP_INDEX_PATH": os.path.join(db_path, os.path.basename(config.MMAP_INDEX_PATH)),
+        "BLOB_STORE_PATH": os.path.join(db_path, os.path.basename(config.BLOB_STORE_PATH)),
+    }
+
+def _point_config_at(db_path: str):
+    from src import chunk_store
+
+    for name, value in store_paths(db_path).items():
+        setattr(config, name, value)
+    # Blob mappings belong to the previous store; already-open mappings stay valid for their holders
+    chunk_store._chunk_store = None
+
+@contextmanager
+def using_store(db_path: str):
+    """Points every store at `db_path` for the duration of the block (e.g. to build a shadow version)."""
+    saved = {name: getattr(config, name) for name in store_paths(db_path)}
+    _point_config_at(db_path)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(config, name, value)
+        from src import chunk_store
+        chunk_store._chunk_store = None
+
+def read_pointer() -> Dict[str, Any]:
+    """The pointer file: {"version", "activated_at", "retired": [{"version", "retired_at"}, ...]}."""
+    try:
+        with open(config.DB_POINTER_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"version": "", "activated_at": None, "retired": []}
+
+def _write_pointer(pointer: Dict[str, Any]):
+    """Atomically replaces the pointer file, so readers see either the old version or the new one."""
+    os.makedirs(os.path.dirname(config.DB_POINTER_PATH) or ".", exist_ok=True)
+    tmp_path = f"{config.DB_POINTER_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(pointer, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, config.DB_POINTER_PATH)
+
+def activate(version: str):
+    """Makes `version` the live store, for this process and (through the pointer) every other reader."""
+    pointer = read_pointer()
+    if pointer["version"] != version:
+        retired = [entry for entry in pointer["retired"] if entry["version"] != version]
+        retired.insert(0, {"version": pointer["version"], "retired_at": time.time()})
+        pointer = {"version": version, "activated_at": time.time(), "retired": retired}
+        _write_pointer(pointer)
+    _point_config_at(version_path(version))
+    print(f"Live store is now {version_path(version)}")
+
+_seen_pointer = None
+_refresh_lock = threading.Lock()
+
+def refresh() -> bool:
+    """
+    Follows the pointer if another process switched versions since the last call.
+
+    Costs one stat() when nothing changed. Returns True if this call moved
+    config to a different store; holders of clients bound to a store should
+    compare paths (config.CHROMA_DB_PATH) instead, as another thread's call
+    may have done the switch.
+    """
+    global _seen_pointer
+    try:
+        st = os.stat(config.DB_POINTER_PATH)
+    except OSError:
+        return False
+    stamp = (st.st_mtime_ns, st.st_ino)
+    with _refresh_lock:
+        if stamp == _seen_pointer:
+            return False
+        _seen_pointer = stamp
+        db_path = config.live_db_path()
+        if db_path == config.CHROMA_DB_PATH:
+            return False
+        _point_config_at(db_path)
+    print(f"Switched to store version at {db_path}")
+    return True
+
+def validate(db_path: str, samples: int = VALIDATION_SAMPLES) -> Dict[str, Any]:
+    """
+    Checks a built store before it goes live.
+
+    The collection must hold exactly the chunks the manifest records (less
+    the duplicates the dedup index stores no vector for), the
+    lexical index must cover them, the mmap snapshot (if used) must match,
+    and sampled stored vectors must each be found again as their own nearest
+    neighbour, which catches a corrupt or half-written HNSW index.
+
+    Raises:
+        ValidationError: on the first failed check.
+    """
+    import chromadb
+
+    from src.dedup import DedupIndex
+    from src.manifest import IngestManifest
+    from src.lexical_index import LexicalIndex
+
+    paths = store_paths(db_path)
+    manifest = IngestManifest.load(paths["MANIFEST_PATH"])
+    if not manifest.exists():
+        raise ValidationError(f"no ingestion manifest in {db_path}")
+    expected = sum(len(entry["chunk_ids"]) for entry in manifest.files.values())
+    if os.path.exists(paths["DEDUP_INDEX_PATH"]):
+        dedup_index = DedupIndex(paths["DEDUP_INDEX_PATH"])
+        expected -= dedup_index.duplicate_count()
+        dedup_index.close()
+    collection = chromadb.PersistentClient(path=db_path).get_collection(config.CHROMA_COLLECTION_NAME)
+    count = collection.count()
+    if count != expected:
+        raise ValidationError(f"collection holds {count} chunks, the manifest records {expected}")
+    if manifest.files and count == 0:
+        raise ValidationError("no chunks were stored")
+
+    lexical = LexicalIndex(paths["LEXICAL_INDEX_PATH"])
+    indexed = len(lexical)
+    lexical.close()
+    if indexed != count:
+        raise ValidationError(f"lexical index covers {indexed} chunks, the collection holds {count}")
+
+    if config.VECTOR_BACKEND == "mmap":
+        from src.mmap_index import HEADER_FILE, snapshot_path
+        with open(os.path.join(snapshot_path(paths["MMAP_INDEX_PATH"]), HEADER_FILE), 'r', encoding='utf-8') as f:
+            exported = json.load(f)["count"]
+        if exported != count:
+            raise ValidationError(f"mmap snapshot holds {exported} vectors, the collection holds {count}")
+
+    ids = [chunk_id for entry in manifest.files.values() for chunk_id in entry["chunk_ids"]]
+    sample = random.Random(0).sample(ids, min(samples, len(ids)))
+    # Sampled duplicates have no vector of their own
+    stored = collection.get(ids=sample, include=["embeddings"]) if sample else {"ids": []}
+    if len(stored["ids"]):
+        result = collection.query(query_embeddings=stored["embeddings"], n_results=1, include=["distances"])
+        # Identical chunks share a vector, so compare distances rather than IDs
+        misses = sum(1 for distances in result["distances"] if not distances or distances[0] > 1e-4)
+        if misses:
+            raise ValidationError(f"{misses} of {len(stored['ids'])} sampled vectors were not found again")
+    return {"chunks": count, "files": len(manifest.files), "sampled_queries": len(stored["ids"])}
+
+def _new_version() -> str:
+    """Names and creates the directory of a new version; the name ends in the builder's PID."""
+    while True:
+        version = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f") + f"-{os.getpid()}"
+        try:
+            os.makedirs(version_path(version))
+            return version
+        except FileExistsError:
+            continue
+
+def _building(version: str) -> bool:
+    """True if the process that named this version (see _new_version) is still running."""
+    try:
+        os.kill(int(version.rsplit("-", 1)[1]), 0)
+    except (IndexError, ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def build_version(directory_path: str) -> str:
+    """
+    Builds a complete new store from scratch next to the live one, validates
+    it and activates it. Queries keep reading the live store throughout; if
+    the build or validation fails, the new version is deleted and the live
+    store is left as it was.
+
+    Returns:
+        The name of the activated version.
+    """
+    from src.ingest import sync_codebase
+
+    version = _new_version()
+    db_path = version_path(version)
+    print(f"Building new store version {version} at {db_path}")
+    try:
+        with using_store(db_path):
+            sync_codebase(directory_path)
+        report = validate(db_path)
+    except BaseException:
+        print(f"   !!! Build of {version} failed; the live store is unchanged.")
+        shutil.rmtree(db_path, ignore_errors=True)
+        raise
+    print(f"Validated {version}: {report}")
+    activate(version)
+    collect_garbage()
+    return version
+
+def rollback() -> str:
+    """Re-activates the most recently retired version that is still on disk."""
+    for entry in read_pointer()["retired"]:
+        if os.path.isdir(version_path(entry["version"])):
+            activate(entry["version"])
+            return entry["version"]
+    raise ValidationError("no retired version is available to roll back to")
+
+def _remove_version(version: str):
+    if version:
+        shutil.rmtree(version_path(version), ignore_errors=True)
+        return
+    # The unversioned store shares DB_ROOT with the pointer and the versions directory
+    for name in os.listdir(config.DB_ROOT):
+        path = os.path.join(config.DB_ROOT, name)
+        if name in (VERSIONS_DIR, os.path.basename(config.DB_POINTER_PATH)):
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+def collect_garbage(now: Optional[float] = None) -> List[str]:
+    """
+    Deletes retired versions beyond the newest DB_VERSIONS_KEPT, once they
+    have been retired for DB_VERSION_GRACE_SECONDS, plus directories left
+    behind by builds that never went live. Returns the versions removed.
+    """
+    now = now or time.time()
+    pointer = read_pointer()
+    removed, kept = [], []
+    for position, entry in enumerate(pointer["retired"]):
+        expired = now - entry["retired_at"] >= config.DB_VERSION_GRACE_SECONDS
+        if position >= config.DB_VERSIONS_KEPT and expired:
+            _remove_version(entry["version"])
+            removed.append(entry["version"])
+        else:
+            kept.append(entry)
+    if removed:
+        pointer["retired"] = kept
+        _write_pointer(pointer)
+
+    known = {pointer["version"]} | {entry["version"] for entry in kept}
+    if os.path.isdir(versions_root()):
+        for name in os.listdir(versions_root()):
+            path = version_path(name)
+            if name in known or _building(name) or now - os.stat(path).st_mtime < config.DB_VERSION_GRACE_SECONDS:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(name)
+    for version in removed:
+        print(f"Removed old store version {version or '(unversioned)'}")
+    return removed
@@ -0,0 +1,337 @@
+# src/dedup.py
+import os
+import re
+import json
+import zlib
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from src import config, telemetry
+from src.chunk_store import stores_text_inline
+from src.embedding_scheduler import estimate_tokens
+
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+# Universal hashing (a * x + b) mod a Mersenne prime stands in for the random permutations
+_PRIME = np.uint64((1 << 61) - 1)
+_MASK = np.uint64((1 << 32) - 1)
+
+def exact_key(text: str) -> str:
+    """Key shared by chunks whose text is identical up to surrounding whitespace."""
+    return hashlib.blake2b(text.strip().encode("utf-8"), digest_size=16).hexdigest()
+
+class MinHasher:
+    """
+    MinHash signatures over token shingles, and their LSH band keys.
+
+    The fraction of positions in which two signatures agree estimates the
+    Jaccard similarity of the texts' shingle sets. Signatures are cut into
+    `bands` bands; texts that agree on a whole band share that band's bucket
+    and become candidates, so similar texts are found without comparing
+    every pair. The defaults make texts above ~0.7 similarity likely
+    candidates, and those at 0.85 almost certain ones.
+    """
+
+    def __init__(self, num_perm: Optional[int] = None, bands: Optional[int] = None,
+                 shingle_size: Optional[int] = None, seed: int = 1):
+        self.num_perm = num_perm or config.DEDUP_NUM_PERM
+        self.bands = bands or config.DEDUP_BANDS
+        if self.num_perm % self.bands:
+            raise ValueError(f"DEDUP_NUM_PERM ({self.num_perm}) must be a multiple of DEDUP_BANDS ({self.bands})")
+        self.rows = self.num_perm // self.bands
+        self.shingle_size = shingle_size or config.DEDUP_SHINGLE_SIZE
+        # Fixed seed: signatures are persisted and must compare across runs
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 32, size=self.num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=self.num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> np.ndarray:
+        """32-bit hashes of the distinct runs of `shingle_size` consecutive tokens."""
+        tokens = TOKEN_RE.findall(text)
+        if len(tokens) < self.shingle_size:
+            return np.zeros(0, dtype=np.uint64)
+        token_hashes = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokens),
+                                   dtype=np.uint64, count=len(tokens))
+        count = len(tokens) - self.shingle_size + 1
+        hashes = np.zeros(count, dtype=np.uint64)
+        for offset in range(self.shingle_size):
+            hashes = (hashes * np.uint64(1000003) + token_hashes[offset:offset + count]) & _MASK
+        return np.unique(hashes)
+
+    def signature(self, shingles: np.ndarray) -> np.ndarray:
+        # a, x < 2**32, so a * x + b stays below 2**64
+        permuted = (np.outer(shingles, self._a) + self._b) % _PRIME & _MASK
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    @staticmethod
+    def similarity(first: np.ndarray, second: np.ndarray) -> float:
+        return float(np.mean(first == second))
+
+def duplicate_location(metadata: dict) -> list:
+    """How a duplicate is listed on its cluster's stored chunk: [source, start_line, end_line]."""
+    return [metadata.get("source"), metadata.get("start_line"), metadata.get("end_line")]
+
+class DedupIndex:
+    """
+    Persistent record of duplicate chunk clusters, stored in SQLite.
+
+    Every ingested chunk has a row naming its cluster's canonical chunk: the
+    first copy seen, and the only one embedded and stored in the vector
+    store and the lexical index. The others are duplicates; they stay in the
+    manifest under their own file, and are listed in the `duplicates`
+    metadata of the canonical chunk (a JSON list of [source, start_line,
+    end_line]). Canonical chunks are found again by the hash of their text
+    and, for near-duplicates, through MinHash LSH buckets.
+
+    When a canonical chunk is removed while its cluster still has
+    duplicates, the oldest duplicate is promoted in its place (see
+    remove_chunks); it reuses the stored vector only if its text is
+    identical. A chunk is never a near-duplicate of a chunk from its own
+    file, or of one this sync is replacing (see replacing), since that is
+    usually its own previous version.
+    """
+
+    def __init__(self, path: Optional[str] = None, hasher: Optional[MinHasher] = None):
+        self.path = path or config.DEDUP_INDEX_PATH
+        self.hasher = hasher or MinHasher()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY, canonical_id TEXT NOT NULL, match TEXT, exact_key TEXT NOT NULL,
+                signature BLOB, tokens INTEGER NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_dedup_canonical ON chunks(canonical_id);
+            CREATE INDEX IF NOT EXISTS idx_dedup_exact ON chunks(exact_key);
+            CREATE TABLE IF NOT EXISTS buckets (
+                band INTEGER NOT NULL, bucket BLOB NOT NULL, chunk_id TEXT NOT NULL,
+                PRIMARY KEY (band, bucket, chunk_id)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_buckets_chunk ON buckets(chunk_id);
+            CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """
+        )
+        self._conn.commit()
+        self.stats = {"chunks": 0, "exact": 0, "near": 0, "tokens_saved": 0}
+        self._replaced: Set[str] = set()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def duplicate_count(self) -> int:
+        """Chunks recorded as duplicates, i.e. in the manifest but not in the vector store."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks WHERE canonical_id != chunk_id").fetchone()[0]
+
+    def assign_chunks(self, chunks: List[Document], mode: Optional[str] = None) -> List[Optional[str]]:
+        """
+        Records chunks, each as a new canonical chunk or as a duplicate of an existing one.
+
+        A chunk already recorded under its ID (the same file position and
+        text) keeps its place. Otherwise, in "exact" and "near" mode, a chunk
+        whose text matches a canonical chunk's is its duplicate; in "near"
+        mode, so is one whose estimated similarity to a candidate is at least
+        DEDUP_THRESHOLD (the most similar one wins).
+
+        Returns:
+            For each chunk, the ID of its canonical chunk, or None if it is
+            canonical itself (and must be embedded and stored).
+        """
+        mode = mode or config.DEDUP_MODE
+        canonical_ids = []
+        with self._lock:
+            for chunk in chunks:
+                canonical_id, match = self._assign(chunk, mode)
+                canonical_ids.append(canonical_id)
+                self.stats["chunks"] += 1
+                if canonical_id is not None:
+                    self.stats[match] += 1
+                    self.stats["tokens_saved"] += estimate_tokens(chunk.page_content)
+                    telemetry.count(f"dedup_{match}")
+            self._conn.commit()
+        return canonical_ids
+
+    def _assign(self, chunk: Document, mode: str) -> Tuple[Optional[str], Optional[str]]:
+        row = self._conn.execute("SELECT canonical_id, match FROM chunks WHERE chunk_id = ?", (chunk.id,)).fetchone()
+        if row is not None:
+            return (None, None) if row[0] == chunk.id else row
+
+        key = exact_key(chunk.page_content)
+        canonical_id, match, signature = None, None, None
+        if mode in ("exact", "near"):
+            row = self._conn.execute(
+                "SELECT chunk_id FROM chunks WHERE exact_key = ? AND canonical_id = chunk_id LIMIT 1", (key,)
+            ).fetchone()
+            if row is not None:
+                canonical_id, match = row[0], "exact"
+        if mode == "near":
+            shingles = self.hasher.shingles(chunk.page_content)
+            if len(shingles) >= config.DEDUP_MIN_SHINGLES:
+                signature = self.hasher.signature(shingles)
+                if canonical_id is None:
+                    canonical_id = self._most_similar(signature, chunk.metadata.get("source"))
+                    match = "near" if canonical_id else None
+
+        self._conn.execute(
+            "INSERT INTO chunks (chunk_id, canonical_id, match, exact_key, signature, tokens, text, metadata) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (chunk.id, canonical_id or chunk.id, match, key,
+             signature.tobytes() if signature is not None else None, estimate_tokens(chunk.page_content),
+             chunk.page_content if stores_text_inline() else "", json.dumps(chunk.metadata)),
+        )
+        if canonical_id is None and signature is not None:
+            self._add_buckets(chunk.id, signature)
+        return canonical_id, match
+
+    def _most_similar(self, signature: np.ndarray, source: Optional[str]) -> Optional[str]:
+        candidates: Set[str] = set()
+        for band, bucket in enumerate(self.hasher.band_keys(signature)):
+            candidates.update(row[0] for row in self._conn.execute(
+                "SELECT chunk_id FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)))
+        best, best_similarity = None, config.DEDUP_THRESHOLD
+        for chunk_id in sorted(candidates - self._replaced):
+            stored = self._conn.execute("SELECT signature, metadata FROM chunks WHERE chunk_id = ?",
+                                        (chunk_id,)).fetchone()
+            # An edited chunk would otherwise match its own previous version, which is about to go
+            if source is not None and json.loads(stored[1]).get("source") == source:
+                continue
+            similarity = self.hasher.similarity(signature, np.frombuffer(stored[0], dtype=np.uint32))
+            if similarity >= best_similarity:
+                best, best_similarity = chunk_id, similarity
+        return best
+
+    def _add_buckets(self, chunk_id: str, signature: np.ndarray):
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO buckets (band, bucket, chunk_id) VALUES (?, ?, ?)",
+            [(band, bucket, chunk_id) for band, bucket in enumerate(self.hasher.band_keys(signature))],
+        )
+
+    def remove_chunks(self, chunk_ids: Iterable[str]) -> Dict[str, list]:
+        """
+        Forgets chunks; clusters that lose their canonical chunk promote their oldest remaining duplicate.
+
+        Returns:
+            {"promoted": [(old canonical ID, promoted Document, same text)],
+            "changed": [IDs of canonical chunks whose duplicate list
+            changed]}. Before deleting the old canonical chunks, the caller
+            stores each promoted chunk: with the old chunk's vector when the
+            text is the same, else embedded afresh (see
+            vector_store.promote_chunks).
+        """
+        chunk_ids = set(chunk_ids)
+        promoted, changed = [], set()
+        with self._lock:
+            removed, keys = {}, {}
+            for chunk_id in chunk_ids:
+                row = self._conn.execute("SELECT canonical_id, exact_key FROM chunks WHERE chunk_id = ?",
+                                         (chunk_id,)).fetchone()
+                if row is not None:
+                    removed[chunk_id], keys[chunk_id] = row
+            self._conn.executemany("DELETE FROM chunks WHERE chunk_id = ?", [(chunk_id,) for chunk_id in removed])
+            self._conn.executemany("DELETE FROM buckets WHERE chunk_id = ?", [(chunk_id,) for chunk_id in removed])
+
+            for chunk_id, canonical_id in removed.items():
+                if canonical_id != chunk_id:
+                    changed.add(canonical_id)
+                    continue
+                row = self._conn.execute(
+                    "SELECT chunk_id, signature, text, metadata, exact_key FROM chunks WHERE canonical_id = ? "
+                    "ORDER BY rowid LIMIT 1",
+                    (chunk_id,),
+                ).fetchone()
+                if row is None:
+                    continue
+                new_id, signature, text, metadata, key = row
+                self._conn.execute("UPDATE chunks SET canonical_id = ? WHERE canonical_id = ?", (new_id, chunk_id))
+                self._conn.execute("UPDATE chunks SET match = NULL WHERE chunk_id = ?", (new_id,))
+                if signature is not None:
+                    self._add_buckets(new_id, np.frombuffer(signature, dtype=np.uint32))
+                promoted.append((chunk_id, Document(id=new_id, page_content=text, metadata=json.loads(metadata)),
+                                 key == keys[chunk_id]))
+                changed.add(new_id)
+            self._conn.commit()
+        changed -= chunk_ids
+        return {"promoted": promoted, "changed": sorted(changed)}
+
+    def duplicate_patches(self, canonical_ids: Iterable[str]) -> Dict[str, dict]:
+        """
+        Metadata patches setting each canonical chunk's `duplicates` list (or
+        removing it, when it has none left), in the merge-with-None-deletes
+        form both Chroma's update and LexicalIndex.update_metadata accept.
+        """
+        canonical_ids = list(dict.fromkeys(canonical_ids))
+        duplicates: Dict[str, list] = {chunk_id: [] for chunk_id in canonical_ids}
+        with self._lock:
+            for start in range(0, len(canonical_ids), 500):
+                part = canonical_ids[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                for canonical_id, metadata in self._conn.execute(
+                    f"SELECT canonical_id, metadata FROM chunks WHERE canonical_id IN ({placeholders}) "
+                    f"AND canonical_id != chunk_id ORDER BY rowid", part,
+                ):
+                    duplicates[canonical_id].append(duplicate_location(json.loads(metadata)))
+        return {chunk_id: {"duplicates": json.dumps(locations) if locations else None}
+                for chunk_id, locations in duplicates.items()}
+
+    def replacing(self, chunk_ids: Iterable[str]):
+        """
+        Names the chunks this sync is about to replace (the previous chunks of
+        modified files): no chunk is recorded as a near-duplicate of them.
+        """
+        self._replaced = set(chunk_ids)
+
+    def begin(self):
+        """Marks a sync as in progress; see unrecorded."""
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('in_progress', '1')")
+            self._conn.commit()
+
+    def finish(self):
+        self._replaced = set()
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE key = 'in_progress'")
+            self._conn.commit()
+
+    def interrupted(self) -> bool:
+        """True if the last sync stopped before finishing."""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM state WHERE key = 'in_progress'").fetchone() is not None
+
+    def unrecorded(self, chunk_ids: Set[str]) -> List[str]:
+        """Recorded chunks outside `chunk_ids` (the manifest's): an interrupted sync recorded them before their file."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT chunk_id FROM chunks") if row[0] not in chunk_ids]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM buckets")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM state")
+            self._conn.commit()
+
+    def reset_stats(self):
+        self.stats = {key: 0 for key in self.stats}
+
+    def report(self) -> str:
+        """A one-line summary of this run's savings."""
+        chunks, duplicates = self.stats["chunks"], self.stats["exact"] + self.stats["near"]
+        share = f" ({duplicates / chunks:.0%})" if chunks else ""
+        return (f"Deduplication ({config.DEDUP_MODE}): {duplicates} of {chunks} chunks were duplicates{share}, "
+                f"{self.stats['exact']} exact and {self.stats['near']} near; skipped {duplicates} embeddings "
+                f"(~{self.stats['tokens_saved']} tokens) and stored vectors.")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,195 @@
+# src/embedding_cache.py
+import os
+import time
+import array
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from src import config, telemetry
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC-normalized with outer whitespace stripped."""
+    return unicodedata.normalize("NFC", text).strip()
+
+def cache_key(namespace: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{namespace}:{digest}"
+
+class EmbeddingCache:
+    """
+    Persistent, size-bounded, content-addressed embedding store backed by SQLite.
+
+    Vectors are stored as float32 blobs keyed by (namespace, text hash), where
+    the namespace combines the embedding model name with the task (document or
+    query), since the two produce different vectors. When the cache grows past
+    `max_entries`, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = path or config.EMBEDDING_CACHE_PATH
+        self.max_entries = max_entries or config.EMBEDDING_CACHE_MAX_ENTRIES
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get_many(self, namespace: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Returns cached vectors aligned with `texts`, with None for misses."""
+        keys = [cache_key(namespace, text) for text in texts]
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found]
+                )
+                self._conn.commit()
+            hits = sum(1 for key in keys if key in found)
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(keys) - hits
+        telemetry.count("embedding_cache_hits", hits)
+        telemetry.count("embedding_cache_misses", len(keys) - hits)
+        return [array.array("f", found[key]).tolist() if key in found else None for key in keys]
+
+    def put_many(self, namespace: str, texts: List[str], vectors: List[List[float]]):
+        now = time.time()
+        rows = [(cache_key(namespace, text), array.array("f", vector).tobytes(), now)
+                for text, vector in zip(texts, vectors)]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                self._evict(self._count - self.max_entries)
+            self._conn.commit()
+
+    def _evict(self, count: int):
+        """Deletes the `count` least recently used entries. Caller holds the lock."""
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (count,)
+        )
+        self._count -= count
+        self.stats["evictions"] += count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that consults an EmbeddingCache before calling the model.
+
+    Only texts missing from the cache reach the wrapped model, and their
+    vectors are written back. Used for both ingestion and query embedding.
+    """
+
+    def __init__(self, inner: Embeddings, model_name: str, cache: Optional[EmbeddingCache] = None):
+        self.inner = inner
+        self.model_name = model_name
+        self.cache = cache if cache is not None else get_embedding_cache()
+
+    @property
+    def document_namespace(self) -> str:
+        return f"{self.model_name}:document"
+
+    @property
+    def query_namespace(self) -> str:
+        return f"{self.model_name}:query"
+
+    def lookup_documents(self, texts: List[str]) -> Tuple[List[Optional[List[float]]], List[int]]:
+        """Returns cached document vectors (None for misses) and the indices of the misses."""
+        vectors = self.cache.get_many(self.document_namespace, texts)
+        return vectors, [i for i, vector in enumerate(vectors) if vector is None]
+
+    def store_documents(self, texts: List[str], vectors: List[List[float]]):
+        self.cache.put_many(self.document_namespace, texts, vectors)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors, missing = self.lookup_documents(texts)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            fresh = self.inner.embed_documents(missing_texts)
+            self.store_documents(missing_texts, fresh)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        cached = self.cache.get_many(self.query_namespace, [text])[0]
+        if cached is not None:
+            return cached
+        vector = self.inner.embed_query(text)
+        self.cache.put_many(self.query_namespace, [text], [vector])
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Batched query embedding; only cache misses reach the model, in one batched call."""
+        vectors = self.cache.get_many(self.query_namespace, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            fresh = embed_queries(self.inner, missing_texts)
+            self.cache.put_many(self.query_namespace, missing_texts, fresh)
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+        return vectors
+
+def embed_queries(model: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embeds several queries at once.
+
+    LangChain's Embeddings interface only batches documents, so this uses the
+    model's batched query path when it has one: CachedEmbeddings.embed_queries,
+    or Vertex AI's `embed` with the RETRIEVAL_QUERY task type. Otherwise it
+    falls back to one embed_query call per text.
+    """
+    if hasattr(model, "embed_queries"):
+        return model.embed_queries(texts)
+    if hasattr(model, "embed") and hasattr(model, "model_name"):
+        return model.embed(texts, 0, "RETRIEVAL_QUERY")
+    return [model.embed_query(text) for text in texts]
+
+_shared_cache: Optional[EmbeddingCache] = None
+_shared_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Returns the process-wide embedding cache, opening it on first use."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache()
+        return _shared_cache
@@ -0,0 +1,251 @@
+# src/embedding_scheduler.py
+import time
+import random
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from src import config, telemetry
+from src.embedding_cache import CachedEmbeddings
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for rate and batch limits."""
+    return max(1, len(text) // 4)
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Recognizes 429 / quota errors from Vertex AI (google.api_core) and the fake client."""
+    code = getattr(error, "code", None)
+    if code == 429 or getattr(code, "value", None) == 429:
+        return True
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "resource exhausted" in message
+
+def is_transient_error(error: Exception) -> bool:
+    """Errors worth retrying without treating them as a throttle signal."""
+    if type(error).__name__ in ("ServiceUnavailable", "DeadlineExceeded", "InternalServerError"):
+        return True
+    message = str(error).lower()
+    return "503" in message or "unavailable" in message or "deadline exceeded" in message
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+
+    `acquire` blocks until enough tokens are available. Requests larger than
+    the bucket's capacity are clamped so they can still go through.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(min(wait, 1.0))
+
+class EmbeddingScheduler(Embeddings):
+    """
+    Adaptive, rate-limited, concurrent front-end for an embedding client.
+
+    - Requests/min and tokens/min are enforced with token buckets.
+    - Up to `max_in_flight` requests run at once. On a 429/quota error the
+      concurrency limit is halved and every worker pauses for a jittered
+      exponential backoff. After a run of successes it grows back by one
+      (additive increase, multiplicative decrease).
+    - Texts are packed into batches sized against the model's per-request
+      text and token limits.
+
+    It implements LangChain's `Embeddings`, so it can wrap any embedding
+    model (including the fakes in `src/fakes.py`) wherever one is expected.
+    When the client is a CachedEmbeddings, cached texts are answered up front
+    and never count against the rate limits.
+    """
+
+    def __init__(
+        self,
+        client: Embeddings,
+        max_in_flight: Optional[int] = None,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_batch_texts: Optional[int] = None,
+        max_batch_tokens: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 60.0,
+        increase_after: int = 5,
+    ):
+        self.client = client
+        # Cache hits are resolved before scheduling; only misses reach the model
+        self.cache = client if isinstance(client, CachedEmbeddings) else None
+        self._model = client.inner if self.cache else client
+        self.max_in_flight = max_in_flight or config.EMBEDDING_MAX_IN_FLIGHT
+        self.max_batch_texts = max_batch_texts or config.EMBEDDING_MAX_BATCH_TEXTS
+        self.max_batch_tokens = max_batch_tokens or config.EMBEDDING_MAX_BATCH_TOKENS
+        self.max_retries = config.EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.increase_after = increase_after
+
+        self._request_bucket = TokenBucket(requests_per_minute or config.EMBEDDING_REQUESTS_PER_MINUTE)
+        self._token_bucket = TokenBucket(tokens_per_minute or config.EMBEDDING_TOKENS_PER_MINUTE)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="embed")
+
+        self._cond = threading.Condition()
+        self._limit = self.max_in_flight
+        self._in_flight = 0
+        self._successes = 0
+        self._paused_until = 0.0
+        self.stats = {"requests": 0, "texts": 0, "retries": 0, "throttled": 0}
+
+    @property
+    def concurrency_limit(self) -> int:
+        return self._limit
+
+    def batch_fits(self, count: int, tokens: int) -> bool:
+        """True if a batch of `count` texts totalling `tokens` is within per-request limits."""
+        return count <= self.max_batch_texts and tokens <= self.max_batch_tokens
+
+    def make_batches(self, texts: List[str]) -> List[List[int]]:
+        """Greedily packs text indices into batches that respect per-request limits."""
+        batches, current, current_tokens = [], [], 0
+        for index, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if current and not self.batch_fits(len(current) + 1, current_tokens + tokens):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def submit(self, texts: List[str]) -> Future:
+        """Schedules one request-sized batch and returns a Future of its vectors."""
+        texts = list(texts)
+        if not self.cache:
+            return self._executor.submit(self._embed_with_retry, texts)
+
+        vectors, missing = self.cache.lookup_documents(texts)
+        if not missing:
+            done = Future()
+            done.set_result(vectors)
+            return done
+        return self._executor.submit(self._embed_missing, texts, vectors, missing)
+
+    def _embed_missing(self, texts, vectors, missing):
+        missing_texts = [texts[i] for i in missing]
+        fresh = self._embed_with_retry(missing_texts)
+        self.cache.store_documents(missing_texts, fresh)
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeds any number of texts, running size-limited batches concurrently."""
+        futures = [(batch, self.submit([texts[i] for i in batch])) for batch in self.make_batches(texts)]
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for batch, future in futures:
+            for index, vector in zip(batch, future.result()):
+                vectors[index] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.client.embed_query(text)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def _acquire_slot(self):
+        with self._cond:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    self._cond.wait(pause)
+                elif self._in_flight >= self._limit:
+                    self._cond.wait()
+                else:
+                    self._in_flight += 1
+                    return
+
+    def _release_slot(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _on_success(self, texts: int):
+        with self._cond:
+            self.stats["texts"] += texts
+            self._successes += 1
+            if self._successes >= self.increase_after and self._limit < self.max_in_flight:
+                self._limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with 'equal jitter': half fixed, half random."""
+        ceiling = min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt)
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def _on_throttle(self, attempt: int) -> float:
+        """Halves concurrency and pauses all workers for a jittered exponential backoff."""
+        delay = self._backoff_delay(attempt)
+        with self._cond:
+            self.stats["throttled"] += 1
+            self._successes = 0
+            self._limit = max(1, self._limit // 2)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    def _embed_with_retry(self, texts: List[str]) -> List[List[float]]:
+        tokens = sum(estimate_tokens(text) for text in texts)
+        attempt = 0
+        while True:
+            self._acquire_slot()
+            try:
+                with telemetry.span("embed_quota_wait"):
+                    self._request_bucket.acquire(1)
+                    self._token_bucket.acquire(tokens)
+                with self._cond:
+                    self.stats["requests"] += 1
+                telemetry.count("embedding_requests")
+                with telemetry.span("embed", texts=len(texts)):
+                    vectors = self._model.embed_documents(texts)
+            except Exception as e:
+                self._release_slot()
+                if attempt >= self.max_retries:
+                    raise
+                if is_rate_limit_error(e):
+                    telemetry.count("embedding_throttled")
+                    self._on_throttle(attempt)
+                elif is_transient_error(e):
+                    time.sleep(self._backoff_delay(attempt))
+                else:
+                    raise
+                attempt += 1
+                with self._cond:
+                    self.stats["retries"] += 1
+                telemetry.count("embedding_retries")
+                continue
+            self._release_slot()
+            self._on_success(len(texts))
+            telemetry.count("embedding_texts", len(texts))
+            return vectors
@@ -0,0 +1,380 @@
+# src/exec_pool.py
+import os
+import sys
+import time
+import queue
+import runpy
+import atexit
+import select
+import signal
+import codecs
+import resource
+import threading
+import traceback
+import subprocess
+import multiprocessing
+from multiprocessing.reduction import recv_handle, send_handle
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Sequence
+
+from src import config, telemetry
+
+# Bytes read from a worker's output pipes at a time
+_READ_SIZE = 64 * 1024
+
+def _run_job(job: tuple) -> int:
+    kind, target = job
+    if kind == "shell":
+        return subprocess.run(target, shell=True).returncode
+    # Run the script like `python target` would: this project's modules, loaded
+    # with the worker, must not shadow a `src` package of the script's own
+    for name in [name for name in sys.modules if name == "src" or name.startswith("src.")]:
+        del sys.modules[name]
+    sys.argv = [target]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(target)))
+    # Collect the script's exit handlers ourselves: the worker ends in os._exit, and the
+    # handlers the preloaded modules registered with atexit belong to the pool, not the script
+    handlers = _ExitHandlers()
+    atexit.register, atexit.unregister = handlers.register, handlers.unregister
+    try:
+        runpy.run_path(target, run_name="__main__")
+        exit_code = 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            exit_code = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    _join_threads()
+    handlers.run()
+    return exit_code
+
+class _ExitHandlers:
+    """Stands in for atexit.register/unregister while a script runs; `run` calls the handlers last in, first out."""
+
+    def __init__(self):
+        self._handlers = []
+
+    def register(self, func, *args, **kwargs):
+        self._handlers.append((func, args, kwargs))
+        return func
+
+    def unregister(self, func):
+        self._handlers = [handler for handler in self._handlers if handler[0] != func]
+
+    def run(self):
+        while self._handlers:
+            func, args, kwargs = self._handlers.pop()
+            try:
+                func(*args, **kwargs)
+            except SystemExit:
+                pass
+            except BaseException:
+                print(f"Exception ignored in atexit callback {func!r}:", file=sys.stderr)
+                traceback.print_exc()
+
+def _join_threads():
+    """Waits for the script's non-daemon threads, as interpreter shutdown would."""
+    # threading._shutdown is what the interpreter itself calls at this point: it also runs
+    # threading's own exit hooks, which stop ThreadPoolExecutor workers a script never shut
+    # down. It is private, so fall back to plain joins should it ever go away.
+    shutdown = getattr(threading, "_shutdown", None)
+    if shutdown is not None:
+        shutdown()
+        return
+    current = threading.current_thread()
+    for thread in threading.enumerate():
+        if thread is not current and not thread.daemon:
+            thread.join()
+
+def _worker_main(conn):
+    """
+    A warm worker: forked from the forkserver with the preload modules
+    already imported, it waits for one job, runs it and exits, so no state
+    leaks from one job into the next.
+    """
+    try:
+        job, memory_limit = conn.recv()
+        stdout, stderr = recv_handle(conn), recv_handle(conn)
+    except EOFError:
+        return
+    # Own process group, so the parent can kill anything the job started too
+    os.setsid()
+    # Shell commands are left unlimited: JVMs, Node and the like reserve far more address space than they use
+    if memory_limit and job[0] == "python":
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    # The parent reads the other ends of these pipes directly, as the job writes
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(stdout, 1)
+    os.dup2(stderr, 2)
+    os.close(stdout)
+    os.close(stderr)
+
+    start = time.perf_counter()
+    exit_code = _run_job(job)
+    run_seconds = time.perf_counter() - start
+    sys.stdout.flush()
+    sys.stderr.flush()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    conn.send(("done", exit_code, run_seconds, max(usage.ru_maxrss, children.ru_maxrss)))
+    conn.close()
+    # The job's threads and exit handlers are done; skip the rest of interpreter teardown
+    os._exit(0)
+
+class CappedOutput:
+    """Keeps the first and last `max_chars // 2` characters of a stream and counts what was dropped."""
+
+    def __init__(self, max_chars: int):
+        self.half = max(max_chars // 2, 1)
+        self.head = ""
+        self.tail = ""
+        self._dropped = 0
+
+    def write(self, text: str):
+        if len(self.head) < self.half:
+            take = self.half - len(self.head)
+            self.head += text[:take]
+            text = text[take:]
+        self.tail += text
+        # Trim in bulk, so a chatty job isn't copied on every write
+        if len(self.tail) > 2 * self.half:
+            self._dropped += len(self.tail) - self.half
+            self.tail = self.tail[-self.half:]
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped + max(len(self.tail) - self.half, 0)
+
+    def text(self) -> str:
+        if not self.dropped:
+            return self.head + self.tail
+        return f"{self.head}\n[... {self.dropped} characters truncated ...]\n{self.tail[-self.half:]}"
+
+@dataclass
+class JobResult:
+    """Outcome and timings of one job; all durations are in seconds."""
+    exit_code: Optional[int]
+    stdout: str
+    stderr: str
+    timed_out: bool = False
+    # Waiting for a free slot, then for a ready worker (near zero when one was pre-forked)
+    wait_seconds: float = 0.0
+    startup_seconds: float = 0.0
+    run_seconds: float = 0.0
+    total_seconds: float = 0.0
+    max_rss_kb: int = 0
+    truncated_chars: Dict[str, int] = field(default_factory=dict)
+
+    def timings(self) -> str:
+        return (f"exit {self.exit_code}, {self.total_seconds:.3f}s total (wait {self.wait_seconds:.3f}s, "
+                f"startup {self.startup_seconds:.3f}s, run {self.run_seconds:.3f}s), "
+                f"max RSS {self.max_rss_kb / 1024:.0f} MB")
+
+class ExecPool:
+    """
+    Runs Python files and shell commands in pre-forked, warm worker interpreters.
+
+    Workers are forked from a forkserver that imported `preload` once, so a
+    job starts without paying for interpreter startup or those imports. Each
+    worker runs a single job, in its own process group (Python jobs also
+    under an address space limit), and `workers` spare workers are kept
+    forked ahead of demand.
+    At most `workers` jobs run at once; others wait for a slot.
+
+    Output is captured at the file descriptor level (so subprocesses and C
+    extensions are included) and streamed to `on_output` as it is produced;
+    when a job ends, whatever it left running in the background is killed;
+    the returned JobResult keeps the head and tail of each stream, up to
+    `max_output_chars`.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        preload: Optional[Sequence[str]] = None,
+        memory_limit_mb: Optional[int] = None,
+        max_output_chars: Optional[int] = None,
+    ):
+        self.workers = workers or config.EXEC_POOL_WORKERS
+        self.memory_limit = (memory_limit_mb if memory_limit_mb is not None else config.EXEC_MEMORY_LIMIT_MB) * 2**20
+        self.max_output_chars = max_output_chars or config.EXEC_OUTPUT_MAX_CHARS
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if "forkserver" in methods:
+            preload = config.EXEC_PRELOAD_MODULES if preload is None else preload
+            # Modules that fail to import are skipped by the forkserver; it resolves
+            # them from the working directory, so start from the project root
+            self._ctx.set_forkserver_preload([__name__] + list(preload))
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._spares: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.stats = {"jobs": 0, "timeouts": 0, "cold_starts": 0}
+        for _ in range(self.workers):
+            self._spawn_spare()
+
+    def _start_worker(self):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, args=(child_conn,), name="exec-worker", daemon=True)
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def _spawn_spare(self):
+        def spawn():
+            with self._lock:
+                if self._closed:
+                    return
+            process, conn = self._start_worker()
+            # Checked again under the lock: close() may have drained the spares while this one forked
+            with self._lock:
+                if not self._closed:
+                    self._spares.put((process, conn))
+                    return
+            self._stop_worker(process, conn)
+        threading.Thread(target=spawn, name="exec-prefork", daemon=True).start()
+
+    def _take_worker(self):
+        try:
+            worker = self._spares.get_nowait()
+        except queue.Empty:
+            self.stats["cold_starts"] += 1
+            worker = self._start_worker()
+        self._spawn_spare()
+        return worker
+
+    def run_python(self, path: str, **kwargs) -> JobResult:
+        return self.run(("python", path), **kwargs)
+
+    def run_shell(self, command: str, **kwargs) -> JobResult:
+        return self.run(("shell", command), **kwargs)
+
+    def run(
+        self,
+        job: tuple,
+        timeout: Optional[float] = None,
+        on_output: Optional[Callable[[str, str], None]] = None,
+    ) -> JobResult:
+        """
+        Runs one job and blocks until it exits or times out.
+
+        Args:
+            job: ("python", path) or ("shell", command).
+            timeout: Seconds before the job and its process group are killed.
+            on_output: Called as on_output(stream, text) for each piece of
+                stdout/stderr as it arrives ("stdout" or "stderr").
+        """
+        timeout = timeout or config.EXEC_TIMEOUT_SECONDS
+        start = time.perf_counter()
+        with self._slots:
+            acquired = time.perf_counter()
+            process, conn = self._take_worker()
+            ready = time.perf_counter()
+            result = JobResult(exit_code=None, stdout="", stderr="",
+                               wait_seconds=acquired - start, startup_seconds=ready - acquired)
+            outputs = {stream: (CappedOutput(self.max_output_chars), _incremental_decoder())
+                       for stream in ("stdout", "stderr")}
+            pipes = {}
+            try:
+                conn.send((job, self.memory_limit))
+                for stream in ("stdout", "stderr"):
+                    read_fd, write_fd = os.pipe()
+                    pipes[read_fd] = stream
+                    send_handle(conn, write_fd, process.pid)
+                    os.close(write_fd)
+                self._communicate(process, conn, pipes, outputs, result, ready + timeout, on_output)
+            finally:
+                conn.close()
+                for fd in pipes:
+                    os.close(fd)
+                process.join(1)
+        result.stdout = outputs["stdout"][0].text()
+        result.stderr = outputs["stderr"][0].text()
+        result.truncated_chars = {name: out.dropped for name, (out, _) in outputs.items() if out.dropped}
+        result.total_seconds = time.perf_counter() - start
+        if result.timed_out:
+            result.run_seconds = timeout
+            self.stats["timeouts"] += 1
+        self.stats["jobs"] += 1
+        telemetry.observe("exec_job", result.total_seconds, kind=job[0], timed_out=result.timed_out)
+        return result
+
+    def _communicate(self, process, conn, pipes: Dict[int, str], outputs, result: JobResult,
+                     deadline: float, on_output):
+        """Reads the job's output as it arrives until the worker reports back and the pipes close."""
+        open_fds = set(pipes)
+        watching = [conn.fileno()] + list(open_fds)
+        while watching:
+            remaining = deadline - time.perf_counter()
+            ready = select.select(watching, [], [], max(remaining, 0))[0] if remaining > 0 else []
+            if not ready:
+                # Nothing left unread; time is up for the job (or for whatever still holds its pipes)
+                result.timed_out = conn.fileno() in watching
+                self._kill(process)
+                return
+            for fd in ready:
+                if fd in open_fds:
+                    data = os.read(fd, _READ_SIZE)
+                    if not data:
+                        open_fds.discard(fd)
+                        watching.remove(fd)
+                        continue
+                    output, decoder = outputs[pipes[fd]]
+                    text = decoder.decode(data)
+                    output.write(text)
+                    if on_output is not None and text:
+                        on_output(pipes[fd], text)
+                    continue
+                watching.remove(fd)
+                try:
+                    _, result.exit_code, result.run_seconds, result.max_rss_kb = conn.recv()
+                except (EOFError, OSError):
+                    # The worker died mid-job (e.g. killed for exceeding its memory limit)
+                    process.join(1)
+                    result.exit_code = process.exitcode
+                # Background processes the job left behind would hold the pipes open
+                self._kill(process)
+
+    @staticmethod
+    def _kill(process):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            process.kill()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                process, conn = self._spares.get_nowait()
+            except queue.Empty:
+                break
+            self._stop_worker(process, conn)
+
+    @staticmethod
+    def _stop_worker(process, conn):
+        """Stops an idle worker: closing its pipe ends it, or it is killed after a second."""
+        conn.close()
+        process.join(1)
+        if process.is_alive():
+            process.kill()
+
+def _incremental_decoder():
+    return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+_exec_pool: Optional[ExecPool] = None
+_exec_pool_lock = threading.Lock()
+
+def get_exec_pool() -> ExecPool:
+    """Returns the process-wide execution pool, forking its first workers on first use."""
+    global _exec_pool
+    with _exec_pool_lock:
+        if _exec_pool is None:
+            _exec_pool = ExecPool()
+        return _exec_pool
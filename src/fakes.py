@@ -0,0 +1,180 @@
+# src/fakes.py
+"""
+Local stand-ins for the Vertex AI models.
+
+They need no credentials or network access and produce deterministic output,
+with configurable latency and injected failures, so the concurrency and
+rate-limiting code can be exercised offline.
+"""
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from pydantic import PrivateAttr
+
+class FakeRateLimitError(Exception):
+    """Mimics the 429 ResourceExhausted error raised by Vertex AI."""
+    code = 429
+
+    def __init__(self, message: str = "429 Resource exhausted: quota exceeded (fake)"):
+        super().__init__(message)
+
+def fake_vector(text: str, dim: int) -> List[float]:
+    """Deterministic unit-length pseudo-embedding derived from the text's hash."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic embedding client with injectable latency and rate-limit errors.
+
+    Args:
+        dim: Vector dimensionality.
+        latency_seconds: Base latency of every call.
+        latency_per_text_seconds: Extra latency per text in a batch call.
+        jitter_seconds: Uniform random latency added on top.
+        requests_per_minute: If set, calls beyond this rate in a sliding
+            60-second window fail with FakeRateLimitError, like a real quota.
+        error_rate: Probability that any call fails with FakeRateLimitError.
+        seed: Seed for the latency jitter and injected errors.
+    """
+
+    def __init__(
+        self,
+        dim: int = 768,
+        latency_seconds: float = 0.0,
+        latency_per_text_seconds: float = 0.0,
+        jitter_seconds: float = 0.0,
+        requests_per_minute: Optional[float] = None,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.dim = dim
+        self.latency_seconds = latency_seconds
+        self.latency_per_text_seconds = latency_per_text_seconds
+        self.jitter_seconds = jitter_seconds
+        self.requests_per_minute = requests_per_minute
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window = deque()
+        self.stats = {"calls": 0, "texts": 0, "rate_limited": 0, "max_concurrency": 0}
+        self._active = 0
+
+    def _check_quota(self):
+        with self._lock:
+            self.stats["calls"] += 1
+            now = time.monotonic()
+            while self._window and now - self._window[0] > 60:
+                self._window.popleft()
+            limited = (
+                (self.requests_per_minute is not None and len(self._window) >= self.requests_per_minute)
+                or self._rng.random() < self.error_rate
+            )
+            if limited:
+                self.stats["rate_limited"] += 1
+                raise FakeRateLimitError()
+            self._window.append(now)
+            jitter = self._rng.uniform(0, self.jitter_seconds)
+        return jitter
+
+    def _simulate_call(self, count: int):
+        jitter = self._check_quota()
+        with self._lock:
+            self._active += 1
+            self.stats["max_concurrency"] = max(self.stats["max_concurrency"], self._active)
+        try:
+            time.sleep(self.latency_seconds + self.latency_per_text_seconds * count + jitter)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self.stats["texts"] += count
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._simulate_call(len(texts))
+        return [fake_vector(text, self.dim) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self._simulate_call(1)
+        return fake_vector(text, self.dim)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Batched query embedding, one simulated request (mirrors Vertex AI's batched query path)."""
+        self._simulate_call(len(texts))
+        return [fake_vector(text, self.dim) for text in texts]
+
+class FakeStreamingLLM(LLM):
+    """
+    Deterministic text LLM that streams tokens at a configurable pace.
+
+    Latency is modelled as time-to-first-token plus a fixed delay per token.
+    The async path sleeps with `asyncio.sleep`, so many concurrent streams
+    share one event loop the way real network-bound calls do. `stats` records
+    calls and the peak number of concurrent generations.
+    """
+    first_token_seconds: float = 0.2
+    token_seconds: float = 0.01
+    tokens: int = 40
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _active: int = PrivateAttr(default=0)
+    _stats: Dict[str, int] = PrivateAttr(default_factory=lambda: {"calls": 0, "max_concurrency": 0})
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return self._stats
+
+    def _tokens(self, prompt: str) -> List[str]:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return [f"{digest[i % len(digest)]}{i} " for i in range(self.tokens)]
+
+    def _enter(self):
+        with self._lock:
+            self._active += 1
+            self._stats["calls"] += 1
+            self._stats["max_concurrency"] = max(self._stats["max_concurrency"], self._active)
+
+    def _exit(self):
+        with self._lock:
+            self._active -= 1
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        self._enter()
+        try:
+            time.sleep(self.first_token_seconds)
+            for i, token in enumerate(self._tokens(prompt)):
+                if i:
+                    time.sleep(self.token_seconds)
+                yield GenerationChunk(text=token)
+        finally:
+            self._exit()
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None,
+                       **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        self._enter()
+        try:
+            await asyncio.sleep(self.first_token_seconds)
+            for i, token in enumerate(self._tokens(prompt)):
+                if i:
+                    await asyncio.sleep(self.token_seconds)
+                yield GenerationChunk(text=token)
+        finally:
+            self._exit()
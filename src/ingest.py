@@ -0,0 +1,288 @@
+# src/ingest.py
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+from langchain.docstore.document import Document
+
+from src import config, telemetry
+from src.answer_cache import invalidate_sources
+from src.chunk_store import BlobStore, rehydrate, stores_text_inline
+from src.data_loader import (
+    CHUNKER_VERSION, iter_source_files, is_excluded_dir, is_source_file, compute_file_hash, report_throughput,
+)
+from src.dedup import DedupIndex
+from src.lexical_index import LexicalIndex
+from src.manifest import IngestManifest
+from src.mmap_index import export_collection
+from src.pipeline import IngestPipeline
+from src.symbols import SymbolIndex
+from src.vector_store import get_vector_store, get_embedding_scheduler, delete_chunks, promote_chunks, update_metadata
+
+def plan_changes(directory_path: str, manifest: IngestManifest, paths: Optional[Iterable[str]] = None) -> Dict[str, List]:
+    """
+    Compares the codebase against the manifest.
+
+    Files whose mtime and size match the manifest are skipped without being read.
+    Files whose stats changed are hashed; if the hash still matches, only their
+    stats are refreshed. If the manifest was written by another chunker
+    version, every file is treated as modified.
+
+    With `paths` (files or directories, e.g. from a file watcher), only those
+    paths are compared instead of walking the whole codebase.
+
+    Returns:
+        A dict with 'added', 'modified' and 'removed' path lists, a 'touched'
+        list of files whose stats changed but content did not, and 'stats'
+        mapping each added/modified/touched path to (mtime, size, content_hash).
+    """
+    plan = {"added": [], "modified": [], "removed": [], "touched": [], "stats": {}}
+    seen = set()
+    rechunk = manifest.exists() and manifest.chunker != CHUNKER_VERSION
+    if rechunk:
+        print("The chunker has changed since the last ingestion; re-chunking every file.")
+
+    if paths is None:
+        file_paths = telemetry.span_iter("walk", iter_source_files(directory_path))
+    else:
+        with telemetry.span("walk"):
+            file_paths, scopes = scoped_source_files(directory_path, paths)
+
+    for file_path in file_paths:
+        seen.add(file_path)
+        try:
+            st = os.stat(file_path)
+        except OSError as e:
+            print(f"   !!! Could not stat {file_path}: {e}")
+            continue
+
+        if not rechunk and manifest.is_unchanged(file_path, st.st_mtime, st.st_size):
+            continue
+
+        content_hash = compute_file_hash(file_path)
+        entry = manifest.get(file_path)
+        plan["stats"][file_path] = (st.st_mtime, st.st_size, content_hash)
+        if entry is None:
+            plan["added"].append(file_path)
+        elif rechunk or entry["content_hash"] != content_hash:
+            plan["modified"].append(file_path)
+        else:
+            plan["touched"].append(file_path)
+
+    plan["removed"] = [
+        source for source in manifest.sources()
+        if source not in seen and (paths is None or in_scope(source, scopes))
+    ]
+    return plan
+
+def scoped_source_files(directory_path: str, paths: Iterable[str]):
+    """
+    Resolves changed paths to the source files that exist under them.
+
+    Returns:
+        (file_paths, scopes): the existing source files, and the normalized
+        paths themselves, within which manifest entries that no longer
+        exist count as removed.
+    """
+    file_paths, scopes = set(), set()
+    for path in paths:
+        relative = os.path.relpath(path, directory_path)
+        if relative.startswith(os.pardir):
+            continue
+        # Same spelling as iter_source_files, so paths match manifest keys
+        path = os.path.join(directory_path, relative)
+        scopes.add(path)
+        if os.path.isdir(path):
+            if relative == os.curdir or not any(is_excluded_dir(d) for d in relative.split(os.sep)):
+                file_paths.update(iter_source_files(path))
+        elif os.path.isfile(path) and is_source_file(path, directory_path):
+            file_paths.add(path)
+    return sorted(file_paths), scopes
+
+def in_scope(source: str, scopes: set) -> bool:
+    """True if `source` is one of `scopes` or lies below one of them."""
+    return source in scopes or any(source.startswith(scope.rstrip(os.sep) + os.sep) for scope in scopes)
+
+def backfill_lexical_index(vector_db, lexical_index: LexicalIndex, page_size: int = 500):
+    """Indexes every chunk already in the collection, for stores built before the lexical index existed."""
+    print("Building lexical index from the existing collection...")
+    offset = 0
+    while True:
+        page = vector_db._collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+        if not page["ids"]:
+            break
+        lexical_index.add_chunks(rehydrate([
+            Document(id=chunk_id, page_content=text or "", metadata=metadata or {})
+            for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+        ]))
+        offset += len(page["ids"])
+    print(f"   ...indexed {offset} chunks.")
+
+def backfill_symbol_index(vector_db, symbol_index: SymbolIndex, page_size: int = 500):
+    """Indexes the symbols recorded on every chunk already in the collection."""
+    print("Building symbol index from the existing collection...")
+    offset = 0
+    while True:
+        page = vector_db._collection.get(limit=page_size, offset=offset, include=["metadatas"])
+        if not page["ids"]:
+            break
+        symbol_index.add_chunks(
+            Document(id=chunk_id, page_content="", metadata=metadata or {})
+            for chunk_id, metadata in zip(page["ids"], page["metadatas"])
+        )
+        offset += len(page["ids"])
+    print(f"   ...indexed {len(symbol_index)} symbols.")
+
+def backfill_dedup_index(vector_db, lexical_index: LexicalIndex, dedup_index: DedupIndex, page_size: int = 500):
+    """
+    Records every chunk already in the collection, for stores built before
+    deduplication existed. Duplicates found among them are dropped from the
+    vector store and the lexical index, and listed on their canonical chunk.
+    """
+    print("Building dedup index from the existing collection...")
+    offset, duplicates = 0, {}
+    while True:
+        page = vector_db._collection.get(limit=page_size, offset=offset, include=["documents", "metadatas"])
+        if not page["ids"]:
+            break
+        chunks = rehydrate([
+            Document(id=chunk_id, page_content=text or "", metadata=metadata or {})
+            for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+        ])
+        for chunk, canonical_id in zip(chunks, dedup_index.assign_chunks(chunks)):
+            if canonical_id is not None:
+                duplicates[chunk.id] = canonical_id
+        offset += len(page["ids"])
+    delete_chunks(vector_db, list(duplicates))
+    lexical_index.remove_chunks(duplicates)
+    patches = dedup_index.duplicate_patches(duplicates.values())
+    update_metadata(vector_db, patches)
+    lexical_index.update_metadata(patches)
+    dedup_index.reset_stats()
+    print(f"   ...recorded {offset} chunks; removed {len(duplicates)} duplicates from the stores.")
+
+def sync_codebase(directory_path: str, manifest_path: str = None, paths: Optional[Iterable[str]] = None):
+    """
+    Incrementally brings the vector store in line with the codebase.
+
+    Only added or modified files are re-chunked and re-embedded, and vectors for
+    removed files are deleted. Changed files stream through the bounded
+    IngestPipeline, so embedding starts on the first file. Chunk IDs are
+    deterministic and the manifest is saved as files complete, so an
+    interrupted run resumes where it stopped. Duplicate chunks are embedded
+    and stored once per cluster (see DedupIndex).
+
+    `paths` limits the comparison to those files and directories (see
+    plan_changes); the watcher passes the paths it saw change.
+    """
+    print(f"Starting incremental ingestion of codebase at: {directory_path}")
+    manifest = IngestManifest.load(manifest_path)
+    vector_db = get_vector_store()
+    lexical_index = LexicalIndex()
+    symbol_index = SymbolIndex()
+    dedup_index = DedupIndex()
+
+    if not manifest.exists() and vector_db._collection.count() > 0:
+        # Vectors written before the manifest existed have random IDs that can't
+        # be reconciled with files on disk, so start this collection over.
+        print("No ingestion manifest found for the existing collection. Rebuilding it from scratch.")
+        vector_db.delete_collection()
+        vector_db = get_vector_store()
+    if not manifest.exists():
+        lexical_index.clear()
+        symbol_index.clear()
+        dedup_index.clear()
+    elif manifest.files:
+        if not len(lexical_index):
+            backfill_lexical_index(vector_db, lexical_index)
+        if not len(symbol_index) and manifest.chunker == CHUNKER_VERSION:
+            backfill_symbol_index(vector_db, symbol_index)
+        if not len(dedup_index):
+            backfill_dedup_index(vector_db, lexical_index, dedup_index)
+
+    scheduler = get_embedding_scheduler(vector_db.embeddings)
+
+    def remove_chunks(chunk_ids):
+        # A removed canonical chunk is replaced by the oldest remaining duplicate
+        removal = dedup_index.remove_chunks(chunk_ids)
+        lexical_index.add_chunks(promote_chunks(vector_db, removal["promoted"], scheduler))
+        delete_chunks(vector_db, chunk_ids)
+        lexical_index.remove_chunks(chunk_ids)
+        symbol_index.remove_chunks(chunk_ids)
+        patches = dedup_index.duplicate_patches(removal["changed"])
+        update_metadata(vector_db, patches)
+        lexical_index.update_metadata(patches)
+
+    if dedup_index.interrupted():
+        # Chunks the interrupted run recorded for files that never reached the manifest
+        recorded = {chunk_id for entry in manifest.files.values() for chunk_id in entry["chunk_ids"]}
+        remove_chunks(dedup_index.unrecorded(recorded))
+    dedup_index.begin()
+
+    plan = plan_changes(directory_path, manifest, paths)
+    print(
+        f"Files: {len(plan['added'])} added, {len(plan['modified'])} modified, "
+        f"{len(plan['removed'])} removed."
+    )
+
+    # The previous chunks of modified files go once their new chunks are in; none of them is a cluster to join
+    dedup_index.replacing(chunk_id for source in plan["modified"] for chunk_id in manifest.get(source)["chunk_ids"])
+    for source in plan["removed"]:
+        print(f"-> Removing file: {source}")
+        remove_chunks(manifest.remove(source))
+    for source in plan["touched"]:
+        mtime, size, content_hash = plan["stats"][source]
+        manifest.record(source, mtime, size, content_hash, manifest.get(source)["chunk_ids"])
+    if plan["removed"] or plan["touched"]:
+        manifest.save()
+
+    changed = plan["added"] + plan["modified"]
+    last_save = time.monotonic()
+
+    def on_file_done(source: str, new_ids: List[str]):
+        nonlocal last_save
+        # Drop chunks the previous version of this file produced but the new one doesn't
+        previous = manifest.get(source)
+        if previous:
+            stale = set(previous["chunk_ids"]) - set(new_ids)
+            remove_chunks(stale)
+
+        mtime, size, content_hash = plan["stats"][source]
+        manifest.record(source, mtime, size, content_hash, new_ids)
+        # Persist progress regularly so an interrupted run resumes close to where it stopped
+        if time.monotonic() - last_save >= config.MANIFEST_SAVE_INTERVAL_SECONDS:
+            manifest.save()
+            last_save = time.monotonic()
+
+    pipeline = IngestPipeline(vector_db, scheduler, on_file_done=on_file_done,
+                              lexical_index=lexical_index, symbol_index=symbol_index, dedup_index=dedup_index)
+    try:
+        stats = pipeline.run(changed)
+        # A partial sync leaves files outside `paths` as they were chunked
+        if paths is None:
+            manifest.chunker = CHUNKER_VERSION
+    finally:
+        scheduler.shutdown()
+        manifest.save()
+    dedup_index.finish()
+
+    # Cached answers built on these files are now out of date
+    invalidate_sources(plan["removed"] + changed)
+
+    if not stores_text_inline():
+        pruned = BlobStore().prune({entry["content_hash"] for entry in manifest.files.values()})
+        if pruned:
+            print(f"Removed {pruned} blobs no longer referenced by any file.")
+
+    # A watcher batch that changed nothing leaves the snapshot as it is
+    if config.VECTOR_BACKEND == "mmap" and (paths is None or changed or plan["removed"]):
+        header = export_collection(vector_db)
+        print(f"Exported {header['count']} vectors to memory-mapped index at {config.MMAP_INDEX_PATH}")
+
+    print(f"\nIncremental ingestion complete. {stats['chunks']} chunks embedded.")
+    report_throughput("Ingestion", stats["files"], stats["chunks"], stats["seconds"])
+    print(f"Embedding stats: {scheduler.stats}")
+    print(dedup_index.report())
+    if scheduler.cache:
+        print(f"Embedding cache: {scheduler.cache.cache.stats} ({len(scheduler.cache.cache)} entries)")
+    print(f"Total vectors in store: {vector_db._collection.count()}")
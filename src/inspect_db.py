@@ -1,66 +1,273 @@
 # inspect_db.py
+import os
+import sys
+import json
+import math
+import hashlib
+import argparse
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional
 
+import numpy as np
 import chromadb
-import config
+from langchain.docstore.document import Document
 
-def inspect_vector_store():
+# Add the project root to the python path (run as `python src/inspect_db.py` from the project root)
+sys.path.append(os.getcwd())
+
+from src import config
+from src.chunk_store import rehydrate
+
+# Chunks fetched from Chroma per request; memory use is bounded by one page
+PAGE_SIZE = 500
+# Embeddings whose L2 norm is further than this from 1 are reported as not normalized
+NORM_TOLERANCE = 1e-3
+
+def open_collection():
+    """Opens the collection directly, without loading an embedding model."""
+    client = chromadb.PersistentClient(path=config.CHROMA_DB_PATH)
+    return client.get_collection(name=config.CHROMA_COLLECTION_NAME)
+
+def iter_chunks(collection, page_size: int = PAGE_SIZE, embeddings: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Streams every chunk in the collection, one page at a time.
+
+    Yields:
+        {"id", "source", "metadata", "text"} dicts, plus "embedding" (a float32
+        array) when `embeddings` is set. Text stored as byte offsets is
+        rehydrated from the blob store.
+    """
+    include = ["metadatas", "documents"] + (["embeddings"] if embeddings else [])
+    offset = 0
+    while True:
+        page = collection.get(limit=page_size, offset=offset, include=include)
+        if not len(page["ids"]):
+            return
+        docs = rehydrate([
+            Document(id=chunk_id, page_content=text or "", metadata=metadata or {})
+            for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+        ])
+        vectors = page["embeddings"] if embeddings else [None] * len(docs)
+        for doc, vector in zip(docs, vectors):
+            record = {"id": doc.id, "source": doc.metadata.get("source", ""),
+                      "metadata": doc.metadata, "text": doc.page_content}
+            if embeddings:
+                record["embedding"] = np.asarray(vector, dtype=np.float32)
+            yield record
+        offset += len(page["ids"])
+
+class CollectionStats:
     """
-    Connects to the existing ChromaDB and prints its contents for inspection.
+    Aggregate statistics over a stream of chunks, computed in one pass.
+
+    Memory grows with the number of sources and of distinct chunk texts (an
+    8-byte digest each), never with the text or embeddings themselves.
     """
+
+    def __init__(self):
+        self.chunks = 0
+        self.chars = 0
+        self.empty_text = 0
+        self.per_source: Counter = Counter()
+        # Chunk length in characters, bucketed by the next power of two
+        self.length_histogram: Counter = Counter()
+        self.text_digests: Counter = Counter()
+        self.dims: Counter = Counter()
+        self.norms = {"min": math.inf, "max": 0.0, "sum": 0.0, "zero": 0, "non_finite": 0, "not_unit": 0}
+
+    def add(self, record: Dict[str, Any]):
+        text = record["text"]
+        self.chunks += 1
+        self.chars += len(text)
+        self.per_source[record["source"]] += 1
+        if not text:
+            self.empty_text += 1
+        self.length_histogram[1 << max(len(text) - 1, 0).bit_length()] += 1
+        self.text_digests[hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()] += 1
+
+        vector = record.get("embedding")
+        if vector is not None:
+            self.dims[len(vector)] += 1
+            norm = float(np.linalg.norm(vector))
+            if not math.isfinite(norm):
+                self.norms["non_finite"] += 1
+                return
+            self.norms["min"] = min(self.norms["min"], norm)
+            self.norms["max"] = max(self.norms["max"], norm)
+            self.norms["sum"] += norm
+            if norm == 0:
+                self.norms["zero"] += 1
+            if abs(norm - 1) > NORM_TOLERANCE:
+                self.norms["not_unit"] += 1
+
+    def summary(self, top: int = 10) -> Dict[str, Any]:
+        duplicated = [count for count in self.text_digests.values() if count > 1]
+        checked = sum(self.dims.values())
+        finite = checked - self.norms["non_finite"]
+        per_source = sorted(self.per_source.values())
+        return {
+            "chunks": self.chunks,
+            "sources": len(self.per_source),
+            "mean_chunk_chars": round(self.chars / self.chunks, 1) if self.chunks else 0,
+            "empty_text": self.empty_text,
+            "chunks_per_source": {
+                "min": per_source[0] if per_source else 0,
+                "median": per_source[len(per_source) // 2] if per_source else 0,
+                "max": per_source[-1] if per_source else 0,
+                "top": dict(self.per_source.most_common(top)),
+            },
+            "chunk_chars_histogram": {f"<={bucket}": self.length_histogram[bucket]
+                                      for bucket in sorted(self.length_histogram)},
+            "duplicates": {
+                "distinct_texts": len(self.text_digests),
+                "duplicated_texts": len(duplicated),
+                "redundant_chunks": sum(duplicated) - len(duplicated),
+            },
+            "embeddings": {
+                "checked": checked,
+                "dims": dict(self.dims),
+                "norm_min": round(self.norms["min"], 6) if finite else None,
+                "norm_mean": round(self.norms["sum"] / finite, 6) if finite else None,
+                "norm_max": round(self.norms["max"], 6) if finite else None,
+                "zero": self.norms["zero"],
+                "non_finite": self.norms["non_finite"],
+                "not_unit": self.norms["not_unit"],
+            } if checked else None,
+        }
+
+def collection_stats(collection, page_size: int = PAGE_SIZE, embeddings: bool = True, top: int = 10) -> Dict[str, Any]:
+    stats = CollectionStats()
+    for record in iter_chunks(collection, page_size, embeddings=embeddings):
+        stats.add(record)
+    return stats.summary(top)
+
+def export_jsonl(collection, path: str, page_size: int = PAGE_SIZE, embeddings: bool = False) -> int:
+    """Writes one JSON line per chunk. Returns the number of chunks written."""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for record in iter_chunks(collection, page_size, embeddings=embeddings):
+            if embeddings:
+                record["embedding"] = record["embedding"].tolist()
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+def export_parquet(collection, path: str, page_size: int = PAGE_SIZE, embeddings: bool = False) -> int:
+    """
+    Writes the chunks to a Parquet file, one row group per page (requires pyarrow).
+
+    Metadata is stored as a JSON string column, since its keys vary between chunks.
+    Returns the number of chunks written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fields = [pa.field("id", pa.string()), pa.field("source", pa.string()),
+              pa.field("start_line", pa.int64()), pa.field("end_line", pa.int64()),
+              pa.field("metadata", pa.string()), pa.field("text", pa.string())]
+    if embeddings:
+        fields.append(pa.field("embedding", pa.list_(pa.float32())))
+    schema = pa.schema(fields)
+
+    count = 0
+    rows: List[Dict[str, Any]] = []
+    with pq.ParquetWriter(path, schema) as writer:
+        def flush():
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            rows.clear()
+
+        for record in iter_chunks(collection, page_size, embeddings=embeddings):
+            metadata = record["metadata"]
+            row = {"id": record["id"], "source": record["source"],
+                   "start_line": metadata.get("start_line"), "end_line": metadata.get("end_line"),
+                   "metadata": json.dumps(metadata, ensure_ascii=False), "text": record["text"]}
+            if embeddings:
+                row["embedding"] = record["embedding"]
+            rows.append(row)
+            count += 1
+            if len(rows) >= page_size:
+                flush()
+        if rows:
+            flush()
+    return count
+
+def show_chunks(collection, limit: Optional[int], source: Optional[str] = None, page_size: int = PAGE_SIZE):
+    """Prints chunks (optionally only those whose source contains `source`) as they are paged in."""
+    shown = 0
+    for record in iter_chunks(collection, page_size):
+        if limit is not None and shown >= limit:
+            break
+        if source and source not in record["source"]:
+            continue
+        print("\n" + "="*50)
+        print(f"Item ID: {record['id']}")
+        print(f"Source File: {record['source'] or 'N/A'}")
+        print("-" * 50)
+        print("Content (Chunk):")
+        print(record["text"])
+        print("="*50)
+        shown += 1
+
+def ask_limit() -> Optional[int]:
+    while True:
+        limit_str = input("How many items would you like to view? (Enter a number, or 'all'): ")
+        if limit_str.lower() == 'all':
+            return None
+        try:
+            return int(limit_str)
+        except ValueError:
+            print("Invalid input. Please enter a number or 'all'.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, summarize or export the vector store, page by page.")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="Chunks fetched per request.")
+    commands = parser.add_subparsers(dest="command")
+    show = commands.add_parser("show", help="Print chunks (the default).")
+    show.add_argument("--limit", default=None, help="Number of chunks to print, or 'all' (prompts if omitted).")
+    show.add_argument("--source", default=None, help="Only chunks whose source path contains this.")
+    stats = commands.add_parser("stats", help="One-pass aggregate statistics.")
+    stats.add_argument("--no-embeddings", action="store_true", help="Skip the embedding norm checks.")
+    stats.add_argument("--top", type=int, default=10, help="Sources listed by chunk count.")
+    export = commands.add_parser("export", help="Export chunks to .jsonl or .parquet.")
+    export.add_argument("path", help="Output file; the format follows the extension.")
+    export.add_argument("--embeddings", action="store_true", help="Include embedding vectors.")
+    args = parser.parse_args()
+
     print(f"--- Inspecting Vector Store at: {config.CHROMA_DB_PATH} ---")
-    
     try:
-        # 1. Initialize a persistent ChromaDB client
-        client = chromadb.PersistentClient(path=config.CHROMA_DB_PATH)
-        
-        # 2. Get the specific collection
-        collection = client.get_collection(name=config.CHROMA_COLLECTION_NAME)
-        
-        # 3. Get the total number of items
-        count = collection.count()
-        if count == 0:
-            print("The database is empty.")
-            return
-        
-        print(f"Found {count} items in the collection '{config.CHROMA_COLLECTION_NAME}'.")
-        
-        # 4. Ask the user how many items to display
-        while True:
-            try:
-                limit_str = input(f"How many items would you like to view? (Enter a number, or 'all'): ")
-                if limit_str.lower() == 'all':
-                    limit = count
-                    break
-                limit = int(limit_str)
-                break
-            except ValueError:
-                print("Invalid input. Please enter a number or 'all'.")
-
-        # 5. Retrieve the items from the collection
-        # We ask for the documents (the text chunks) and their metadata.
-        # We don't need to see the actual embeddings (the long list of numbers).
-        results = collection.get(
-            limit=limit,
-            include=["metadatas", "documents"]
-        )
-        
-        # 6. Print the results in a readable format
-        for i in range(len(results['ids'])):
-            doc_id = results['ids'][i]
-            metadata = results['metadatas'][i]
-            document_content = results['documents'][i]
-            
-            print("\n" + "="*50)
-            print(f"Item ID: {doc_id}")
-            print(f"Source File: {metadata.get('source', 'N/A')}")
-            print("-" * 50)
-            print("Content (Chunk):")
-            print(document_content)
-            print("="*50)
-        
+        collection = open_collection()
     except Exception as e:
         print(f"\nAn error occurred: {e}")
         print("Please ensure the database exists and the collection name is correct.")
+        return
+    count = collection.count()
+    if count == 0:
+        print("The database is empty.")
+        return
+    print(f"Found {count} items in the collection '{config.CHROMA_COLLECTION_NAME}'.")
+
+    if args.command == "stats":
+        summary = collection_stats(collection, args.page_size, embeddings=not args.no_embeddings, top=args.top)
+        print(json.dumps(summary, indent=2))
+    elif args.command == "export":
+        if args.path.endswith(".parquet"):
+            try:
+                written = export_parquet(collection, args.path, args.page_size, args.embeddings)
+            except ImportError:
+                print("Parquet export requires pyarrow (pip install pyarrow); export to .jsonl instead.")
+                return
+        else:
+            written = export_jsonl(collection, args.path, args.page_size, args.embeddings)
+        print(f"Exported {written} chunks to {args.path}")
+    else:
+        limit = getattr(args, "limit", None)
+        if limit is None:
+            limit = ask_limit()
+        elif limit.lower() == "all":
+            limit = None
+        else:
+            limit = int(limit)
+        show_chunks(collection, limit, getattr(args, "source", None), args.page_size)
 
 if __name__ == "__main__":
-    inspect_vector_store()
\ No newline at end of file
+    main()
@@ -0,0 +1,205 @@
+# src/lexical_index.py
+import os
+import re
+import json
+import math
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+
+from src import config
+from src.chunk_store import rehydrate, stores_text_inline
+
+IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+CAMEL_PART_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+BACKTICK_RE = re.compile(r"`([^`]+)`")
+
+STOPWORDS = frozenset("""
+a an and are as at be by do does for from how i in is it of on or the this that to was what
+when where which who why with we you our can should would could there these those into about
+""".split())
+
+def split_identifier(identifier: str) -> List[str]:
+    """Splits snake_case and camelCase identifiers into lowercase parts."""
+    parts = []
+    for piece in identifier.split("_"):
+        parts.extend(part.lower() for part in CAMEL_PART_RE.findall(piece))
+    return parts
+
+def tokenize(text: str) -> List[str]:
+    """
+    Identifier-aware tokenizer.
+
+    Each identifier yields its full lowercase form plus its snake_case and
+    camelCase parts, so `build_vector_store` matches both the exact name and
+    questions about "vector store". Stopwords and single characters are dropped.
+    """
+    tokens = []
+    for identifier in IDENTIFIER_RE.findall(text):
+        whole = identifier.lower()
+        parts = split_identifier(identifier)
+        for token in [whole] + (parts if len(parts) > 1 else []):
+            if len(token) > 1 and token not in STOPWORDS:
+                tokens.append(token)
+    return tokens
+
+def extract_identifiers(question: str) -> List[str]:
+    """
+    Returns the exact identifiers a question is asking about, if any.
+
+    Backticked spans count, and so does a question that is itself a single
+    identifier such as `CHROMA_COLLECTION_NAME` or `buildVectorStore`.
+    """
+    quoted = [span.strip() for span in BACKTICK_RE.findall(question)]
+    identifiers = [span for span in quoted if IDENTIFIER_RE.fullmatch(span)]
+    if identifiers:
+        return identifiers
+    bare = question.strip().strip("?.!").strip()
+    if IDENTIFIER_RE.fullmatch(bare) and ("_" in bare or len(split_identifier(bare)) > 1):
+        return [bare]
+    return []
+
+class LexicalIndex:
+    """
+    Persistent BM25 inverted index over chunks, stored in SQLite.
+
+    Built and updated at ingest time alongside the vector store. It keeps each
+    chunk's metadata (and its text, when CHUNK_TEXT_STORAGE is "inline"), so
+    lexical hits can be returned as Documents without touching Chroma or the
+    embedding model.
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.2, b: float = 0.75):
+        self.path = path or config.LEXICAL_INDEX_PATH
+        self.k1 = k1
+        self.b = b
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY, source TEXT, length INTEGER NOT NULL,
+                text TEXT NOT NULL, metadata TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id);
+            """
+        )
+        self._conn.commit()
+        self._refresh_stats()
+
+    def _refresh_stats(self):
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks").fetchone()
+        self._doc_count = count
+        self._avg_length = (total / count) if count else 0.0
+
+    def __len__(self) -> int:
+        return self._doc_count
+
+    def add_chunks(self, chunks: Iterable[Document]):
+        """Indexes (or re-indexes) chunks by their `id`."""
+        with self._lock:
+            for chunk in chunks:
+                counts = Counter(tokenize(chunk.page_content))
+                self._delete(chunk.id)
+                self._conn.execute(
+                    "INSERT INTO chunks (chunk_id, source, length, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                    (chunk.id, chunk.metadata.get("source"), sum(counts.values()),
+                     chunk.page_content if stores_text_inline() else "", json.dumps(chunk.metadata)),
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                    [(term, chunk.id, tf) for term, tf in counts.items()],
+                )
+            self._conn.commit()
+            self._refresh_stats()
+
+    def update_metadata(self, patches: Dict[str, dict]):
+        """Merges metadata patches into indexed chunks; a None value removes the key (as in Chroma's update)."""
+        with self._lock:
+            for chunk_id, patch in patches.items():
+                row = self._conn.execute("SELECT metadata FROM chunks WHERE chunk_id = ?", (chunk_id,)).fetchone()
+                if row is None:
+                    continue
+                metadata = json.loads(row[0])
+                metadata.update(patch)
+                metadata = {key: value for key, value in metadata.items() if value is not None}
+                self._conn.execute("UPDATE chunks SET metadata = ? WHERE chunk_id = ?", (json.dumps(metadata), chunk_id))
+            self._conn.commit()
+
+    def remove_chunks(self, chunk_ids: Iterable[str]):
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._delete(chunk_id)
+            self._conn.commit()
+            self._refresh_stats()
+
+    def _delete(self, chunk_id: str):
+        self._conn.execute("DELETE FROM postings WHERE chunk_id = ?", (chunk_id,))
+        self._conn.execute("DELETE FROM chunks WHERE chunk_id = ?", (chunk_id,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+            self._refresh_stats()
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[str, float]]:
+        """Returns the top-k (chunk_id, BM25 score) pairs for a query."""
+        terms = set(tokenize(query))
+        if not terms or not self._doc_count:
+            return []
+        scores: Dict[str, float] = {}
+        with self._lock:
+            for term in terms:
+                rows = self._conn.execute(
+                    "SELECT p.chunk_id, p.tf, c.length FROM postings p "
+                    "JOIN chunks c ON c.chunk_id = p.chunk_id WHERE p.term = ?", (term,)
+                ).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (self._doc_count - len(rows) + 0.5) / (len(rows) + 0.5))
+                for chunk_id, tf, length in rows:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / (self._avg_length or 1))
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def get_documents(self, chunk_ids: List[str]) -> List[Document]:
+        """Fetches indexed chunks as Documents (text rehydrated), in the order requested."""
+        if not chunk_ids:
+            return []
+        placeholders = ",".join("?" * len(chunk_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_id, text, metadata FROM chunks WHERE chunk_id IN ({placeholders})", list(chunk_ids)
+            ).fetchall()
+        by_id = {chunk_id: Document(id=chunk_id, page_content=text, metadata=json.loads(metadata))
+                 for chunk_id, text, metadata in rows}
+        return rehydrate([by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in by_id])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def reciprocal_rank_scores(rankings: List[List[str]], k: int = 60) -> Dict[str, float]:
+    """Fused scores of several ranked ID lists: score(d) = sum over lists of 1 / (k + rank)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return scores
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Fuses several ranked ID lists, best first (see reciprocal_rank_scores)."""
+    scores = reciprocal_rank_scores(rankings, k)
+    return sorted(scores, key=scores.get, reverse=True)
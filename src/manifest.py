@@ -0,0 +1,73 @@
+# src/manifest.py
+import os
+import json
+from typing import Dict, List, Optional
+
+from src import config
+
+MANIFEST_VERSION = 1
+
+class IngestManifest:
+    """
+    Persistent record of every ingested file and the chunk IDs it produced.
+
+    Each entry is keyed by file path and stores the file's mtime, size, content
+    hash and chunk IDs. Incremental ingestion compares the codebase against
+    this record to decide which files need re-chunking and re-embedding.
+    `chunker` is the chunker version the files were last chunked with.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or config.MANIFEST_PATH
+        self.files: Dict[str, dict] = {}
+        self.chunker: Optional[int] = None
+
+    @classmethod
+    def load(cls, path: str = None) -> "IngestManifest":
+        """Loads the manifest from disk, or returns an empty one if none exists."""
+        manifest = cls(path)
+        if os.path.exists(manifest.path):
+            with open(manifest.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            manifest.files = data.get("files", {})
+            manifest.chunker = data.get("chunker")
+        return manifest
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def save(self):
+        """Atomically writes the manifest so a crash never leaves it half-written."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": MANIFEST_VERSION, "chunker": self.chunker, "files": self.files}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def get(self, source: str) -> Optional[dict]:
+        return self.files.get(source)
+
+    def is_unchanged(self, source: str, mtime: float, size: int) -> bool:
+        """Cheap check: the file's mtime and size both match the recorded entry."""
+        entry = self.files.get(source)
+        return entry is not None and entry["mtime"] == mtime and entry["size"] == size
+
+    def record(self, source: str, mtime: float, size: int, content_hash: str, chunk_ids: List[str]):
+        self.files[source] = {
+            "mtime": mtime,
+            "size": size,
+            "content_hash": content_hash,
+            "chunk_ids": list(chunk_ids),
+        }
+
+    def remove(self, source: str) -> List[str]:
+        """Drops a file from the manifest and returns the chunk IDs it owned."""
+        entry = self.files.pop(source, None)
+        return entry["chunk_ids"] if entry else []
+
+    def sources(self) -> List[str]:
+        return list(self.files)
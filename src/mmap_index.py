@@ -0,0 +1,489 @@
+# src/mmap_index.py
+import os
+import json
+import time
+import shutil
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from src import config
+from src.chunk_store import rehydrate
+
+VECTORS_FILE = "vectors.npy"
+CHUNKS_FILE = "chunks.jsonl"
+OFFSETS_FILE = "offsets.npy"
+IDS_FILE = "ids.json"
+HEADER_FILE = "index.json"
+QUANTIZED_FILE = "vectors_int8.npy"
+SCALES_FILE = "scales_int8.npy"
+# Names the live snapshot directory inside the index directory; replaced atomically on export
+CURRENT_FILE = "CURRENT"
+# Rows converted to float32 at a time while building or scanning the int8 tier
+QUANTIZED_BLOCK_ROWS = 16384
+
+class QuantizedTier:
+    """
+    int8 scalar-quantized copy of the snapshot's vectors, used for a fast first pass.
+
+    Each row keeps its first `dims` dimensions, re-normalized, and is scaled
+    so its largest component maps to 127; the per-row scale is kept to undo
+    it. Queries stay float32, so a score is (query . codes) * scale, computed
+    block by block so only QUANTIZED_BLOCK_ROWS rows are widened at a time.
+    """
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray, dims: int):
+        self.codes = codes
+        self.scales = scales
+        self.dims = dims
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, dims: Optional[int] = None, out_dir: Optional[str] = None) -> "QuantizedTier":
+        """Quantizes `vectors`, writing the tier into `out_dir` if given (otherwise kept in memory)."""
+        dims = min(dims or vectors.shape[1], vectors.shape[1])
+        count = len(vectors)
+        if out_dir:
+            codes = np.lib.format.open_memmap(os.path.join(out_dir, QUANTIZED_FILE), mode="w+",
+                                              dtype=np.int8, shape=(count, dims))
+        else:
+            codes = np.empty((count, dims), dtype=np.int8)
+        scales = np.empty(count, dtype=np.float32)
+        for start in range(0, count, QUANTIZED_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + QUANTIZED_BLOCK_ROWS, :dims], dtype=np.float32)
+            norms = np.linalg.norm(block, axis=1, keepdims=True)
+            block = block / np.where(norms == 0, 1, norms)
+            peak = np.abs(block).max(axis=1)
+            scale = np.where(peak == 0, 1, peak / 127).astype(np.float32)
+            codes[start:start + len(block)] = np.rint(block / scale[:, None]).astype(np.int8)
+            scales[start:start + len(block)] = scale
+        if out_dir:
+            codes.flush()
+            np.save(os.path.join(out_dir, SCALES_FILE), scales)
+        return cls(codes, scales, dims)
+
+    @classmethod
+    def load(cls, path: str, dims: int) -> "QuantizedTier":
+        return cls(np.load(os.path.join(path, QUANTIZED_FILE), mmap_mode="r"),
+                   np.load(os.path.join(path, SCALES_FILE)), dims)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes + self.scales.nbytes)
+
+    def scores(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate cosine scores (queries x rows) from the int8 codes."""
+        queries = np.ascontiguousarray(queries[:, :self.dims])
+        count = len(self.codes) if rows is None else len(rows)
+        scores = np.empty((len(queries), count), dtype=np.float32)
+        for start in range(0, count, QUANTIZED_BLOCK_ROWS):
+            picked = slice(start, start + QUANTIZED_BLOCK_ROWS) if rows is None else rows[start:start + QUANTIZED_BLOCK_ROWS]
+            block = np.asarray(self.codes[picked], dtype=np.float32)
+            scores[:, start:start + len(block)] = (queries @ block.T) * self.scales[picked]
+        return scores
+
+def export_collection(vector_db, out_dir: Optional[str] = None, page_size: int = 1000) -> dict:
+    """
+    Snapshots a Chroma collection into a memory-mappable index directory.
+
+    Embeddings are L2-normalized and written to a contiguous float32 .npy
+    file; IDs, metadata and text go to a JSONL sidecar with a byte-offset
+    table for lazy reads. With MMAP_QUANTIZATION = "int8", an int8 tier of
+    the vectors is written too. Each export is a new snapshot directory inside
+    `out_dir`, made live by atomically replacing the CURRENT pointer file, so
+    readers always find a complete snapshot. The previous snapshot is kept until
+    the next export, for readers that resolved the pointer just before the swap.
+
+    Returns:
+        The index header (count, dim, creation time).
+    """
+    out_dir = out_dir or config.MMAP_INDEX_PATH
+    collection = vector_db._collection
+    total = collection.count()
+    os.makedirs(out_dir, exist_ok=True)
+    snapshot = f"snapshot-{time.time_ns()}-{os.getpid()}"
+    tmp_dir = os.path.join(out_dir, snapshot)
+    os.makedirs(tmp_dir)
+
+    vectors = None
+    # One extra slot holds the end of the last record
+    offsets = np.zeros(total + 1, dtype=np.int64)
+    ids, sources = [], []
+    row = 0
+    with open(os.path.join(tmp_dir, CHUNKS_FILE), "wb") as chunks_file:
+        while row < total:
+            page = collection.get(limit=page_size, offset=row, include=["embeddings", "metadatas", "documents"])
+            if not len(page["ids"]):
+                break
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(
+                    os.path.join(tmp_dir, VECTORS_FILE), mode="w+", dtype=np.float32,
+                    shape=(total, embeddings.shape[1]),
+                )
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            vectors[row:row + len(embeddings)] = embeddings / np.where(norms == 0, 1, norms)
+            for chunk_id, metadata, text in zip(page["ids"], page["metadatas"], page["documents"]):
+                offsets[row] = chunks_file.tell()
+                line = json.dumps({"id": chunk_id, "metadata": metadata or {}, "text": text})
+                chunks_file.write(line.encode("utf-8") + b"\n")
+                ids.append(chunk_id)
+                sources.append((metadata or {}).get("source", ""))
+                row += 1
+        offsets[row] = chunks_file.tell()
+
+    dim = int(vectors.shape[1]) if vectors is not None else 0
+    quantization = None
+    if vectors is not None:
+        vectors.flush()
+        if config.MMAP_QUANTIZATION == "int8":
+            tier = QuantizedTier.build(vectors[:row], config.MMAP_QUANTIZED_DIMS, tmp_dir)
+            quantization = {"type": "int8", "dims": tier.dims}
+            del tier
+        del vectors
+    np.save(os.path.join(tmp_dir, OFFSETS_FILE), offsets[:row + 1])
+    with open(os.path.join(tmp_dir, IDS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "sources": sources}, f)
+    header = {"count": row, "dim": dim, "created_at": time.time(),
+              "collection": config.CHROMA_COLLECTION_NAME, "quantization": quantization}
+    with open(os.path.join(tmp_dir, HEADER_FILE), "w", encoding="utf-8") as f:
+        json.dump(header, f)
+
+    # Point readers at the new snapshot; open readers keep their mapping of the old files
+    previous = current_snapshot(out_dir)
+    pointer_tmp = os.path.join(out_dir, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(snapshot)
+    os.replace(pointer_tmp, os.path.join(out_dir, CURRENT_FILE))
+    for name in os.listdir(out_dir):
+        entry = os.path.join(out_dir, name)
+        if name in (snapshot, previous, CURRENT_FILE):
+            continue
+        if os.path.isdir(entry):
+            if name.startswith("snapshot-"):
+                shutil.rmtree(entry, ignore_errors=True)
+        elif name in (VECTORS_FILE, CHUNKS_FILE, OFFSETS_FILE, IDS_FILE, HEADER_FILE, QUANTIZED_FILE, SCALES_FILE):
+            # Snapshot files written straight into out_dir before snapshots had their own directories
+            os.remove(entry)
+    return header
+
+def current_snapshot(path: Optional[str] = None) -> Optional[str]:
+    """Name of the live snapshot directory in the index directory, or None if nothing was exported."""
+    try:
+        with open(os.path.join(path or config.MMAP_INDEX_PATH, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def snapshot_path(path: Optional[str] = None) -> str:
+    """Directory holding the live snapshot's files (the index directory itself for pre-pointer exports)."""
+    path = path or config.MMAP_INDEX_PATH
+    snapshot = current_snapshot(path)
+    return os.path.join(path, snapshot) if snapshot else path
+
+class MmapVectorIndex:
+    """
+    In-process exact vector search over a memory-mapped float32 snapshot.
+
+    Scores are cosine similarities computed as one normalized matrix multiply
+    per batch of queries (a single BLAS call), with top-k selected by
+    `argpartition`. Sources are held in memory so results can be pre-filtered
+    by path prefix before scoring; chunk text is read lazily from the sidecar.
+
+    If the snapshot has an int8 tier (`quantized`), the first pass scans the
+    int8 codes instead, and only the best `rescore_factor * k` rows per query
+    are re-scored against the float32 vectors, so most of the float32 file
+    is never paged in.
+
+    The index loads whichever snapshot is live when it is opened and keeps
+    using it after a re-export. It is reference counted: searches on another
+    thread `acquire` it, and the sidecar is closed once `close` and every
+    matching `release` have been called.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        root = path or config.MMAP_INDEX_PATH
+        while True:
+            self.path = snapshot_path(root)
+            try:
+                self._load()
+                break
+            except FileNotFoundError:
+                # Exports since the pointer was read pruned this snapshot; open the live one
+                if snapshot_path(root) == self.path:
+                    raise
+        # The opener's reference plus one per in-flight acquire
+        self._refs = 1
+        self._refs_lock = threading.Lock()
+
+    def _load(self):
+        with open(os.path.join(self.path, HEADER_FILE), "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+        if self.header["count"]:
+            self.vectors = np.load(os.path.join(self.path, VECTORS_FILE), mmap_mode="r")
+        else:
+            self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.offsets = np.load(os.path.join(self.path, OFFSETS_FILE))
+        with open(os.path.join(self.path, IDS_FILE), "r", encoding="utf-8") as f:
+            sidecar = json.load(f)
+        self.ids: List[str] = sidecar["ids"]
+        self.sources: List[str] = sidecar["sources"]
+        quantization = self.header.get("quantization")
+        self.quantized: Optional[QuantizedTier] = None
+        if quantization and self.header["count"]:
+            self.quantized = QuantizedTier.load(self.path, quantization["dims"])
+        # Opened last, so a load that fails part-way leaves no descriptor behind
+        self._chunks_fd = os.open(os.path.join(self.path, CHUNKS_FILE), os.O_RDONLY)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def rows_with_prefix(self, source_prefix: str) -> np.ndarray:
+        """Row indices whose `source` starts with `source_prefix`."""
+        return np.flatnonzero([source.startswith(source_prefix) for source in self.sources])
+
+    def search(
+        self,
+        query_vectors: Sequence[Sequence[float]],
+        k: int = 4,
+        source_prefix: Optional[str] = None,
+        rows: Optional[np.ndarray] = None,
+        rescore_factor: Optional[int] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Top-k cosine search for a batch of queries: exact, or int8 first pass
+        plus float32 re-scoring when the snapshot has a quantized tier.
+
+        Args:
+            query_vectors: One or more query embeddings (q x dim).
+            k: Results per query.
+            source_prefix: Only consider chunks whose source starts with this.
+            rows: Explicit candidate rows (overrides `source_prefix`).
+            rescore_factor: Shortlist size per result for the int8 tier
+                (defaults to config.MMAP_RESCORE_FACTOR).
+
+        Returns:
+            For each query, (row, score) pairs sorted by descending score.
+        """
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1, norms)
+
+        if rows is None and source_prefix:
+            rows = self.rows_with_prefix(source_prefix)
+        if self.quantized is not None and (rows is None or len(rows)):
+            return self._search_quantized(queries, k, rows, rescore_factor or config.MMAP_RESCORE_FACTOR)
+        candidates = self.vectors if rows is None else self.vectors[rows]
+        if not len(candidates):
+            return [[] for _ in range(len(queries))]
+
+        scores = queries @ candidates.T
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for query_index, picks in enumerate(top):
+            picks = picks[np.argsort(-scores[query_index, picks])]
+            mapped = picks if rows is None else rows[picks]
+            results.append([(int(row), float(scores[query_index, pick])) for row, pick in zip(mapped, picks)])
+        return results
+
+    def _search_quantized(self, queries: np.ndarray, k: int, rows: Optional[np.ndarray],
+                          rescore_factor: int) -> List[List[Tuple[int, float]]]:
+        scores = self.quantized.scores(queries, rows)
+        shortlist = min(k * rescore_factor, scores.shape[1])
+        top = np.argpartition(-scores, shortlist - 1, axis=1)[:, :shortlist]
+        results = []
+        for query_index, picks in enumerate(top):
+            # Sorted rows read the float32 file front to back
+            mapped = np.sort(picks if rows is None else rows[picks])
+            exact = self.vectors[mapped] @ queries[query_index]
+            best = np.argsort(-exact)[:k]
+            results.append([(int(mapped[i]), float(exact[i])) for i in best])
+        return results
+
+    def get_document(self, row: int) -> Document:
+        """Reads one chunk from the sidecar by row number (thread-safe positional read)."""
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        record = json.loads(os.pread(self._chunks_fd, end - start, start))
+        document = Document(id=record["id"], page_content=record["text"] or "", metadata=record["metadata"])
+        return rehydrate([document])[0]
+
+    def search_documents(
+        self, query_vectors: Sequence[Sequence[float]], k: int = 4, source_prefix: Optional[str] = None
+    ) -> List[List[Tuple[Document, float]]]:
+        """Like `search`, but returns (Document, score) pairs."""
+        return [
+            [(self.get_document(row), score) for row, score in hits]
+            for hits in self.search(query_vectors, k=k, source_prefix=source_prefix)
+        ]
+
+    def acquire(self):
+        """Takes a reference, so the index stays open until the matching `release`."""
+        with self._refs_lock:
+            if not self._refs:
+                raise ValueError("index is closed")
+            self._refs += 1
+
+    def release(self):
+        with self._refs_lock:
+            self._refs -= 1
+            if self._refs:
+                return
+        os.close(self._chunks_fd)
+
+    def close(self):
+        """Drops the opener's reference; the sidecar is closed once in-flight searches release theirs."""
+        self.release()
+
+@lru_cache(maxsize=None)
+def _mmap_retriever_class():
+    from langchain_core.retrievers import BaseRetriever
+    from langchain_core.callbacks import CallbackManagerForRetrieverRun
+
+    class MmapRetriever(BaseRetriever):
+        """LangChain retriever over an MmapVectorIndex; a drop-in alternative to the Chroma retriever."""
+        index: Any
+        embedding_model: Any
+        k: int = 4
+        source_prefix: Optional[str] = None
+
+        def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+            vector = self.embedding_model.embed_query(query)
+            return [doc for doc, _ in self.index.search_documents([vector], k=self.k, source_prefix=self.source_prefix)[0]]
+
+    return MmapRetriever
+
+def __getattr__(name: str):
+    # MmapRetriever subclasses LangChain's BaseRetriever (a slow import), so it is only defined on first access
+    if name == "MmapRetriever":
+        return _mmap_retriever_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def mmap_index_exists(path: Optional[str] = None) -> bool:
+    return os.path.exists(os.path.join(snapshot_path(path), HEADER_FILE))
+
+def _perturbed_queries(index: MmapVectorIndex, queries: int, seed: int) -> np.ndarray:
+    """Perturbed copies of stored embeddings, so benchmarks need no embedding calls."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(index), size=min(queries, len(index)), replace=False)
+    base = np.asarray(index.vectors[np.sort(rows)])
+    return base + rng.normal(0, 0.05, size=base.shape).astype(np.float32)
+
+def _percentiles(samples) -> Dict[str, float]:
+    return {f"p{p}": round(float(np.percentile(samples, p)) * 1000, 3) for p in (50, 95, 99)}
+
+def benchmark_against_chroma(
+    vector_db, index: MmapVectorIndex, queries: int = 200, k: int = 4, batch_size: int = 32, seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Compares query latency and recall of the mmap index against Chroma.
+
+    Query vectors are perturbed copies of stored embeddings, so no embedding
+    calls are made. The mmap search is exact, so it serves as ground truth for
+    recall@k of Chroma's approximate HNSW search. Vertex embeddings are unit
+    length, so Chroma's default L2 ranking matches cosine ranking.
+    """
+    query_vectors = _perturbed_queries(index, queries, seed)
+
+    chroma_times, chroma_ids = [], []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        result = vector_db._collection.query(query_embeddings=[vector.tolist()], n_results=k, include=[])
+        chroma_times.append(time.perf_counter() - start)
+        chroma_ids.append(result["ids"][0])
+
+    mmap_times, exact_ids = [], []
+    for vector in query_vectors:
+        start = time.perf_counter()
+        hits = index.search([vector], k=k)[0]
+        mmap_times.append(time.perf_counter() - start)
+        exact_ids.append([index.ids[row] for row, _ in hits])
+
+    start = time.perf_counter()
+    for i in range(0, len(query_vectors), batch_size):
+        index.search(query_vectors[i:i + batch_size], k=k)
+    batched_per_query = (time.perf_counter() - start) / len(query_vectors)
+
+    recall = np.mean([len(set(c) & set(e)) / len(e) for c, e in zip(chroma_ids, exact_ids) if e])
+    return {
+        "vectors": len(index),
+        "dim": index.header["dim"],
+        "queries": len(query_vectors),
+        "k": k,
+        "chroma_ms": _percentiles(chroma_times),
+        "mmap_ms": _percentiles(mmap_times),
+        "mmap_batched_ms_per_query": round(batched_per_query * 1000, 4),
+        "chroma_recall_vs_exact": round(float(recall), 4),
+    }
+
+def _chroma_vector_bytes() -> int:
+    """On-disk size of Chroma's vector segments (the HNSW index directories next to chroma.sqlite3)."""
+    total = 0
+    for name in os.listdir(config.CHROMA_DB_PATH):
+        path = os.path.join(config.CHROMA_DB_PATH, name)
+        if os.path.isdir(path) and len(name) == 36 and name.count("-") == 4:
+            total += sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+    return total
+
+def benchmark_quantization(
+    vector_db,
+    index: MmapVectorIndex,
+    dims_options: Sequence[Optional[int]] = (None, 512, 256),
+    rescore_factors: Sequence[int] = (1, 4, 10),
+    queries: int = 200,
+    k: int = 4,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Recall vs memory vs latency for int8 tiers, against exact float32 search and Chroma.
+
+    Every (dims, rescore factor) pair is measured on the same perturbed
+    queries, one query at a time. Recall@k is against exact float32 search.
+    Memory is the bytes a tier keeps resident for its first pass; Chroma's
+    figure is the on-disk size of its HNSW segments.
+
+    Returns:
+        {"vectors", "dim", "queries", "k", "rows": [...]}; each row has tier,
+        dims, rescore_factor, recall, latency percentiles (ms) and memory_bytes.
+    """
+    query_vectors = _perturbed_queries(index, queries, seed)
+    saved_tier = index.quantized
+
+    def measure(search) -> Tuple[List[List[str]], Dict[str, float]]:
+        ids, times = [], []
+        for vector in query_vectors:
+            start = time.perf_counter()
+            ids.append(search(vector))
+            times.append(time.perf_counter() - start)
+        return ids, _percentiles(times)
+
+    def recall(found: List[List[str]]) -> float:
+        return round(float(np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, exact_ids) if e])), 4)
+
+    rows = []
+    try:
+        index.quantized = None
+        exact_ids, exact_ms = measure(lambda v: [index.ids[row] for row, _ in index.search([v], k=k)[0]])
+        rows.append({"tier": "float32", "dims": index.header["dim"], "rescore_factor": None, "recall": 1.0,
+                     "latency_ms": exact_ms, "memory_bytes": int(index.vectors.nbytes)})
+
+        chroma_ids, chroma_ms = measure(lambda v: vector_db._collection.query(
+            query_embeddings=[v.tolist()], n_results=k, include=[])["ids"][0])
+        rows.append({"tier": "chroma", "dims": index.header["dim"], "rescore_factor": None,
+                     "recall": recall(chroma_ids), "latency_ms": chroma_ms, "memory_bytes": _chroma_vector_bytes()})
+
+        for dims in dims_options:
+            if dims and dims > index.header["dim"]:
+                continue
+            index.quantized = QuantizedTier.build(index.vectors, dims)
+            for factor in rescore_factors:
+                found, latency = measure(lambda v: [index.ids[row] for row, _ in
+                                                    index.search([v], k=k, rescore_factor=factor)[0]])
+                rows.append({"tier": "int8", "dims": index.quantized.dims, "rescore_factor": factor,
+                             "recall": recall(found), "latency_ms": latency,
+                             "memory_bytes": index.quantized.nbytes})
+    finally:
+        index.quantized = saved_tier
+    return {"vectors": len(index), "dim": index.header["dim"], "queries": len(query_vectors), "k": k, "rows": rows}
@@ -0,0 +1,209 @@
+# src/pipeline.py
+import time
+import queue
+import threading
+from typing import Callable, Iterable, List, Optional
+
+from langchain.docstore.document import Document
+
+from src import config, telemetry
+from src.data_loader import chunk_files
+from src.embedding_scheduler import EmbeddingScheduler, estimate_tokens
+from src.vector_store import delete_chunks, update_metadata, upsert_chunks
+
+# Marks the end of a stream between pipeline stages
+_DONE = object()
+
+class IngestPipeline:
+    """
+    Streaming walk -> load -> chunk -> embed -> upsert pipeline.
+
+    Each stage runs in its own thread and hands work to the next through a
+    bounded queue. When the embedder falls behind, the queues fill up and the
+    chunker (and through it the directory walk) blocks, so memory stays flat
+    however large the codebase is. Embedding starts as soon as the first file
+    has been chunked, and several embedding requests run concurrently under
+    the scheduler's rate limits. With a dedup index, duplicate chunks skip
+    embedding and are recorded against their cluster's stored chunk.
+
+    Args:
+        vector_db: The LangChain Chroma store to upsert into.
+        scheduler: EmbeddingScheduler used to vectorize chunk text.
+        on_file_done: Called as on_file_done(source, chunk_ids) once every
+            chunk of a file has been upserted. Calls happen in input order.
+        queue_size: Capacity of each inter-stage queue.
+        lexical_index: Optional LexicalIndex updated alongside the vector store.
+        symbol_index: Optional SymbolIndex updated alongside the vector store.
+        dedup_index: Optional DedupIndex deciding which chunks are duplicates.
+    """
+
+    def __init__(
+        self,
+        vector_db,
+        scheduler: EmbeddingScheduler,
+        on_file_done: Optional[Callable[[str, List[str]], None]] = None,
+        queue_size: Optional[int] = None,
+        lexical_index=None,
+        symbol_index=None,
+        dedup_index=None,
+    ):
+        self.vector_db = vector_db
+        self.dedup_index = dedup_index
+        self.lexical_index = lexical_index
+        self.symbol_index = symbol_index
+        self.scheduler = scheduler
+        self.on_file_done = on_file_done
+        queue_size = queue_size or config.PIPELINE_QUEUE_SIZE
+        self._file_queue = queue.Queue(maxsize=queue_size)
+        self._upsert_queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._errors = []
+        self.stats = {"files": 0, "failed_files": 0, "chunks": 0, "duplicates": 0, "batches": 0}
+
+    def run(self, file_paths: Iterable[str], workers: Optional[int] = None) -> dict:
+        """
+        Streams files through the pipeline and blocks until all are stored.
+
+        Returns:
+            Counters for files, failed files, chunks embedded, duplicates and
+            embedding batches, plus the elapsed seconds.
+        """
+        start = time.perf_counter()
+        stages = [
+            threading.Thread(target=self._guard, args=(self._chunk_stage, file_paths, workers),
+                             name="ingest-chunk", daemon=True),
+            threading.Thread(target=self._guard, args=(self._embed_stage,), name="ingest-embed", daemon=True),
+            threading.Thread(target=self._guard, args=(self._upsert_stage,), name="ingest-upsert", daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+        for stage in stages:
+            stage.join()
+
+        if self._errors:
+            raise self._errors[0]
+        self.stats["seconds"] = round(time.perf_counter() - start, 3)
+        return self.stats
+
+    def _guard(self, stage, *args):
+        """Runs a stage, and on failure stops the other stages instead of deadlocking them."""
+        try:
+            stage(*args)
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """Blocking put that gives up once the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _chunk_stage(self, file_paths, workers):
+        try:
+            for source, chunks, error in chunk_files(file_paths, workers=workers):
+                print(f"-> Processing file: {source}")
+                if error:
+                    print(f"   !!! Error processing file {source}: {error}")
+                    self.stats["failed_files"] += 1
+                    continue
+                print(f"   ...found {len(chunks)} chunks.")
+                if not self._put(self._file_queue, (source, chunks)):
+                    return
+        finally:
+            self._put(self._file_queue, _DONE)
+
+    def _embed_stage(self):
+        batch: List[Document] = []
+        batch_tokens = 0
+        # Files whose chunks have all been placed into a batch, waiting on that batch
+        closing: List[tuple] = []
+        # (chunk, canonical ID) of duplicates seen since the last batch was submitted
+        duplicates: List[tuple] = []
+        try:
+            while True:
+                item = self._get(self._file_queue)
+                if item is _DONE:
+                    break
+                source, chunks = item
+                if self.dedup_index is not None:
+                    canonical_ids = self.dedup_index.assign_chunks(chunks)
+                else:
+                    canonical_ids = [None] * len(chunks)
+                for chunk, canonical_id in zip(chunks, canonical_ids):
+                    if canonical_id is not None:
+                        duplicates.append((chunk, canonical_id))
+                        continue
+                    tokens = estimate_tokens(chunk.page_content)
+                    if batch and not self.scheduler.batch_fits(len(batch) + 1, batch_tokens + tokens):
+                        self._submit_batch(batch, closing, duplicates)
+                        batch, batch_tokens, closing, duplicates = [], 0, [], []
+                    batch.append(chunk)
+                    batch_tokens += tokens
+                closing.append((source, [chunk.id for chunk in chunks]))
+            if batch or closing:
+                self._submit_batch(batch, closing, duplicates)
+        finally:
+            self._put(self._upsert_queue, _DONE)
+
+    def _submit_batch(self, batch: List[Document], closing: List[tuple], duplicates: List[tuple]):
+        """
+        Starts embedding a batch; the upsert stage waits on the results in order.
+        A duplicate's canonical chunk is in this batch or an earlier one, so it
+        is stored by the time the duplicate is recorded against it.
+        """
+        future = None
+        if batch:
+            self.stats["batches"] += 1
+            print(f"--> Embedding batch {self.stats['batches']} ({len(batch)} chunks)...")
+            telemetry.count("embedding_batches")
+            future = self.scheduler.submit([chunk.page_content for chunk in batch])
+        self._put(self._upsert_queue, (batch, future, closing, duplicates))
+
+    def _upsert_stage(self):
+        while True:
+            item = self._get(self._upsert_queue)
+            if item is _DONE:
+                return
+            batch, future, closing, duplicates = item
+            if batch:
+                upsert_chunks(self.vector_db, batch, future.result())
+                if self.lexical_index is not None:
+                    with telemetry.span("lexical_index", chunks=len(batch)):
+                        self.lexical_index.add_chunks(batch)
+                if self.symbol_index is not None:
+                    self.symbol_index.add_chunks(batch)
+                self.stats["chunks"] += len(batch)
+            if duplicates:
+                self._record_duplicates(duplicates)
+            for source, chunk_ids in closing:
+                self.stats["files"] += 1
+                if self.on_file_done:
+                    self.on_file_done(source, chunk_ids)
+
+    def _record_duplicates(self, duplicates: List[tuple]):
+        """Lists duplicates on their canonical chunks; their symbols are indexed under their own location."""
+        chunks = [chunk for chunk, _ in duplicates]
+        # Stored as canonical by an interrupted run, before the chunk they now duplicate was recorded
+        delete_chunks(self.vector_db, [chunk.id for chunk in chunks])
+        if self.lexical_index is not None:
+            self.lexical_index.remove_chunks(chunk.id for chunk in chunks)
+        if self.symbol_index is not None:
+            self.symbol_index.add_chunks(chunks)
+        patches = self.dedup_index.duplicate_patches(canonical_id for _, canonical_id in duplicates)
+        update_metadata(self.vector_db, patches)
+        if self.lexical_index is not None:
+            self.lexical_index.update_metadata(patches)
+        self.stats["duplicates"] += len(chunks)
@@ -0,0 +1,164 @@
+# src/query_log.py
+import os
+import glob
+import datetime
+import gzip
+import json
+import time
+import queue
+import atexit
+import shutil
+import threading
+from typing import List, Optional
+
+from langchain.docstore.document import Document
+
+from src import config, telemetry
+
+_STOP = object()
+
+class QueryLogger:
+    """
+    Appends structured query records to a JSONL file from a background thread.
+
+    `log` only enqueues, so the request path never touches the disk; if the
+    queue is full the record is dropped and counted rather than blocking.
+    The writer thread batches records, flushes at least every
+    `flush_interval` seconds, and rotates the file when it exceeds
+    `max_bytes` or `max_age_seconds`. Rotated files are gzipped and only the
+    newest `backups` are kept. `close` (also run at exit) drains the queue.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_bytes: Optional[int] = None,
+        max_age_seconds: Optional[float] = None,
+        backups: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        flush_interval: float = 1.0,
+    ):
+        self.path = path or config.QUERY_LOG_PATH
+        self.max_bytes = max_bytes or config.QUERY_LOG_MAX_BYTES
+        self.max_age_seconds = max_age_seconds or config.QUERY_LOG_MAX_AGE_SECONDS
+        self.backups = config.QUERY_LOG_BACKUPS if backups is None else backups
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size or config.QUERY_LOG_QUEUE_SIZE)
+        self.stats = {"logged": 0, "dropped": 0, "rotations": 0}
+        self._file = None
+        self._opened_at = 0.0
+        self._thread = threading.Thread(target=self._run, name="query-log", daemon=True)
+        self._thread.start()
+
+    def log(self, record: dict):
+        """Queues a record for writing; never blocks."""
+        record.setdefault("ts", time.strftime("%Y-%m-%dT%H:%M:%S"))
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.stats["dropped"] += 1
+            telemetry.count("query_log_dropped")
+
+    def close(self, timeout: float = 10.0):
+        """Writes everything still queued, closes the file and stops the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened_at = time.time()
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                record = None
+            if record is _STOP:
+                break
+            if record is not None:
+                self._write(record)
+                # Drain whatever else is already queued before touching the disk again
+                while True:
+                    try:
+                        record = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if record is _STOP:
+                        self._shutdown()
+                        return
+                    self._write(record)
+            if self._file is not None and time.monotonic() - last_flush >= self.flush_interval:
+                self._file.flush()
+                last_flush = time.monotonic()
+        self._shutdown()
+
+    def _write(self, record: dict):
+        try:
+            if self._file is None:
+                self._open()
+            elif self._should_rotate():
+                self._rotate()
+            self._file.write(json.dumps(record, default=str) + "\n")
+            self.stats["logged"] += 1
+        except Exception as e:
+            # Logging must never take the writer thread down
+            self.stats["dropped"] += 1
+            print(f"   !!! Query log write failed: {e}")
+
+    def _should_rotate(self) -> bool:
+        return (self._file.tell() >= self.max_bytes
+                or time.time() - self._opened_at >= self.max_age_seconds)
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}.{datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{ext}"
+        os.replace(self.path, rotated)
+        with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated)
+        self.stats["rotations"] += 1
+        for old in sorted(glob.glob(f"{base}.*{ext}.gz"))[:-self.backups or None]:
+            os.remove(old)
+        self._open()
+
+    def _shutdown(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def make_record(
+    question: str,
+    docs: List[Document],
+    answer: str,
+    cached: bool = False,
+    **timings: float,
+) -> dict:
+    """Builds a query log record; timings are given in seconds, e.g. total_seconds=1.2."""
+    return {
+        "question": question,
+        "cached": cached,
+        "chunk_ids": [doc.id for doc in docs],
+        "sources": [doc.metadata.get("source") for doc in docs],
+        "timings": {name: round(value, 4) for name, value in timings.items() if value is not None},
+        "answer": answer,
+    }
+
+_query_logger: Optional[QueryLogger] = None
+_query_logger_lock = threading.Lock()
+
+def get_query_logger() -> QueryLogger:
+    """Returns the process-wide query logger, starting its writer thread on first use."""
+    global _query_logger
+    with _query_logger_lock:
+        if _query_logger is None:
+            _query_logger = QueryLogger()
+            atexit.register(_query_logger.close)
+        return _query_logger
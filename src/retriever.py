@@ -1,34 +1,30 @@
 # src/retriever.py
+from __future__ import annotations
 
 import os
-import re
-import datetime
-from langchain_google_vertexai import VertexAI
-from langchain_community.vectorstores import Chroma
-from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.output_parsers import StrOutputParser
+import time
+import asyncio
+import threading
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, AsyncIterator, Iterable, Iterator, List, Optional, Tuple
+from langchain.docstore.document import Document
 
-from src import config
-from src.vector_store import get_embedding_model
+from src import config, db_versions, telemetry
+from src.context import assemble_context
+from src.embedding_cache import embed_queries
+from src.query_log import get_query_logger, make_record
+from src.answer_cache import CachedAnswer, SemanticAnswerCache, get_answer_cache
+from src.lexical_index import LexicalIndex, extract_identifiers, reciprocal_rank_scores
+from src.mmap_index import MmapVectorIndex, current_snapshot, mmap_index_exists
+from src.symbols import Symbol, SymbolIndex, extract_symbol_query, format_symbol_answer
+from src.vector_store import get_embedding_model, get_vector_store, query_by_vectors, get_chunks, existing_chunk_ids
 
-def get_retriever():
-    """Initializes and returns a retriever for the existing ChromaDB vector store."""
-    print("Connecting to existing vector store...")
-    vector_db = Chroma(
-        persist_directory=config.CHROMA_DB_PATH,
-        embedding_function=get_embedding_model(),
-        collection_name=config.CHROMA_COLLECTION_NAME,
-    )
-    return vector_db.as_retriever(search_kwargs={"k": 4})
+# The LLM client, Chroma and LangChain's runnables take seconds to import between them, and
+# symbol or identifier questions never need them: they are imported on first use
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import Chroma
 
-def create_rag_chain(retriever):
-    """Creates the main RAG chain for question answering."""
-    # This function is slightly simplified to just build the chain
-    credentials = config.get_credentials()
-    llm = VertexAI(model_name=config.GENERATIVE_MODEL_NAME, temperature=0.1, credentials=credentials)
-
-    prompt_template = """
+PROMPT_TEMPLATE = """
     You are an expert software developer assistant. Your task is to answer questions about a codebase.
     Use ONLY the following pieces of retrieved context to answer the question.
     If you don't know the answer from the context provided, just say that you don't know. 
@@ -42,61 +38,504 @@ def create_rag_chain(retriever):
 
     ANSWER:
     """
-    prompt = PromptTemplate.from_template(prompt_template)
 
+def get_llm():
+    """Initializes and returns the Vertex AI generative model (or the offline fake when MODEL_BACKEND is "fake")."""
+    if config.MODEL_BACKEND == "fake":
+        from src.fakes import FakeStreamingLLM
+
+        return FakeStreamingLLM(
+            first_token_seconds=config.FAKE_LLM_FIRST_TOKEN_SECONDS,
+            token_seconds=config.FAKE_LLM_TOKEN_SECONDS,
+            tokens=config.FAKE_LLM_TOKENS,
+        )
+    from langchain_google_vertexai import VertexAI
+
+    credentials = config.get_credentials()
+    return VertexAI(model_name=config.GENERATIVE_MODEL_NAME, temperature=0.1, credentials=credentials)
+
+def create_answer_chain(llm):
+    """Builds the LLM -> text chain. Expects an already formatted prompt as input."""
+    from langchain_core.output_parsers import StrOutputParser
+
+    return llm | StrOutputParser()
+
+def create_generation_chain(llm):
+    """Builds the prompt -> LLM -> text chain. Expects {"context": ..., "question": ...} as input."""
+    return create_prompt() | create_answer_chain(llm)
+
+def create_prompt():
+    """Builds the RAG prompt template ({context} and {question})."""
+    from langchain_core.prompts import PromptTemplate
+
+    return PromptTemplate.from_template(PROMPT_TEMPLATE)
+
+@lru_cache(maxsize=None)
+def _service_retriever_class():
+    from langchain_core.retrievers import BaseRetriever
+    from langchain_core.callbacks import CallbackManagerForRetrieverRun
+
+    class ServiceRetriever(BaseRetriever):
+        """LangChain retriever backed by the RetrievalService (hybrid search and lexical fast path included)."""
+        service: Any
+        k: int = 4
+
+        def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+            return self.service.retrieve(query, k=self.k)
+
+    return ServiceRetriever
+
+def __getattr__(name: str):
+    # ServiceRetriever subclasses LangChain's BaseRetriever, so the class is only defined on first access
+    if name == "ServiceRetriever":
+        return _service_retriever_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_retriever():
+    """Returns a LangChain retriever over the existing vector store, reusing the warm service clients."""
+    return _service_retriever_class()(service=get_retrieval_service(), k=4)
+
+def create_rag_chain(retriever):
+    """Creates the main RAG chain for question answering."""
+    from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+
+    # This function is slightly simplified to just build the chain
     rag_chain = (
-        {"context": retriever, "question": RunnablePassthrough()}
-        | prompt
-        | llm
-        | StrOutputParser()
+        {"context": retriever | RunnableLambda(assemble_context), "question": RunnablePassthrough()}
+        | create_generation_chain(get_llm())
     )
     return rag_chain
 
-def _sanitize_filename(text: str) -> str:
-    """Helper function to create a safe filename from a question."""
-    # Remove non-alphanumeric characters
-    text = re.sub(r'[^\w\s-]', '', text).strip()
-    # Replace spaces with underscores and limit length
-    return text.replace(' ', '_')[:50]
+def mark_match(doc: Document, match: str, score: float) -> Document:
+    """
+    Records how a chunk was retrieved, for callers that show rankings: `match`
+    is "symbol", "identifier" (BM25), "hybrid" (reciprocal rank fusion) or
+    "vector" (cosine similarity), and `score` is that path's relevance score.
+    """
+    doc.metadata["match"] = match
+    doc.metadata["score"] = round(float(score), 4)
+    return doc
+
+class RetrievalService:
+    """
+    Long-lived query service holding warm embedding, vector-store and LLM clients.
+
+    Clients are created once, on first use, and reused for every question.
+    Retrieval embeds the question once and runs one vector search; the
+    retrieved documents are then passed straight into generation instead of
+    being fetched again by the chain.
+
+    When the semantic answer cache is enabled, `answer` first checks it with
+    the question's embedding and skips search and generation on a hit.
+
+    In "hybrid" mode, vector results are fused with BM25 results from the
+    lexical index. Questions naming an exact identifier are answered from the
+    lexical index alone, with no embedding call, and definition questions
+    ("Where is X defined?") are resolved from the symbol index; `answer`
+    then replies without calling the LLM either.
+
+    With VECTOR_BACKEND = "mmap", vector search runs in-process against the
+    memory-mapped snapshot instead of going through Chroma.
+    """
+
+    def __init__(self, k: int = 4, answer_cache: Optional[SemanticAnswerCache] = None):
+        self.k = k
+        # The store version this service reads; its clients are opened lazily, always against these paths
+        self.db_path = config.CHROMA_DB_PATH
+        self.paths = db_versions.store_paths(self.db_path)
+        if answer_cache is None and config.ANSWER_CACHE_ENABLED:
+            answer_cache = get_answer_cache()
+        self.answer_cache = answer_cache
+        self._lock = threading.Lock()
+        self._embedding_model = None
+        self._vector_db = None
+        self._llm = None
+        self._answer_chain = None
+        self._prompt = None
+        self._lexical_index = None
+        self._symbol_index = None
+        self._mmap_index = None
+        self._mmap_version = None
+
+    @property
+    def embedding_model(self):
+        with self._lock:
+            if self._embedding_model is None:
+                self._embedding_model = get_embedding_model()
+            return self._embedding_model
+
+    @property
+    def vector_db(self) -> Chroma:
+        embedding_model = self.embedding_model
+        with self._lock:
+            if self._vector_db is None:
+                print("Connecting to existing vector store...")
+                self._vector_db = get_vector_store(embedding_model, self.db_path)
+            return self._vector_db
+
+    @property
+    def answer_chain(self):
+        """LLM -> text chain; prompts are built separately so prompt assembly can be timed on its own."""
+        with self._lock:
+            if self._answer_chain is None:
+                self._llm = get_llm()
+                self._answer_chain = create_answer_chain(self._llm)
+            return self._answer_chain
+
+    @property
+    def prompt(self):
+        with self._lock:
+            if self._prompt is None:
+                self._prompt = create_prompt()
+            return self._prompt
+
+    @property
+    def lexical_index(self) -> Optional[LexicalIndex]:
+        """The ingest-time BM25 index, or None if ingestion hasn't built one yet."""
+        with self._lock:
+            if self._lexical_index is None and os.path.exists(self.paths["LEXICAL_INDEX_PATH"]):
+                self._lexical_index = LexicalIndex(self.paths["LEXICAL_INDEX_PATH"])
+            return self._lexical_index
+
+    @property
+    def symbol_index(self) -> Optional[SymbolIndex]:
+        """The ingest-time symbol table, or None if ingestion hasn't built one yet."""
+        with self._lock:
+            if self._symbol_index is None and os.path.exists(self.paths["SYMBOL_INDEX_PATH"]):
+                self._symbol_index = SymbolIndex(self.paths["SYMBOL_INDEX_PATH"])
+            return self._symbol_index
+
+    def acquire_mmap_index(self) -> Optional[MmapVectorIndex]:
+        """
+        The memory-mapped snapshot, reloaded whenever ingestion re-exports it,
+        with a reference taken for the caller, who must `release()` it. A
+        replaced snapshot is closed once the searches still using it finish.
+        """
+        path = self.paths["MMAP_INDEX_PATH"]
+        if config.VECTOR_BACKEND != "mmap" or not mmap_index_exists(path):
+            return None
+        version = current_snapshot(path) or path
+        with self._lock:
+            if self._mmap_version != version:
+                if self._mmap_index is not None:
+                    self._mmap_index.close()
+                self._mmap_index = MmapVectorIndex(path)
+                self._mmap_version = version
+            self._mmap_index.acquire()
+            return self._mmap_index
+
+    def vector_search(self, vector: List[float], k: int) -> List[Document]:
+        """Nearest chunks for a query embedding, from the configured backend."""
+        return self.vector_search_many([vector], k)[0]
+
+    def vector_search_many(self, vectors: List[List[float]], k: int) -> List[List[Document]]:
+        """Nearest chunks for a batch of query embeddings, in one backend call."""
+        index = self.acquire_mmap_index()
+        with telemetry.span("vector_search", queries=len(vectors)):
+            if index is not None:
+                try:
+                    hits = index.search_documents(vectors, k=k)
+                finally:
+                    index.release()
+            else:
+                # Chroma returns squared L2 distances; for unit vectors, cosine = 1 - d / 2
+                hits = [[(doc, 1 - distance / 2) for doc, distance in pairs]
+                        for pairs in query_by_vectors(self.vector_db, vectors, k=k)]
+        return [[mark_match(doc, "vector", score) for doc, score in pairs] for pairs in hits]
+
+    def lexical_lookup(self, question: str, k: Optional[int] = None) -> Optional[List[Document]]:
+        """
+        Fast path for identifier lookups: BM25 only, no embedding call.
+
+        Returns None when the question doesn't name an identifier, or when no
+        indexed chunk contains it verbatim, so callers fall back to full retrieval.
+        """
+        if not config.LEXICAL_FAST_PATH:
+            return None
+        identifiers = extract_identifiers(question)
+        index = self.lexical_index if identifiers else None
+        if index is None:
+            return None
+        with telemetry.span("lexical_search"):
+            hits = dict(index.search(" ".join(identifiers), k=config.HYBRID_FETCH_K))
+            docs = [
+                mark_match(doc, "identifier", hits[doc.id]) for doc in index.get_documents(list(hits))
+                if any(identifier in doc.page_content for identifier in identifiers)
+            ]
+        telemetry.count("lexical_fast_path_hits" if docs else "lexical_fast_path_misses")
+        return docs[:k or self.k] or None
+
+    def symbol_lookup(self, question: str) -> Optional[Tuple[str, List[Symbol], List[Document]]]:
+        """
+        Fast path for definition questions: the symbol index only, no model calls.
+
+        Returns (name, symbols, chunks defining them), or None when the question
+        isn't a definition question or the name isn't in the index.
+        """
+        if not config.SYMBOL_FAST_PATH:
+            return None
+        name = extract_symbol_query(question)
+        index = self.symbol_index if name else None
+        if index is None:
+            return None
+        with telemetry.span("symbol_lookup"):
+            symbols = index.lookup(name)
+            docs = get_chunks(self.vector_db, list(dict.fromkeys(s.chunk_id for s in symbols))) if symbols else []
+            for doc in docs:
+                mark_match(doc, "symbol", 1.0)
+        telemetry.count("symbol_fast_path_hits" if symbols else "symbol_fast_path_misses")
+        return (name, symbols, docs) if symbols else None
+
+    def embed_question(self, question: str) -> List[float]:
+        with telemetry.span("query_embed"):
+            return self.embedding_model.embed_query(question)
+
+    def embed_questions(self, questions: List[str]) -> List[List[float]]:
+        """Embeds many questions in batched calls (cache hits skip the API entirely)."""
+        with telemetry.span("query_embed", queries=len(questions)):
+            return embed_queries(self.embedding_model, questions)
+
+    def retrieve(self, question: str, k: Optional[int] = None) -> List[Document]:
+        """Symbol or lexical fast path if one applies, otherwise one query embedding and one search."""
+        resolved = self.symbol_lookup(question)
+        if resolved is not None:
+            return resolved[2][:k or self.k]
+        docs = self.lexical_lookup(question, k)
+        if docs is not None:
+            return docs
+        return self.retrieve_by_vector(self.embed_question(question), k, question=question)
+
+    def retrieve_by_vector(
+        self, vector: List[float], k: Optional[int] = None, question: Optional[str] = None
+    ) -> List[Document]:
+        """
+        Search for an already-embedded question. Returned Documents carry their chunk IDs.
+
+        If `question` is given and hybrid retrieval is enabled, BM25 results for
+        it are fused with the vector results by reciprocal rank fusion.
+        """
+        return self.retrieve_many_by_vector([vector], k, questions=[question])[0]
+
+    def retrieve_many_by_vector(
+        self, vectors: List[List[float]], k: Optional[int] = None, questions: Optional[List[Optional[str]]] = None
+    ) -> List[List[Document]]:
+        """Batched form of `retrieve_by_vector`: one vector search call for all queries."""
+        k = k or self.k
+        questions = questions or [None] * len(vectors)
+        hybrid = config.RETRIEVAL_MODE == "hybrid" and any(questions)
+        index = self.lexical_index if hybrid else None
+        fetch_k = max(k, config.HYBRID_FETCH_K) if index is not None else k
+        vector_results = self.vector_search_many(vectors, fetch_k)
+        if index is None:
+            return [docs[:k] for docs in vector_results]
+        return [
+            self._fuse(index, question, docs, k) if question else docs[:k]
+            for question, docs in zip(questions, vector_results)
+        ]
+
+    def _fuse(self, index: LexicalIndex, question: str, vector_docs: List[Document], k: int) -> List[Document]:
+        with telemetry.span("lexical_search"):
+            lexical_ids = [chunk_id for chunk_id, _ in index.search(question, k=max(k, config.HYBRID_FETCH_K))]
+        scores = reciprocal_rank_scores([[doc.id for doc in vector_docs], lexical_ids], k=config.RRF_K)
+        fused_ids = sorted(scores, key=scores.get, reverse=True)[:k]
+        by_id = {doc.id: doc for doc in vector_docs}
+        missing = [chunk_id for chunk_id in fused_ids if chunk_id not in by_id]
+        by_id.update((doc.id, doc) for doc in index.get_documents(missing))
+        return [mark_match(by_id[chunk_id], "hybrid", scores[chunk_id]) for chunk_id in fused_ids if chunk_id in by_id]
+
+    def prepare(
+        self, question: str, symbol_fast_path: bool = True
+    ) -> Tuple[Optional[List[float]], Optional[CachedAnswer], List[Document]]:
+        """
+        Resolves everything needed before generation.
+
+        Args:
+            question: The user's question.
+            symbol_fast_path: Try `symbol_lookup` first. Callers that already
+                ran it (to answer definition questions themselves) pass False.
+
+        Returns:
+            (question vector, cached answer, documents). The vector is None when
+            a symbol or lexical fast path answered without embedding; the cached
+            answer is None unless a near-duplicate question was answered before.
+        """
+        resolved = self.symbol_lookup(question) if symbol_fast_path else None
+        if resolved is not None:
+            return None, None, resolved[2][:self.k]
+        docs = self.lexical_lookup(question)
+        if docs is not None:
+            return None, None, docs
+        vector = self.embed_question(question)
+        cached = self.cached_answer(vector)
+        if cached is not None:
+            return vector, cached, cached.docs
+        return vector, None, self.retrieve_by_vector(vector, question=question)
+
+    def cached_answer(self, vector: List[float]) -> Optional[CachedAnswer]:
+        """Looks up a cached answer for a near-duplicate question whose chunks are unchanged."""
+        if self.answer_cache is None:
+            return None
+        return self.answer_cache.lookup(vector, validate=self._chunks_unchanged)
+
+    def remember(self, question: str, vector: Optional[List[float]], docs: List[Document], answer: str):
+        """Stores a freshly generated answer in the semantic cache."""
+        if self.answer_cache is not None and vector is not None:
+            self.answer_cache.store(question, vector, docs, answer)
+
+    def _chunks_unchanged(self, chunk_ids: List[str]) -> bool:
+        # Chunk IDs are derived from content, so any edit to a source removes the old IDs
+        return len(existing_chunk_ids(self.vector_db, chunk_ids)) == len(set(chunk_ids))
+
+    def build_prompt(self, question: str, docs: List[Document]):
+        """Formats the RAG prompt: retrieved chunks are merged and packed to the context budget first."""
+        with telemetry.span("prompt_build", chunks=len(docs)):
+            return self.prompt.invoke({"context": assemble_context(docs), "question": question})
+
+    def generate(self, question: str, docs: List[Document]) -> str:
+        """Generates an answer from already-retrieved context."""
+        prompt = self.build_prompt(question, docs)
+        with telemetry.span("generation"):
+            return self.answer_chain.invoke(prompt)
+
+    def stream(self, question: str, docs: List[Document]) -> Iterator[str]:
+        """Streams an answer from already-retrieved context."""
+        return _timed_stream(self.answer_chain.stream(self.build_prompt(question, docs)))
+
+    async def aprepare(
+        self, question: str, symbol_fast_path: bool = True
+    ) -> Tuple[Optional[List[float]], Optional[CachedAnswer], List[Document]]:
+        """Async `prepare`. Embedding and search are blocking client calls, so they run on a worker thread."""
+        return await asyncio.to_thread(self.prepare, question, symbol_fast_path)
+
+    def astream(self, question: str, docs: List[Document]) -> AsyncIterator[str]:
+        """Streams an answer from already-retrieved context without blocking the event loop."""
+        return _atimed_stream(self.answer_chain.astream(self.build_prompt(question, docs)))
+
+    async def agenerate(self, question: str, docs: List[Document]) -> str:
+        """Async `generate`."""
+        prompt = self.build_prompt(question, docs)
+        with telemetry.span("generation"):
+            return await self.answer_chain.ainvoke(prompt)
+
+    def answer(self, question: str) -> Tuple[str, List[Document]]:
+        """
+        Retrieve-then-generate: returns the answer and the documents it was based on.
+
+        Definition questions found in the symbol index are answered from the
+        index directly, without the LLM.
+        """
+        start = time.perf_counter()
+        resolved = self.symbol_lookup(question)
+        if resolved is not None:
+            name, symbols, docs = resolved
+            answer = format_symbol_answer(name, symbols, docs)
+            get_query_logger().log(make_record(question, docs, answer,
+                                               total_seconds=time.perf_counter() - start))
+            return answer, docs
+        vector, cached, docs = self.prepare(question, symbol_fast_path=False)
+        retrieved = time.perf_counter()
+        if cached is not None:
+            answer = cached.answer
+        else:
+            answer = self.generate(question, docs)
+            self.remember(question, vector, docs, answer)
+        get_query_logger().log(make_record(
+            question, docs, answer, cached=cached is not None,
+            retrieve_seconds=retrieved - start, total_seconds=time.perf_counter() - start,
+        ))
+        return answer, docs
+
+def _timed_stream(chunks: Iterable[str]) -> Iterator[str]:
+    """Passes a token stream through, recording time-to-first-token and total generation time."""
+    if not telemetry.enabled():
+        yield from chunks
+        return
+    start = time.perf_counter()
+    first = True
+    with telemetry.span("generation"):
+        for chunk in chunks:
+            if first:
+                telemetry.observe("time_to_first_token", time.perf_counter() - start)
+                first = False
+            yield chunk
+
+async def _atimed_stream(chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Async form of `_timed_stream`."""
+    start = time.perf_counter()
+    first = True
+    try:
+        with telemetry.span("generation"):
+            async for chunk in chunks:
+                if first:
+                    telemetry.observe("time_to_first_token", time.perf_counter() - start)
+                    first = False
+                yield chunk
+    finally:
+        await chunks.aclose()
+
+_service: Optional[RetrievalService] = None
+_service_lock = threading.Lock()
+
+def get_retrieval_service() -> RetrievalService:
+    """
+    Returns the process-wide RetrievalService, creating it on first use.
+
+    After a blue/green switch (see src/db_versions.py) a new service is
+    created for the new store; callers still holding the old one finish
+    against the old store.
+    """
+    global _service
+    db_versions.refresh()
+    with _service_lock:
+        if _service is None or _service.db_path != config.CHROMA_DB_PATH:
+            _service = RetrievalService()
+        return _service
 
 def generate_answer_with_logging(question: str):
     """
-    1. Retrieves context for a question.
-    2. Logs the question and retrieved context to a file.
-    3. Invokes the RAG chain to generate and stream the answer.
+    1. Retrieves context for a question (or reuses a cached answer).
+    2. Streams the answer.
+    3. Queues a structured record of the query for the background query log.
     """
     print(f"\n> Processing question: '{question}'...")
-    
-    # Ensure the logs directory exists
-    os.makedirs("logs", exist_ok=True)
-    
-    # --- Part 1: Retrieve the context ---
-    retriever = get_retriever()
-    retrieved_docs = retriever.get_relevant_documents(question)
-    
-    # --- Part 2: Log the context to a file ---
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe_filename = _sanitize_filename(question)
-    log_filename = f"logs/log_{timestamp}_{safe_filename}.txt"
-    
-    with open(log_filename, 'w', encoding='utf-8') as f:
-        f.write(f"QUERY: {question}\n")
-        f.write("="*50 + "\n")
-        f.write("RETRIEVED CONTEXT:\n")
-        f.write("="*50 + "\n\n")
-        
-        for i, doc in enumerate(retrieved_docs):
-            f.write(f"--- Context Chunk {i+1} ---\n")
-            f.write(f"Source: {doc.metadata.get('source', 'N/A')}\n\n")
-            f.write(doc.page_content)
-            f.write("\n\n")
-            
-    print(f"   ...Context has been saved to '{log_filename}'")
-    
-    # --- Part 3: Generate the answer using the full RAG chain ---
-    rag_chain = create_rag_chain(retriever)
-    
+    start = time.perf_counter()
+
+    service = get_retrieval_service()
+    # --- Definition questions are answered straight from the symbol index ---
+    resolved = service.symbol_lookup(question)
+    if resolved is not None:
+        name, symbols, docs = resolved
+        answer = format_symbol_answer(name, symbols, docs)
+        print(f"\n--- Answer ---\n{answer}\n\n--- End of Answer ---")
+        get_query_logger().log(make_record(question, docs, answer, total_seconds=time.perf_counter() - start))
+        return
+
+    # --- Part 1: Retrieve the context (or reuse a cached answer for a near-duplicate question) ---
+    question_vector, cached, retrieved_docs = service.prepare(question, symbol_fast_path=False)
+    retrieved = time.perf_counter()
+
+    # --- Part 2: Generate the answer from the context retrieved above ---
     print("\n--- Answer ---")
-    for chunk in rag_chain.stream(question):
-        print(chunk, end="", flush=True)
-    print("\n\n--- End of Answer ---")
\ No newline at end of file
+    first_token = None
+    if cached:
+        print(f"(cached answer for a similar question: '{cached.question}')")
+        print(cached.answer, end="", flush=True)
+        answer = cached.answer
+    else:
+        answer_parts = []
+        for chunk in service.stream(question, retrieved_docs):
+            if first_token is None:
+                first_token = time.perf_counter()
+            answer_parts.append(chunk)
+            print(chunk, end="", flush=True)
+        answer = "".join(answer_parts)
+        service.remember(question, question_vector, retrieved_docs, answer)
+    print("\n\n--- End of Answer ---")
+
+    # --- Part 3: Log the query off the request path ---
+    get_query_logger().log(make_record(
+        question, retrieved_docs, answer, cached=cached is not None,
+        retrieve_seconds=retrieved - start,
+        first_token_seconds=first_token - start if first_token else None,
+        total_seconds=time.perf_counter() - start,
+    ))
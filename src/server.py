@@ -0,0 +1,334 @@
+# src/server.py
+import os
+import json
+import time
+import asyncio
+from contextlib import aclosing, asynccontextmanager
+from typing import Optional
+
+from src import config, telemetry
+from src.query_log import get_query_logger, make_record
+from src.retriever import RetrievalService, get_retrieval_service
+from src.symbols import format_symbol_answer
+
+MAX_BODY_BYTES = 64 * 1024
+HEADER_TIMEOUT_SECONDS = 30
+
+class BadRequest(Exception):
+    """Raised for requests the server can't parse; answered with 400, unlike internal errors (500)."""
+
+class Overloaded(Exception):
+    """Raised when a request is shed instead of waiting for a generation slot."""
+
+class BackendLimiter:
+    """
+    Bounds concurrent LLM calls for one model backend and sheds excess load.
+
+    Up to `max_in_flight` generations run at once. Up to `max_queued` more may
+    wait for a slot, for at most `queue_timeout` seconds each. Anything beyond
+    that fails fast with Overloaded, so clients can back off instead of piling
+    up behind a slow backend.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_in_flight: Optional[int] = None,
+        max_queued: Optional[int] = None,
+        queue_timeout: Optional[float] = None,
+    ):
+        self.name = name
+        self.max_in_flight = max_in_flight or config.SERVER_MAX_IN_FLIGHT_LLM
+        self.max_queued = config.SERVER_MAX_QUEUED if max_queued is None else max_queued
+        self.queue_timeout = config.SERVER_QUEUE_TIMEOUT_SECONDS if queue_timeout is None else queue_timeout
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+        self.stats = {"admitted": 0, "shed_queue_full": 0, "shed_timeout": 0, "max_in_flight_seen": 0}
+
+    def overloaded(self) -> bool:
+        """True when a new request would be shed because the wait queue is full."""
+        return self._semaphore.locked() and self.waiting >= self.max_queued
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.overloaded():
+            self.stats["shed_queue_full"] += 1
+            raise Overloaded(f"{self.name}: {self.waiting} requests already waiting")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["shed_timeout"] += 1
+            raise Overloaded(f"{self.name}: no generation slot within {self.queue_timeout}s")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        self.stats["admitted"] += 1
+        self.stats["max_in_flight_seen"] = max(self.stats["max_in_flight_seen"], self.in_flight)
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def snapshot(self) -> dict:
+        return {"backend": self.name, "in_flight": self.in_flight, "waiting": self.waiting,
+                "max_in_flight": self.max_in_flight, "max_queued": self.max_queued, **self.stats}
+
+class QueryServer:
+    """
+    Asyncio HTTP/1.1 server streaming answers to many concurrent clients.
+
+    Endpoints:
+        POST /query  {"question": "..."} -> chunked NDJSON events:
+                     {"event": "sources", ...}, {"event": "token", "text": ...}..., {"event": "done", ...}
+                     (definition questions are answered from the symbol index, in one token)
+        GET /stats   Limiter and request counters.
+        GET /metrics Telemetry in Prometheus text format (empty unless telemetry is enabled).
+        GET /health  Liveness check.
+
+    Retrieval runs on worker threads and generation streams through the
+    chain's `astream`, so one slow answer never blocks other clients. LLM
+    calls are bounded per backend by a BackendLimiter; shed requests get a
+    503 with Retry-After before any of the response has been sent. The same
+    protocol is served over TCP and, optionally, a Unix socket.
+
+    Without an explicit `service`, each request uses the process-wide
+    service, so the server moves to a new store version once it is
+    activated while requests already running finish on the old one.
+    """
+
+    def __init__(self, service: Optional[RetrievalService] = None, limiter: Optional[BackendLimiter] = None):
+        self._shared_service = service is None
+        self.service = service or get_retrieval_service()
+        backend = f"{config.MODEL_BACKEND}:{config.GENERATIVE_MODEL_NAME}"
+        self.limiter = limiter or BackendLimiter(backend)
+        self.stats = {"requests": 0, "answered": 0, "cached": 0, "symbol": 0, "shed": 0, "errors": 0,
+                      "disconnected": 0}
+        # Connections whose 200 streaming response has begun, so later errors are reported in-band
+        self._streaming = set()
+        self._servers = []
+        self._socket_paths = []
+
+    async def start(self, host: Optional[str] = None, port: Optional[int] = None,
+                    socket_path: Optional[str] = None):
+        """Starts listening on TCP (unless `port` is 0) and on `socket_path` if given."""
+        port = config.SERVER_PORT if port is None else port
+        if port:
+            server = await asyncio.start_server(self._handle_connection, host or config.SERVER_HOST, port)
+            self._servers.append(server)
+            print(f"Query server listening on http://{host or config.SERVER_HOST}:{port}")
+        if socket_path:
+            server = await asyncio.start_unix_server(self._handle_connection, socket_path)
+            self._servers.append(server)
+            self._socket_paths.append(socket_path)
+            print(f"Query server listening on unix:{socket_path}")
+
+    async def serve_forever(self):
+        await asyncio.gather(*(server.serve_forever() for server in self._servers))
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        # So clients see no backend instead of a socket nobody is listening on
+        for path in self._socket_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                method, path, body = await asyncio.wait_for(self._read_request(reader), HEADER_TIMEOUT_SECONDS)
+            except asyncio.IncompleteReadError as e:
+                raise BadRequest(f"body ended after {len(e.partial)} of {e.expected} bytes") from None
+            except asyncio.TimeoutError:
+                raise BadRequest(f"request not received within {HEADER_TIMEOUT_SECONDS}s") from None
+            if method == "GET" and path == "/health":
+                await self._send_json(writer, 200, {"status": "ok"})
+            elif method == "GET" and path == "/metrics":
+                await self._send_text(writer, 200, telemetry.prometheus_text(), "text/plain; version=0.0.4")
+            elif method == "GET" and path == "/stats":
+                await self._send_json(writer, 200, {"server": self.stats, "llm": self.limiter.snapshot()})
+            elif method == "POST" and path == "/query":
+                await self._handle_query(writer, body)
+            else:
+                await self._send_json(writer, 404, {"error": f"no route for {method} {path}"})
+        except BadRequest as e:
+            await self._send_json(writer, 400, {"error": f"bad request: {e}"})
+        except ConnectionError:
+            self.stats["disconnected"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"!!! Error handling request: {type(e).__name__}: {e}")
+            try:
+                if writer in self._streaming:
+                    await self._finish_stream(writer, {"event": "error", "error": str(e)})
+                else:
+                    await self._send_json(writer, 500, {"error": f"internal error: {e}"})
+            except ConnectionError:
+                self.stats["disconnected"] += 1
+        finally:
+            self._streaming.discard(writer)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        if not request_line:
+            raise BadRequest("empty request")
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            raise BadRequest(f"malformed request line {request_line!r}") from None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise BadRequest(f"invalid Content-Length {headers['content-length']!r}") from None
+        if not 0 <= length <= MAX_BODY_BYTES:
+            raise BadRequest(f"body length must be between 0 and {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0], body
+
+    async def _handle_query(self, writer: asyncio.StreamWriter, body: bytes):
+        self.stats["requests"] += 1
+        start = time.perf_counter()
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError as e:
+            raise BadRequest(f"invalid JSON: {e}") from None
+        question = payload.get("question") if isinstance(payload, dict) else None
+        if not isinstance(question, str) or not question.strip():
+            raise BadRequest('expected a JSON object with a "question" string')
+        question = question.strip()
+        # Shed before doing any retrieval work if the generation queue is already full
+        if self.limiter.overloaded():
+            self.stats["shed"] += 1
+            self.limiter.stats["shed_queue_full"] += 1
+            await self._send_json(writer, 503, {"error": "overloaded"}, {"Retry-After": "1"})
+            return
+
+        if self._shared_service:
+            self.service = get_retrieval_service()
+        service = self.service
+        # Definition questions are answered straight from the symbol index, as in the CLI
+        resolved = await asyncio.to_thread(service.symbol_lookup, question)
+        if resolved is not None:
+            name, symbols, docs = resolved
+            answer = format_symbol_answer(name, symbols, docs)
+            self.stats["symbol"] += 1
+            await self._start_stream(writer)
+            await self._send_event(writer, _sources_event(docs))
+            await self._send_event(writer, {"event": "token", "text": answer})
+            await self._finish_stream(writer, {"event": "done", "cached": False, "symbol": True,
+                                               "seconds": round(time.perf_counter() - start, 3)})
+            get_query_logger().log(make_record(question, docs, answer, total_seconds=time.perf_counter() - start))
+            return
+
+        vector, cached, docs = await service.aprepare(question, symbol_fast_path=False)
+        sources = _sources_event(docs)
+        if cached is not None:
+            self.stats["cached"] += 1
+            await self._start_stream(writer)
+            await self._send_event(writer, sources)
+            await self._send_event(writer, {"event": "token", "text": cached.answer})
+            await self._finish_stream(writer, {"event": "done", "cached": True, "similar_question": cached.question,
+                                               "seconds": round(time.perf_counter() - start, 3)})
+            get_query_logger().log(make_record(question, docs, cached.answer, cached=True,
+                                               total_seconds=time.perf_counter() - start))
+            return
+
+        try:
+            async with self.limiter.slot():
+                await self._start_stream(writer)
+                await self._send_event(writer, sources)
+                parts = []
+                first_token = None
+                try:
+                    async with aclosing(service.astream(question, docs)) as stream:
+                        async for token in stream:
+                            if first_token is None:
+                                first_token = time.perf_counter() - start
+                            parts.append(token)
+                            await self._send_event(writer, {"event": "token", "text": token})
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    # Headers are already sent, so report the failure in-band
+                    self.stats["errors"] += 1
+                    await self._finish_stream(writer, {"event": "error", "error": str(e)})
+                    return
+        except Overloaded as e:
+            self.stats["shed"] += 1
+            await self._send_json(writer, 503, {"error": str(e)}, {"Retry-After": "1"})
+            return
+
+        answer = "".join(parts)
+        service.remember(question, vector, docs, answer)
+        self.stats["answered"] += 1
+        await self._finish_stream(writer, {
+            "event": "done", "cached": False,
+            "first_token_seconds": round(first_token or 0.0, 3),
+            "seconds": round(time.perf_counter() - start, 3),
+        })
+        get_query_logger().log(make_record(question, docs, answer, first_token_seconds=first_token,
+                                           total_seconds=time.perf_counter() - start))
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: dict, headers: dict = None):
+        await self._send_text(writer, status, json.dumps(payload), "application/json", headers)
+
+    async def _send_text(self, writer: asyncio.StreamWriter, status: int, text: str, content_type: str,
+                         headers: dict = None):
+        body = text.encode("utf-8")
+        extra = "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+        writer.write(
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n{extra}Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+    async def _start_stream(self, writer: asyncio.StreamWriter):
+        self._streaming.add(writer)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                     b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+
+    async def _send_event(self, writer: asyncio.StreamWriter, event: dict):
+        data = json.dumps(event).encode("utf-8") + b"\n"
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+        # drain() applies backpressure from slow clients and raises if they disconnected
+        await writer.drain()
+
+    async def _finish_stream(self, writer: asyncio.StreamWriter, event: dict):
+        await self._send_event(writer, event)
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+def _sources_event(docs) -> dict:
+    return {"event": "sources", "sources": [doc.metadata.get("source") for doc in docs],
+            "chunk_ids": [doc.id for doc in docs]}
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+async def run_server(host: Optional[str] = None, port: Optional[int] = None, socket_path: Optional[str] = None,
+                     max_in_flight: Optional[int] = None, max_queued: Optional[int] = None):
+    """Starts a QueryServer and serves until cancelled."""
+    limiter = BackendLimiter(f"{config.MODEL_BACKEND}:{config.GENERATIVE_MODEL_NAME}",
+                             max_in_flight=max_in_flight, max_queued=max_queued)
+    server = QueryServer(limiter=limiter)
+    service = server.service
+    # Warm the clients up front so the first request doesn't pay for them
+    await asyncio.to_thread(lambda: (service.vector_db, service.answer_chain, service.prompt,
+                                     service.lexical_index, service.symbol_index))
+    await server.start(host, port, socket_path)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
@@ -0,0 +1,297 @@
+# src/symbols.py
+import os
+import re
+import ast
+import json
+import sqlite3
+import textwrap
+import threading
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from langchain.docstore.document import Document
+
+from src import config
+
+# Kinds listed first win when one name has several definitions
+KIND_ORDER = ("class", "function", "method", "interface", "type", "variable")
+
+@dataclass
+class Symbol:
+    """One definition: a class, function, method, constant and so on."""
+    name: str
+    kind: str
+    source: str
+    start_line: int
+    end_line: int
+    parent: Optional[str] = None
+    chunk_id: Optional[str] = None
+
+    @property
+    def qualname(self) -> str:
+        return f"{self.parent}.{self.name}" if self.parent else self.name
+
+    def location(self) -> str:
+        source = self.source
+        root = config.CODEBASE_ROOT
+        if root and source.startswith(root):
+            source = os.path.relpath(source, root)
+        if self.end_line == self.start_line:
+            return f"{source}:{self.start_line}"
+        return f"{source}:{self.start_line}-{self.end_line}"
+
+# --- Extraction ---
+
+def parse_python(text: str) -> Optional[ast.Module]:
+    """Parses Python source, or returns None if it isn't valid Python 3."""
+    try:
+        return ast.parse(text)
+    except (SyntaxError, ValueError):
+        return None
+
+def definition_start(node: ast.AST) -> int:
+    """First line of a definition, including its decorators."""
+    decorators = getattr(node, "decorator_list", None) or []
+    return min([node.lineno] + [decorator.lineno for decorator in decorators])
+
+def python_symbols(tree: ast.Module, line_base: int = 1) -> List[Symbol]:
+    """Classes, functions, methods and module-level names defined in a parsed module."""
+    symbols: List[Symbol] = []
+    offset = line_base - 1
+
+    def visit(nodes, parent: Optional[ast.AST]):
+        for node in nodes:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                if isinstance(node, ast.ClassDef):
+                    kind = "class"
+                else:
+                    kind = "method" if isinstance(parent, ast.ClassDef) else "function"
+                symbols.append(Symbol(node.name, kind, "", definition_start(node) + offset,
+                                      node.end_lineno + offset, parent.name if parent else None))
+                visit(node.body, node)
+            elif parent is None and isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        symbols.append(Symbol(target.id, "variable", "", node.lineno + offset,
+                                              node.end_lineno + offset))
+
+    visit(tree.body, None)
+    return symbols
+
+_IDENT = r"[A-Za-z_$][\w$]*"
+_JS_PATTERNS = [
+    ("function", re.compile(rf"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*({_IDENT})")),
+    ("class", re.compile(rf"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+({_IDENT})")),
+    ("function", re.compile(rf"^\s*(?:export\s+)?(?:const|let|var)\s+({_IDENT})\s*=\s*(?:async\s*)?"
+                            rf"(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|{_IDENT}\s*=>)")),
+]
+_TS_PATTERNS = _JS_PATTERNS + [
+    ("interface", re.compile(rf"^\s*(?:export\s+)?(?:declare\s+)?interface\s+({_IDENT})")),
+    ("type", re.compile(rf"^\s*(?:export\s+)?(?:declare\s+)?(?:type|enum)\s+({_IDENT})")),
+    ("member", re.compile(rf"^\s+(?:(?:public|private|protected|static|async|readonly|override|get|set)\s+)*"
+                          rf"({_IDENT})\s*(?:<[^>]*>)?\([^)]*\)\s*(?::\s*[^{{;]+)?\{{")),
+]
+# Regex fallbacks for languages without a parser here; they find where definitions start
+REGEX_PATTERNS = {
+    ".js": _JS_PATTERNS + [_TS_PATTERNS[-1]],
+    ".ts": _TS_PATTERNS,
+    ".java": [
+        ("class", re.compile(r"^\s*(?:(?:public|protected|private|abstract|final|static|sealed)\s+)*"
+                             r"(?:class|record|enum)\s+(\w+)")),
+        ("interface", re.compile(r"^\s*(?:(?:public|protected|private|abstract|static|sealed)\s+)*interface\s+(\w+)")),
+        ("method", re.compile(r"^\s*(?:(?:public|protected|private|static|final|abstract|synchronized|native)\s+)+"
+                              r"(?:<[^>]+>\s+)?[\w<>\[\],.?\s]+?\s+(\w+)\s*\([^;]*$")),
+    ],
+    ".go": [
+        ("function", re.compile(r"^func\s+(?:\([^)]*\)\s*)?(\w+)\s*[\[(]")),
+        ("type", re.compile(r"^type\s+(\w+)\s+")),
+    ],
+}
+
+# Words that look like a method declaration in a "member" pattern (`if (x) {`)
+CONTROL_KEYWORDS = frozenset({"if", "for", "while", "switch", "catch", "with", "function", "return", "else"})
+
+def _brace_end(lines: List[str], start: int) -> int:
+    """Index of the line closing the first brace block opened at or after `start` (same line if none)."""
+    depth, opened = 0, False
+    for index in range(start, len(lines)):
+        for char in lines[index]:
+            if char == "{":
+                depth, opened = depth + 1, True
+            elif char == "}":
+                depth -= 1
+        if opened and depth <= 0:
+            return index
+        if not opened and lines[index].rstrip().endswith(";"):
+            return index
+    return start
+
+def regex_symbols(text: str, ext: str, line_base: int = 1) -> List[Symbol]:
+    """
+    Finds definitions with per-language patterns, for languages other than Python.
+
+    Spans end where the definition's first brace block closes, and a
+    definition nested inside a class span gets that class as its parent.
+    "member" matches (JS/TS class methods) only count inside a class.
+    """
+    patterns = REGEX_PATTERNS.get(ext)
+    if not patterns:
+        return []
+    lines = text.split("\n")
+    found = []
+    for index, line in enumerate(lines):
+        for kind, pattern in patterns:
+            match = pattern.match(line)
+            if match and match.group(1) not in CONTROL_KEYWORDS:
+                found.append((match.group(1), kind, index, _brace_end(lines, index)))
+                break
+    symbols = []
+    containers = [item for item in found if item[1] in ("class", "interface")]
+    for name, kind, start, end in found:
+        parents = [c for c in containers if c[2] < start <= c[3]]
+        parent = max(parents, key=lambda c: c[2])[0] if parents else None
+        if kind == "member" and not parent:
+            continue
+        if parent and kind in ("function", "member"):
+            kind = "method"
+        symbols.append(Symbol(name, kind, "", start + line_base, end + line_base, parent))
+    return symbols
+
+def attach_symbols(chunks: List[Document], symbols: List[Symbol]):
+    """
+    Records each symbol on the chunk containing its first line, as a JSON
+    `symbols` metadata field (Chroma metadata must be scalar).
+    """
+    located = [chunk for chunk in chunks if "start_line" in chunk.metadata]
+    owned = {}
+    for symbol in symbols:
+        # The first chunk containing the line; overlapping chunks must not index it twice
+        chunk = next((chunk for chunk in located
+                      if chunk.metadata["start_line"] <= symbol.start_line <= chunk.metadata["end_line"]), None)
+        if chunk is not None:
+            owned.setdefault(id(chunk), (chunk, []))[1].append(
+                [symbol.name, symbol.kind, symbol.start_line, symbol.end_line, symbol.parent])
+    for chunk, entries in owned.values():
+        chunk.metadata["symbols"] = json.dumps(entries)
+
+# --- Questions ---
+
+DEFINITION_QUESTION_RE = re.compile(
+    r"^\s*(?:"
+    r"where(?:\s+is|\s+are|'s)\s+(?:the\s+)?(?:class\s+|function\s+|method\s+|constant\s+)?`?(?P<a>[A-Za-z_][\w.]*)`?"
+    r"(?:\s+(?:class|function|method|constant))?(?:\s+(?:defined|declared|implemented|located))?"
+    r"|(?:(?:find|show(?:\s+me)?|go\s+to|jump\s+to)\s+)?(?:the\s+)?(?:definition|declaration)\s+of\s+`?(?P<b>[A-Za-z_][\w.]*)`?"
+    r")\s*[?.!]*\s*$",
+    re.IGNORECASE,
+)
+
+def extract_symbol_query(question: str) -> Optional[str]:
+    """Returns X for questions like "Where is X defined?" or "definition of X", else None."""
+    match = DEFINITION_QUESTION_RE.match(question)
+    if not match:
+        return None
+    return (match.group("a") or match.group("b")).strip(".")
+
+def format_symbol_answer(name: str, symbols: List[Symbol], docs: List[Document]) -> str:
+    """Answers a definition question from the index: each location plus the start of its code."""
+    places = "1 place" if len(symbols) == 1 else f"{len(symbols)} places"
+    parts = [f"`{name}` is defined in {places}:"]
+    by_id = {doc.id: doc for doc in docs}
+    for symbol in symbols:
+        parent = f" of `{symbol.parent}`" if symbol.parent else ""
+        parts.append(f"\n- {symbol.kind} `{symbol.qualname}`{parent} at {symbol.location()}")
+        doc = by_id.get(symbol.chunk_id)
+        if doc is not None and doc.page_content and "start_line" in doc.metadata:
+            lines = doc.page_content.split("\n")
+            first = symbol.start_line - doc.metadata["start_line"]
+            last = min(symbol.end_line - doc.metadata["start_line"] + 1, len(lines))
+            code = textwrap.dedent("\n".join(lines[max(first, 0):last]))
+            if symbol.end_line > doc.metadata["end_line"]:
+                code += "\n..."
+            parts.append(f"\n```\n{code}\n```")
+    return "\n".join(parts)
+
+# --- Index ---
+
+class SymbolIndex:
+    """
+    Persistent symbol table (name -> file, line span, kind, parent), stored in SQLite.
+
+    Built at ingest time from the `symbols` metadata the chunker attaches to
+    chunks, and kept in step with the vector store chunk by chunk, so a
+    definition lookup needs no embedding or LLM call.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or config.SYMBOL_INDEX_PATH
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS symbols (
+                name TEXT NOT NULL, kind TEXT NOT NULL, parent TEXT, source TEXT NOT NULL,
+                start_line INTEGER NOT NULL, end_line INTEGER NOT NULL, chunk_id TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS idx_symbols_name ON symbols(name);
+            CREATE INDEX IF NOT EXISTS idx_symbols_chunk ON symbols(chunk_id);
+            """
+        )
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM symbols").fetchone()[0]
+
+    def add_chunks(self, chunks: Iterable[Document]):
+        """Indexes (or re-indexes) the symbols recorded on chunks, by chunk `id`."""
+        with self._lock:
+            for chunk in chunks:
+                self._conn.execute("DELETE FROM symbols WHERE chunk_id = ?", (chunk.id,))
+                symbols = json.loads(chunk.metadata.get("symbols") or "[]")
+                self._conn.executemany(
+                    "INSERT INTO symbols (name, kind, start_line, end_line, parent, source, chunk_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(*symbol, chunk.metadata.get("source"), chunk.id) for symbol in symbols],
+                )
+            self._conn.commit()
+
+    def remove_chunks(self, chunk_ids: Iterable[str]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM symbols WHERE chunk_id = ?", [(chunk_id,) for chunk_id in chunk_ids])
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM symbols")
+            self._conn.commit()
+
+    def lookup(self, name: str, limit: int = 10) -> List[Symbol]:
+        """
+        Definitions of `name`, or of `Parent.name` for a dotted name.
+
+        Exact matches are preferred; a case-insensitive match is tried when
+        there are none.
+        """
+        parent, _, short = name.rpartition(".")
+        query = "SELECT name, kind, source, start_line, end_line, parent, chunk_id FROM symbols WHERE name = ?"
+        params = [short]
+        if parent:
+            query += " AND parent = ?"
+            params.append(parent.rpartition(".")[2])
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            if not rows:
+                rows = self._conn.execute(query.replace(" = ?", " = ? COLLATE NOCASE"), params).fetchall()
+        symbols = [Symbol(*row) for row in rows]
+        symbols.sort(key=lambda s: (KIND_ORDER.index(s.kind) if s.kind in KIND_ORDER else len(KIND_ORDER),
+                                    s.source, s.start_line))
+        return symbols[:limit]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
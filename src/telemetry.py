@@ -0,0 +1,246 @@
+# src/telemetry.py
+"""
+Lightweight per-stage tracing and metrics.
+
+Code marks stages with `span("embed")` and counts events with
+`count("chunks", n)`; lazy producers such as the directory walk are timed
+with `span_iter`, which leaves out time spent by their consumer. Span durations feed per-stage histograms, and each
+span is also written as a JSON line when a JSONL path is configured. The
+counters and histograms can be exported in Prometheus text format.
+
+While telemetry is disabled (the default), `span` returns a shared no-op
+context manager and `count`/`observe` return immediately, so leaving the
+instrumentation in hot paths costs one flag check per call.
+"""
+import os
+import json
+import time
+import atexit
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from src import config
+
+# Upper bounds (seconds) of the span duration histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class _Histogram:
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+class Telemetry:
+    """Thread-safe registry of counters and span histograms, with an optional JSONL sink."""
+
+    def __init__(self, jsonl_path: Optional[str] = None):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.histograms: Dict[str, _Histogram] = defaultdict(_Histogram)
+        self.jsonl_path = jsonl_path
+        self._sink = None
+        if jsonl_path:
+            directory = os.path.dirname(jsonl_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._sink = open(jsonl_path, "a", encoding="utf-8")
+
+    def observe(self, name: str, seconds: float, attrs: Optional[dict] = None, error: bool = False):
+        with self._lock:
+            self.histograms[name].add(seconds)
+            if error:
+                self.counters[f"{name}_errors"] += 1
+            if self._sink is not None:
+                event = {"ts": round(time.time(), 6), "span": name, "seconds": round(seconds, 6)}
+                if attrs:
+                    event.update(attrs)
+                if error:
+                    event["error"] = True
+                self._sink.write(json.dumps(event) + "\n")
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def snapshot(self) -> dict:
+        """Counters plus count/sum/mean/max seconds for every span."""
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "spans": {
+                    name: {"count": h.count, "seconds": round(h.sum, 6),
+                           "mean_seconds": round(h.sum / h.count, 6) if h.count else 0.0,
+                           "max_seconds": round(h.max, 6)}
+                    for name, h in self.histograms.items()
+                },
+            }
+
+    def prometheus_text(self, prefix: str = "rag") -> str:
+        """Renders counters and span histograms in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self.counters):
+                metric = f"{prefix}_{name}_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {self.counters[name]:g}"]
+            if self.histograms:
+                metric = f"{prefix}_span_duration_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for name in sorted(self.histograms):
+                    h = self.histograms[name]
+                    cumulative = 0
+                    for bound, bucket_count in zip(BUCKETS, h.counts):
+                        cumulative += bucket_count
+                        lines.append(f'{metric}_bucket{{span="{name}",le="{bound:g}"}} {cumulative}')
+                    lines.append(f'{metric}_bucket{{span="{name}",le="+Inf"}} {h.count}')
+                    lines.append(f'{metric}_sum{{span="{name}"}} {h.sum:.6f}')
+                    lines.append(f'{metric}_count{{span="{name}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        with self._lock:
+            if self._sink is not None:
+                self._sink.flush()
+
+    def close(self):
+        with self._lock:
+            if self._sink is not None:
+                self._sink.close()
+                self._sink = None
+
+class _Span:
+    __slots__ = ("name", "attrs", "start")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry = _telemetry
+        if registry is not None:
+            registry.observe(self.name, time.perf_counter() - self.start, self.attrs, error=exc_type is not None)
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+_telemetry: Optional[Telemetry] = None
+_telemetry_lock = threading.Lock()
+
+def enable(jsonl_path: Optional[str] = None) -> Telemetry:
+    """Starts recording (replacing any previous registry) and returns the new registry."""
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is not None:
+            _telemetry.close()
+        _telemetry = Telemetry(jsonl_path)
+        return _telemetry
+
+def disable():
+    """Stops recording and closes the JSONL sink."""
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is not None:
+            _telemetry.close()
+        _telemetry = None
+
+def enabled() -> bool:
+    return _telemetry is not None
+
+def get_telemetry() -> Optional[Telemetry]:
+    return _telemetry
+
+def span(name: str, **attrs):
+    """Times a block as a named stage: `with span("upsert", chunks=len(batch)): ...`."""
+    if _telemetry is None:
+        return _NOOP_SPAN
+    return _Span(name, attrs)
+
+def span_iter(name: str, iterable: Iterable, **attrs) -> Iterator:
+    """
+    Yields from a lazy iterable, recording the time spent producing its items
+    as one span (with an `items` count); time the consumer spends between
+    items is left out, so the iterable stays lazy and its span stays honest.
+    """
+    if _telemetry is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    elapsed, items = 0.0, 0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - start
+            items += 1
+            yield item
+    finally:
+        observe(name, elapsed, items=items, **attrs)
+
+def observe(name: str, seconds: float, **attrs):
+    """Records a duration measured elsewhere (e.g. time-to-first-token) as a span."""
+    registry = _telemetry
+    if registry is not None:
+        registry.observe(name, seconds, attrs)
+
+def count(name: str, value: float = 1):
+    """Adds `value` to a counter."""
+    registry = _telemetry
+    if registry is not None:
+        registry.increment(name, value)
+
+def snapshot() -> dict:
+    registry = _telemetry
+    return registry.snapshot() if registry is not None else {"counters": {}, "spans": {}}
+
+def prometheus_text() -> str:
+    registry = _telemetry
+    return registry.prometheus_text() if registry is not None else ""
+
+def write_prometheus(path: Optional[str] = None):
+    """Writes the current metrics to a Prometheus textfile (atomically, for node_exporter)."""
+    path = path or config.TELEMETRY_PROMETHEUS_PATH
+    registry = _telemetry
+    if registry is None or not path:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(registry.prometheus_text())
+    os.replace(tmp_path, path)
+
+def _shutdown():
+    if _telemetry is not None:
+        write_prometheus()
+        disable()
+
+atexit.register(_shutdown)
+if config.TELEMETRY_ENABLED:
+    enable(config.TELEMETRY_JSONL_PATH)
@@ -1,53 +1,209 @@
 # src/vector_store.py
-import time
-from typing import List
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 from langchain.docstore.document import Document
-from langchain_google_vertexai import VertexAIEmbeddings
-from langchain_community.vectorstores import Chroma
-from src import config
+from src import config, telemetry
+from src.chunk_store import rehydrate, stores_text_inline
+from src.dedup import DedupIndex
+from src.embedding_cache import CachedEmbeddings
+from src.embedding_scheduler import EmbeddingScheduler
+
+# The Vertex AI and Chroma clients take seconds to import; they are imported when first built
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import Chroma
 
 def get_embedding_model():
-    """Initializes and returns the Vertex AI embedding model."""
-    print(f"Initializing embedding model: {config.EMBEDDING_MODEL_NAME}")
-    credentials = config.get_credentials()
-    return VertexAIEmbeddings(model_name=config.EMBEDDING_MODEL_NAME, credentials=credentials)
+    """
+    Initializes and returns the Vertex AI embedding model (or the offline
+    fake when MODEL_BACKEND is "fake").
+
+    The model is wrapped in the persistent embedding cache, so unchanged chunks
+    and repeated questions never reach the embedding API.
+    """
+    if config.MODEL_BACKEND == "fake":
+        from src.fakes import FakeEmbeddings
+
+        print("Initializing fake embedding model (offline)")
+        model_name = "fake"
+        model = FakeEmbeddings(latency_seconds=config.FAKE_EMBEDDING_LATENCY_SECONDS)
+    else:
+        from langchain_google_vertexai import VertexAIEmbeddings
+
+        print(f"Initializing embedding model: {config.EMBEDDING_MODEL_NAME}")
+        credentials = config.get_credentials()
+        model_name = config.EMBEDDING_MODEL_NAME
+        model = VertexAIEmbeddings(model_name=model_name, credentials=credentials)
+    if not config.EMBEDDING_CACHE_ENABLED:
+        return model
+    return CachedEmbeddings(model, model_name)
+
+def get_vector_store(embedding_model=None, db_path: Optional[str] = None) -> Chroma:
+    """Opens (or creates) the persistent ChromaDB collection (in config.CHROMA_DB_PATH by default)."""
+    from langchain_community.vectorstores import Chroma
+
+    db_path = db_path or config.CHROMA_DB_PATH
+    print(f"Initializing ChromaDB at: {db_path}")
+    return Chroma(
+        persist_directory=db_path,
+        embedding_function=embedding_model or get_embedding_model(),
+        collection_name=config.CHROMA_COLLECTION_NAME,
+    )
+
+def get_embedding_scheduler(embedding_model=None) -> EmbeddingScheduler:
+    """Wraps the embedding model in the adaptive, rate-limited scheduler used for ingestion."""
+    return EmbeddingScheduler(embedding_model or get_embedding_model())
+
+def upsert_chunks(vector_db: Chroma, chunks: List[Document], vectors: List[List[float]]):
+    """
+    Writes pre-computed embeddings to the collection.
+
+    Chunks are upserted under their `id`, so re-adding the same chunk
+    overwrites it instead of creating a duplicate. Unless CHUNK_TEXT_STORAGE
+    is "inline", only the metadata (with the chunk's byte range) is stored,
+    not the text.
+    """
+    with telemetry.span("upsert", chunks=len(chunks)):
+        vector_db._collection.upsert(
+            ids=[chunk.id for chunk in chunks],
+            embeddings=vectors,
+            documents=[chunk.page_content for chunk in chunks] if stores_text_inline() else None,
+            metadatas=[chunk.metadata for chunk in chunks],
+        )
+    telemetry.count("chunks_upserted", len(chunks))
+
+def update_metadata(vector_db: Chroma, patches: Dict[str, dict]):
+    """Merges metadata patches into stored chunks (a None value removes the key), keeping their vectors."""
+    if patches:
+        vector_db._collection.update(ids=list(patches), metadatas=list(patches.values()))
+
+def promote_chunks(vector_db: Chroma, promoted: List[Tuple[str, Document, bool]], embeddings=None) -> List[Document]:
+    """
+    Stores duplicate chunks promoted to canonical (see DedupIndex.remove_chunks)
+    under their own ID. A chunk with the same text as the chunk it replaces
+    takes over that chunk's vector; a near-duplicate is embedded with
+    `embeddings` (the store's embedding model by default). Call before
+    deleting the replaced chunks.
 
-def build_vector_store(chunks: List[Document]):
+    Returns:
+        The chunks stored, text rehydrated.
     """
-    Embeds documents in small, delayed batches and stores them in a persistent 
-    ChromaDB vector store to avoid hitting strict API rate limits.
+    if not promoted:
+        return []
+    page = vector_db._collection.get(ids=[old_id for old_id, _, _ in promoted], include=["embeddings"])
+    # Chroma hands stored vectors back as arrays; upsert rejects a batch mixing them with lists
+    stored = {chunk_id: [float(value) for value in vector] for chunk_id, vector in zip(page["ids"], page["embeddings"])}
+    # A replaced chunk already gone was promoted by an interrupted run, which stored its successor
+    promoted = [entry for entry in promoted if entry[0] in stored]
+    if not promoted:
+        return []
+    chunks = rehydrate([chunk for _, chunk, _ in promoted])
+    # A near-duplicate's text differs from the replaced chunk's, so its vector must too
+    texts = [chunk.page_content for chunk, (_, _, same_text) in zip(chunks, promoted) if not same_text]
+    fresh = iter((embeddings or vector_db.embeddings).embed_documents(texts) if texts else [])
+    vectors = [stored[old_id] if same_text else next(fresh) for old_id, _, same_text in promoted]
+    upsert_chunks(vector_db, chunks, vectors)
+    return chunks
+
+def add_chunks_in_batches(vector_db: Chroma, chunks: List[Document], scheduler: EmbeddingScheduler = None):
+    """
+    Embeds chunks through the scheduler and upserts them batch by batch.
+
+    Batches are sized against the model's per-request limits and several run
+    concurrently; the scheduler enforces the rate limits and backs off on
+    quota errors.
+    """
+    owns_scheduler = scheduler is None
+    scheduler = scheduler or get_embedding_scheduler(vector_db.embeddings)
+    batches = scheduler.make_batches([chunk.page_content for chunk in chunks])
+    futures = [scheduler.submit([chunks[i].page_content for i in batch]) for batch in batches]
+    for current_batch_num, (batch, future) in enumerate(zip(batches, futures), start=1):
+        print(f"--> Processing batch {current_batch_num}/{len(batches)} ({len(batch)} chunks)...")
+        upsert_chunks(vector_db, [chunks[i] for i in batch], future.result())
+    if owns_scheduler:
+        scheduler.shutdown()
+
+def query_by_vectors(
+    vector_db: Chroma, vectors: List[List[float]], k: int = 4, where: Optional[dict] = None
+) -> List[List[Tuple[Document, float]]]:
+    """
+    Runs one batched nearest-neighbour query for several query embeddings.
+
+    Unlike LangChain's similarity_search_by_vector, the returned Documents
+    carry their chunk `id`, and chunks stored as offsets come back with their
+    text rehydrated.
+
+    Returns:
+        For each query vector, a list of (Document, distance) pairs, nearest first.
+    """
+    results = vector_db._collection.query(
+        query_embeddings=vectors,
+        n_results=k,
+        where=where,
+        include=["documents", "metadatas", "distances"],
+    )
+    hits = [
+        [
+            (Document(id=chunk_id, page_content=text or "", metadata=metadata or {}), distance)
+            for chunk_id, text, metadata, distance in zip(ids, texts, metadatas, distances)
+        ]
+        for ids, texts, metadatas, distances in zip(
+            results["ids"], results["documents"], results["metadatas"], results["distances"]
+        )
+    ]
+    rehydrate([doc for pairs in hits for doc, _ in pairs])
+    return hits
+
+def get_chunks(vector_db: Chroma, chunk_ids: List[str]) -> List[Document]:
+    """Fetches chunks by ID (text rehydrated), in the order requested."""
+    if not chunk_ids:
+        return []
+    page = vector_db._collection.get(ids=list(chunk_ids), include=["documents", "metadatas"])
+    by_id = {
+        chunk_id: Document(id=chunk_id, page_content=text or "", metadata=metadata or {})
+        for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+    }
+    return rehydrate([by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in by_id])
+
+def existing_chunk_ids(vector_db: Chroma, chunk_ids: List[str]) -> set:
+    """Returns the subset of `chunk_ids` still present in the collection."""
+    if not chunk_ids:
+        return set()
+    return set(vector_db._collection.get(ids=list(chunk_ids), include=[])["ids"])
+
+def delete_chunks(vector_db: Chroma, chunk_ids: List[str]):
+    """Removes chunks from the vector store by ID."""
+    if chunk_ids:
+        vector_db.delete(ids=list(chunk_ids))
+
+def build_vector_store(chunks: List[Document]) -> List[Document]:
+    """
+    Embeds documents through the rate-limited embedding scheduler and stores
+    them in a persistent ChromaDB vector store. Duplicate chunks are embedded
+    and stored once per cluster (see DedupIndex).
+
+    Returns:
+        The chunks stored, i.e. without duplicates.
     """
     if not chunks:
         print("No chunks to process. Exiting.")
-        return
+        return []
 
     print(f"\n--- Stage 2: Embedding and Storage ---")
-    embedding_model = get_embedding_model()
-    
-    print(f"Initializing ChromaDB at: {config.CHROMA_DB_PATH}")
-    vector_db = Chroma(
-        persist_directory=config.CHROMA_DB_PATH,
-        embedding_function=embedding_model,
-        collection_name=config.CHROMA_COLLECTION_NAME,
-    )
+    vector_db = get_vector_store()
+    dedup_index = DedupIndex()
+    canonical_ids = dedup_index.assign_chunks(chunks)
+    stored = [chunk for chunk, canonical_id in zip(chunks, canonical_ids) if canonical_id is None]
 
-    # Process documents in controlled batches
-    total_chunks = len(chunks)
-    for i in range(0, total_chunks, config.EMBEDDING_BATCH_SIZE):
-        batch = chunks[i:i + config.EMBEDDING_BATCH_SIZE]
-        
-        current_batch_num = (i // config.EMBEDDING_BATCH_SIZE) + 1
-        # Recalculate total batches based on the new batch size
-        total_batches = (total_chunks + config.EMBEDDING_BATCH_SIZE - 1) // config.EMBEDDING_BATCH_SIZE
-        
-        print(f"--> Processing batch {current_batch_num}/{total_batches} ({len(batch)} chunks)...")
-        
-        vector_db.add_documents(batch)
-        
-        # Add a configurable delay between batches to respect rate limits
-        print(f"    ...batch added. Pausing for {config.EMBEDDING_REQUEST_DELAY_SECONDS} seconds.")
-        time.sleep(config.EMBEDDING_REQUEST_DELAY_SECONDS)
+    # Process documents in size-limited, concurrent batches
+    scheduler = get_embedding_scheduler(vector_db.embeddings)
+    add_chunks_in_batches(vector_db, stored, scheduler)
+    scheduler.shutdown()
+    update_metadata(vector_db, dedup_index.duplicate_patches(filter(None, canonical_ids)))
+    print(f"Embedding stats: {scheduler.stats}")
+    print(dedup_index.report())
+    dedup_index.close()
 
     print("\nVector store built and persisted successfully.")
     print(f"Total vectors in store: {vector_db._collection.count()}")
-
+    return stored
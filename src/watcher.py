@@ -0,0 +1,253 @@
+# src/watcher.py
+import os
+import time
+import threading
+from typing import Dict, Optional, Set, Tuple
+
+from src import config, db_versions, telemetry
+from src.data_loader import is_excluded_dir, is_source_file, iter_source_files
+from src.ingest import sync_codebase
+
+class PendingChanges:
+    """
+    Changed paths collected from a change source, handed out in debounced batches.
+
+    A batch is released once no new path has arrived for `debounce` seconds,
+    or `max_delay` seconds after its first path, so a steady stream of saves
+    can't postpone indexing indefinitely.
+    """
+
+    def __init__(self, debounce: float, max_delay: float):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._paths: Set[str] = set()
+        self._first = 0.0
+        self._last = 0.0
+
+    def add(self, *paths: str):
+        with self._cond:
+            now = time.monotonic()
+            if not self._paths:
+                self._first = now
+            self._paths.update(paths)
+            self._last = now
+            self._cond.notify()
+
+    def take(self, stop: threading.Event) -> Set[str]:
+        """Blocks until a batch is ready (returned) or `stop` is set (returns what is pending)."""
+        with self._cond:
+            while not stop.is_set():
+                if self._paths:
+                    now = time.monotonic()
+                    ready_at = min(self._last + self.debounce, self._first + self.max_delay)
+                    if now >= ready_at:
+                        break
+                    self._cond.wait(ready_at - now)
+                else:
+                    self._cond.wait(0.5)
+            paths, self._paths = self._paths, set()
+            return paths
+
+class PollingSource:
+    """Detects changes by re-walking the codebase and comparing (mtime, size) snapshots."""
+
+    name = "polling"
+
+    def __init__(self, directory_path: str, pending: PendingChanges, interval: float):
+        self.directory_path = directory_path
+        self.pending = pending
+        self.interval = interval
+        self._stop = threading.Event()
+        self._snapshot = self._scan()
+        self._thread = threading.Thread(target=self._run, name="watch-poll", daemon=True)
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for file_path in iter_source_files(self.directory_path):
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            snapshot[file_path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            snapshot = self._scan()
+            changed = [path for path, stat in snapshot.items() if self._snapshot.get(path) != stat]
+            changed += [path for path in self._snapshot if path not in snapshot]
+            self._snapshot = snapshot
+            if changed:
+                self.pending.add(*changed)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+class InotifySource:
+    """
+    Receives change events from the OS (inotify on Linux, FSEvents/kqueue
+    elsewhere) through the optional `watchdog` package.
+    """
+
+    name = "inotify"
+
+    def __init__(self, directory_path: str, pending: PendingChanges):
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+
+        source = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                source._on_event(event)
+
+        self.directory_path = directory_path
+        self.pending = pending
+        self._observer = Observer()
+        self._observer.schedule(Handler(), directory_path, recursive=True)
+
+    def _on_event(self, event):
+        # Opening or reading a file changes nothing; a directory's own "modified"
+        # event only repeats what its children's events already say
+        if event.event_type in ("opened", "closed_no_write") or (event.is_directory and event.event_type == "modified"):
+            return
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        relevant = [path for path in paths if path and self._is_relevant(os.fsdecode(path), event.is_directory)]
+        if relevant:
+            self.pending.add(*(os.fsdecode(path) for path in relevant))
+
+    def _is_relevant(self, path: str, is_directory: bool) -> bool:
+        if not is_directory:
+            return is_source_file(path, self.directory_path)
+        relative = os.path.relpath(path, self.directory_path)
+        return not relative.startswith(os.pardir) and not any(is_excluded_dir(d) for d in relative.split(os.sep))
+
+    def start(self):
+        self._observer.start()
+
+    def stop(self):
+        self._observer.stop()
+        self._observer.join()
+
+def make_change_source(directory_path: str, pending: PendingChanges, backend: str = "auto",
+                       poll_interval: Optional[float] = None):
+    """
+    Returns an inotify source when `watchdog` is installed (and `backend`
+    allows it), otherwise a polling source.
+    """
+    if backend in ("auto", "inotify"):
+        try:
+            return InotifySource(directory_path, pending)
+        except ImportError:
+            if backend == "inotify":
+                raise
+            print("watchdog is not installed; falling back to polling for changes (pip install watchdog).")
+        except OSError as e:
+            # e.g. the inotify watch limit (fs.inotify.max_user_watches) is exhausted
+            if backend == "inotify":
+                raise
+            print(f"Could not start file system events ({e}); falling back to polling for changes.")
+    return PollingSource(directory_path, pending, poll_interval or config.WATCH_POLL_INTERVAL_SECONDS)
+
+class CodebaseWatcher:
+    """
+    Keeps the index in sync with a codebase as files change.
+
+    On start it runs one full incremental sync to catch up, then watches for
+    changes. Bursts of changes are debounced into a single batch, and each
+    batch is synced with `sync_codebase(paths=...)`, so only the affected
+    files are compared, re-chunked and re-embedded, and chunks of all files in
+    the batch share embedding requests. Syncs run one at a time on the
+    watcher's own thread; the stores they write to are read concurrently, so
+    queries are never blocked, and see a file's new chunks once it completes.
+    When a rebuilt store version goes live, the watcher moves to it.
+
+    Args:
+        directory_path: The codebase root (as passed to sync_codebase).
+        backend: "auto" (inotify through watchdog if installed, else polling),
+            "inotify" or "polling".
+        debounce: Quiet seconds that end a burst of changes.
+        max_delay: Longest a change waits before its batch is synced.
+        poll_interval: Seconds between scans of the polling backend.
+    """
+
+    def __init__(
+        self,
+        directory_path: str,
+        backend: Optional[str] = None,
+        debounce: Optional[float] = None,
+        max_delay: Optional[float] = None,
+        poll_interval: Optional[float] = None,
+    ):
+        self.directory_path = directory_path
+        self.backend = backend or config.WATCH_BACKEND
+        self.poll_interval = poll_interval
+        self.pending = PendingChanges(
+            config.WATCH_DEBOUNCE_SECONDS if debounce is None else debounce,
+            config.WATCH_MAX_DELAY_SECONDS if max_delay is None else max_delay,
+        )
+        self.source = None
+        self.stats = {"syncs": 0, "paths": 0, "failed_syncs": 0}
+        self._db_path = config.CHROMA_DB_PATH
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="watch-sync", daemon=True)
+
+    def start(self):
+        """Runs the catch-up sync in the background and starts watching."""
+        # Watch before the catch-up sync, so changes made during it are not missed
+        self.source = make_change_source(self.directory_path, self.pending, self.backend, self.poll_interval)
+        self.source.start()
+        print(f"Watching {self.directory_path} for changes ({self.source.name}).")
+        self._thread.start()
+
+    def stop(self):
+        """Stops watching; a sync in progress is allowed to finish."""
+        self._stop.set()
+        if self.source is not None:
+            self.source.stop()
+        self._thread.join()
+
+    def run_forever(self):
+        """Watches until interrupted (Ctrl+C)."""
+        self.start()
+        try:
+            while self._thread.is_alive():
+                self._thread.join(1.0)
+        except KeyboardInterrupt:
+            print("Stopping watcher...")
+        finally:
+            self.stop()
+
+    def _run(self):
+        self._sync(None)
+        while not self._stop.is_set():
+            paths = self.pending.take(self._stop)
+            if paths and not self._stop.is_set():
+                self._sync(paths)
+
+    def _sync(self, paths: Optional[Set[str]]):
+        # Follow a blue/green switch, and catch the new version up on changes made while it was built
+        db_versions.refresh()
+        if config.CHROMA_DB_PATH != self._db_path:
+            self._db_path = config.CHROMA_DB_PATH
+            paths = None
+        label = "all files" if paths is None else f"{len(paths)} changed path(s)"
+        print(f"\n--- Syncing {label} ---")
+        try:
+            with telemetry.span("watch_sync", paths=len(paths) if paths else 0):
+                sync_codebase(self.directory_path, paths=paths)
+        except Exception as e:
+            self.stats["failed_syncs"] += 1
+            telemetry.count("watch_sync_failed")
+            print(f"   !!! Sync failed: {e}; retrying in {self.pending.max_delay:.0f}s.")
+            self._stop.wait(self.pending.max_delay)
+            # Retry the same paths with the next batch (a failed catch-up retries everything)
+            self.pending.add(*(paths or [self.directory_path]))
+            return
+        self.stats["syncs"] += 1
+        self.stats["paths"] += len(paths) if paths else 0
@@ -0,0 +1,21 @@
+# tests/conftest.py
+"""
+Shared fixtures. Everything runs offline: stores live in a temporary
+directory and the models are the fakes in src/fakes.py.
+"""
+import pytest
+
+from src import benchmark
+
+@pytest.fixture
+def store(tmp_path):
+    """Points every store at a scratch directory, with the fake models and no quota limits."""
+    with benchmark.isolated_run(str(tmp_path / "work"), 0, 0, 0):
+        yield tmp_path
+
+@pytest.fixture
+def inline_text(monkeypatch):
+    """Keeps chunk text in the indexes themselves, so unit tests need no blob store."""
+    from src import config
+
+    monkeypatch.setattr(config, "CHUNK_TEXT_STORAGE", "inline")
@@ -0,0 +1,46 @@
+# tests/helpers.py
+"""Small builders shared by the tests."""
+import os
+import io
+import contextlib
+
+def python_module(seed: int, functions: int = 3, lines: int = 30) -> str:
+    """Deterministic Python source with `functions` functions of `lines` lines each, unique per seed."""
+    words = ["alpha", "beta", "gamma", "delta", "render", "store", "count", "index", "node", "value"]
+    out = []
+    for f in range(functions):
+        out.append(f"def f{seed}_{f}(x):")
+        for line in range(lines):
+            a, b, c = (words[(seed * 7 + f * 3 + line * k) % len(words)] for k in (1, 3, 5))
+            out.append(f"    {a}_{line} = {b}({c}, {seed * 1000 + f * 100 + line})")
+        out.append(f"    return x\n")
+    return "\n".join(out)
+
+def write(root, relative: str, text: str):
+    path = os.path.join(root, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return path
+
+def quiet(function, *args, **kwargs):
+    """Calls `function` with its progress output swallowed."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+class FakeClock:
+    """Stands in for the `time` module: `sleep` advances the clock instead of blocking."""
+
+    def __init__(self, start: float = 1000.0):
+        self.now = start
+        self.slept = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
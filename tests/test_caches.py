@@ -0,0 +1,127 @@
+# tests/test_caches.py
+import time
+
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+
+from src import answer_cache, embedding_cache
+from src.answer_cache import SemanticAnswerCache
+from src.embedding_cache import CachedEmbeddings, EmbeddingCache
+from src.fakes import FakeEmbeddings
+from tests.helpers import FakeClock
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Starts at the real time: cached answers stamp themselves with time.time() when created
+    fake = FakeClock(start=time.time())
+    monkeypatch.setattr(answer_cache, "time", fake)
+    monkeypatch.setattr(embedding_cache, "time", fake)
+    return fake
+
+def axis(i: int, dim: int = 8) -> np.ndarray:
+    """Unit vector along axis `i`: orthogonal to every other axis, so questions never match by accident."""
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[i] = 1.0
+    return vector
+
+def docs(*sources: str):
+    return [Document(id=f"{source}#1", page_content="", metadata={"source": source}) for source in sources]
+
+def test_answer_cache_matches_similar_questions_only():
+    cache = SemanticAnswerCache(threshold=0.9, ttl_seconds=60, max_entries=10)
+    cache.store("q", axis(0), docs("a.py"), "answer")
+    assert cache.lookup(axis(0) + 0.1 * axis(1)).answer == "answer"
+    assert cache.lookup(axis(0) + axis(1)) is None
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+
+def test_answer_cache_evicts_least_recently_used():
+    cache = SemanticAnswerCache(threshold=0.9, ttl_seconds=60, max_entries=2)
+    cache.store("q0", axis(0), docs("a.py"), "a0")
+    cache.store("q1", axis(1), docs("a.py"), "a1")
+    # A hit makes q0 the most recently used, so q1 goes first
+    assert cache.lookup(axis(0)).answer == "a0"
+    cache.store("q2", axis(2), docs("a.py"), "a2")
+    assert len(cache) == 2 and cache.stats["evictions"] == 1
+    assert cache.lookup(axis(1)) is None
+    assert cache.lookup(axis(0)).answer == "a0"
+    assert cache.lookup(axis(2)).answer == "a2"
+
+def test_answer_cache_expires_entries_after_ttl(clock):
+    cache = SemanticAnswerCache(threshold=0.9, ttl_seconds=60, max_entries=10)
+    cache.store("q", axis(0), docs("a.py"), "answer")
+    clock.sleep(59)
+    assert cache.lookup(axis(0)) is not None
+    clock.sleep(2)
+    assert cache.lookup(axis(0)) is None
+    assert cache.stats["expired"] == 1 and len(cache) == 0
+
+def test_answer_cache_drops_entries_failing_validation():
+    cache = SemanticAnswerCache(threshold=0.9, ttl_seconds=60, max_entries=10)
+    cache.store("q", axis(0), docs("a.py", "b.py"), "answer")
+    seen = []
+    assert cache.lookup(axis(0), validate=lambda ids: seen.append(ids) or False) is None
+    assert seen == [["a.py#1", "b.py#1"]]
+    assert cache.stats["stale"] == 1 and len(cache) == 0
+
+def test_answer_cache_falls_back_to_next_best_entry():
+    cache = SemanticAnswerCache(threshold=0.5, ttl_seconds=60, max_entries=10)
+    cache.store("stale", axis(0), docs("old.py"), "old")
+    cache.store("fresh", axis(0) + 0.5 * axis(1), docs("new.py"), "new")
+    hit = cache.lookup(axis(0), validate=lambda ids: ids != ["old.py#1"])
+    assert hit.answer == "new"
+
+def test_answer_cache_invalidates_by_source():
+    cache = SemanticAnswerCache(threshold=0.9, ttl_seconds=60, max_entries=10)
+    cache.store("q0", axis(0), docs("a.py"), "a0")
+    cache.store("q1", axis(1), docs("a.py", "b.py"), "a1")
+    cache.store("q2", axis(2), docs("c.py"), "a2")
+    assert cache.invalidate_sources(["b.py", "missing.py"]) == 1
+    assert cache.lookup(axis(1)) is None
+    assert cache.lookup(axis(0)) is not None and cache.lookup(axis(2)) is not None
+
+@pytest.fixture
+def vectors(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"), max_entries=3)
+    yield cache
+    cache.close()
+
+def test_embedding_cache_round_trip_and_normalized_keys(vectors):
+    vectors.put_many("m", ["alpha", "beta"], [[1.0, 2.0], [3.0, 4.0]])
+    assert vectors.get_many("m", [" alpha\n", "gamma", "beta"]) == [[1.0, 2.0], None, [3.0, 4.0]]
+    # Namespaces keep document and query vectors apart
+    assert vectors.get_many("other", ["alpha"]) == [None]
+    assert vectors.stats == {"hits": 2, "misses": 2, "evictions": 0}
+
+def test_embedding_cache_evicts_least_recently_used(vectors, clock):
+    for text in ("a", "b", "c"):
+        vectors.put_many("m", [text], [[0.0]])
+        clock.sleep(1)
+    # Reading "a" makes "b" the least recently used
+    vectors.get_many("m", ["a"])
+    clock.sleep(1)
+    vectors.put_many("m", ["d"], [[0.0]])
+    assert len(vectors) == 3 and vectors.stats["evictions"] == 1
+    assert [vector is not None for vector in vectors.get_many("m", ["a", "b", "c", "d"])] == [True, False, True, True]
+
+def test_embedding_cache_keeps_count_across_reopen_and_duplicate_puts(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(path, max_entries=10)
+    cache.put_many("m", ["a", "b"], [[0.0], [1.0]])
+    cache.put_many("m", ["a"], [[0.0]])
+    assert len(cache) == 2
+    cache.close()
+    reopened = EmbeddingCache(path, max_entries=10)
+    assert len(reopened) == 2
+    reopened.close()
+
+def test_cached_embeddings_only_embed_misses(vectors):
+    model = FakeEmbeddings(dim=4)
+    cached = CachedEmbeddings(model, "fake", cache=vectors)
+    first = cached.embed_documents(["a", "b"])
+    # Stored as float32
+    assert np.allclose(cached.embed_documents(["b", "a"]), [first[1], first[0]], atol=1e-6)
+    assert model.stats["calls"] == 1
+    cached.embed_query("a")
+    # Queries live in their own namespace
+    assert model.stats["calls"] == 2
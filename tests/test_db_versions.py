@@ -0,0 +1,99 @@
+# tests/test_db_versions.py
+import os
+import time
+
+import pytest
+
+from src import config, db_versions
+from src.db_versions import ValidationError, activate, collect_garbage, read_pointer, rollback, version_path
+from tests.helpers import python_module, quiet, write
+
+GRACE = config.DB_VERSION_GRACE_SECONDS
+
+def new_versions(count: int):
+    return [db_versions._new_version() for _ in range(count)]
+
+def retired(pointer=None):
+    return [entry["version"] for entry in (pointer or read_pointer())["retired"]]
+
+def test_activate_repoints_config_and_retires_previous(store):
+    v1, v2 = new_versions(2)
+    quiet(activate, v1)
+    quiet(activate, v2)
+    pointer = read_pointer()
+    assert pointer["version"] == v2 and retired(pointer) == [v1, ""]
+    assert config.CHROMA_DB_PATH == version_path(v2) == config.live_db_path()
+    assert config.MANIFEST_PATH.startswith(version_path(v2))
+
+def test_activating_a_retired_version_takes_it_off_the_retired_list(store):
+    v1, v2 = new_versions(2)
+    quiet(activate, v1)
+    quiet(activate, v2)
+    quiet(activate, v1)
+    assert read_pointer()["version"] == v1 and retired() == [v2, ""]
+    quiet(activate, v1)
+    assert retired() == [v2, ""]
+
+def test_rollback_goes_to_newest_retired_version_still_on_disk(store):
+    v1, v2, v3 = new_versions(3)
+    for version in (v1, v2, v3):
+        quiet(activate, version)
+    os.rmdir(version_path(v2))
+    assert quiet(rollback) == v1
+    assert config.CHROMA_DB_PATH == version_path(v1)
+    assert retired() == [v3, v2, ""]
+
+def test_rollback_without_retired_versions_fails(store):
+    with pytest.raises(ValidationError):
+        rollback()
+
+def test_garbage_collection_keeps_newest_retired_and_waits_out_grace(store):
+    write(config.DB_ROOT, "chroma.sqlite3", "unversioned store")
+    v1, v2, v3 = new_versions(3)
+    for version in (v1, v2, v3):
+        quiet(activate, version)
+    assert retired() == [v2, v1, ""]
+
+    # Readers may still have retired versions open during the grace period
+    assert quiet(collect_garbage, time.time()) == []
+    assert quiet(collect_garbage, time.time() + GRACE + 1) == [v1, ""]
+    assert retired() == [v2]
+    assert os.path.isdir(version_path(v2)) and os.path.isdir(version_path(v3))
+    assert not os.path.exists(version_path(v1))
+    # Removing the unversioned store spares the pointer and the versions directory
+    assert sorted(os.listdir(config.DB_ROOT)) == sorted([db_versions.VERSIONS_DIR, os.path.basename(config.DB_POINTER_PATH)])
+
+def test_garbage_collection_removes_only_abandoned_builds(store):
+    [live] = new_versions(1)
+    quiet(activate, live)
+    # Our own PID is still running, so this build is in progress
+    [building] = new_versions(1)
+    abandoned = "20200101-000000-000000-999999999"
+    os.makedirs(version_path(abandoned))
+    later = time.time() + GRACE + 1
+
+    assert quiet(collect_garbage, time.time()) == []
+    assert quiet(collect_garbage, later) == [abandoned]
+    assert os.path.isdir(version_path(building)) and os.path.isdir(version_path(live))
+
+def test_build_version_validates_and_activates(store):
+    tree = str(store / "tree")
+    write(tree, "a.py", python_module(1))
+    write(tree, "b.py", python_module(2))
+    version = quiet(db_versions.build_version, tree)
+    assert read_pointer()["version"] == version
+    assert db_versions.validate(config.CHROMA_DB_PATH)["files"] == 2
+
+def test_failed_build_leaves_live_store_alone(store, monkeypatch):
+    tree = str(store / "tree")
+    write(tree, "a.py", python_module(1))
+    live = quiet(db_versions.build_version, tree)
+
+    def reject(db_path):
+        raise ValidationError("corrupt")
+    monkeypatch.setattr(db_versions, "validate", reject)
+    write(tree, "b.py", python_module(2))
+    with pytest.raises(ValidationError):
+        quiet(db_versions.build_version, tree)
+    assert read_pointer()["version"] == live and config.CHROMA_DB_PATH == version_path(live)
+    assert os.listdir(db_versions.versions_root()) == [live]
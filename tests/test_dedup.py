@@ -0,0 +1,174 @@
+# tests/test_dedup.py
+import os
+
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+
+from src import config
+from src.dedup import DedupIndex, MinHasher
+from tests.helpers import python_module, quiet, write
+
+def chunk(chunk_id: str, text: str, source: str) -> Document:
+    return Document(id=chunk_id, page_content=text, metadata={"source": source, "start_line": 1, "end_line": 30})
+
+def edited(text: str) -> str:
+    """`text` with one line changed: a near-duplicate of it."""
+    lines = text.splitlines()
+    lines[5] = "    edited_line = something_else(1, 2, 3)"
+    return "\n".join(lines)
+
+@pytest.fixture
+def index(tmp_path, inline_text):
+    dedup_index = DedupIndex(str(tmp_path / "dedup.sqlite3"))
+    yield dedup_index
+    dedup_index.close()
+
+TEXT = python_module(1, functions=1)
+
+def test_near_duplicate_threshold_holds_for_one_line_edit():
+    hasher = MinHasher()
+    first, second = (hasher.signature(hasher.shingles(text)) for text in (TEXT, edited(TEXT)))
+    assert hasher.similarity(first, second) >= config.DEDUP_THRESHOLD
+    unrelated = hasher.signature(hasher.shingles(python_module(2, functions=1)))
+    assert hasher.similarity(first, unrelated) < config.DEDUP_THRESHOLD
+
+def test_assign_exact_and_near_duplicates(index):
+    canonical = index.assign_chunks([chunk("a", TEXT, "a.py")], mode="near")
+    exact = index.assign_chunks([chunk("b", "\n" + TEXT + "\n", "b.py")], mode="near")
+    near = index.assign_chunks([chunk("c", edited(TEXT), "c.py")], mode="near")
+    unrelated = index.assign_chunks([chunk("d", python_module(2, functions=1), "d.py")], mode="near")
+    assert (canonical, exact, near, unrelated) == ([None], ["a"], ["a"], [None])
+    assert index.stats["exact"] == 1 and index.stats["near"] == 1
+    assert index.duplicate_count() == 2
+
+def test_assign_modes(index):
+    index.assign_chunks([chunk("a", TEXT, "a.py")], mode="exact")
+    assert index.assign_chunks([chunk("b", TEXT, "b.py")], mode="exact") == ["a"]
+    assert index.assign_chunks([chunk("c", edited(TEXT), "c.py")], mode="exact") == [None]
+    assert index.assign_chunks([chunk("d", TEXT, "d.py")], mode="off") == [None]
+
+def test_assign_is_idempotent_for_recorded_chunks(index):
+    index.assign_chunks([chunk("a", TEXT, "a.py"), chunk("b", TEXT, "b.py")], mode="near")
+    assert index.assign_chunks([chunk("a", TEXT, "a.py"), chunk("b", TEXT, "b.py")], mode="near") == [None, "a"]
+    assert len(index) == 2
+
+def test_no_near_match_within_the_same_source(index):
+    index.assign_chunks([chunk("a", TEXT, "a.py")], mode="near")
+    # The edited version of a chunk must not be recorded as a duplicate of its previous self
+    assert index.assign_chunks([chunk("a2", edited(TEXT), "a.py")], mode="near") == [None]
+
+def test_no_near_match_against_chunks_being_replaced(index):
+    index.assign_chunks([chunk("a", TEXT, "a.py")], mode="near")
+    index.replacing(["a"])
+    assert index.assign_chunks([chunk("c", edited(TEXT), "c.py")], mode="near") == [None]
+    index.finish()
+    # "c" became a canonical chunk of its own, and an exact match wins over a near one
+    assert index.assign_chunks([chunk("e", edited(TEXT), "e.py")], mode="near") == ["c"]
+
+def test_removing_canonical_promotes_oldest_duplicate(index):
+    index.assign_chunks([chunk("a", TEXT, "a.py"), chunk("b", TEXT, "b.py"), chunk("c", edited(TEXT), "c.py")])
+    removal = index.remove_chunks(["a"])
+
+    [(old_id, promoted, same_text)] = removal["promoted"]
+    assert (old_id, promoted.id, same_text) == ("a", "b", True)
+    assert promoted.page_content == TEXT
+    assert removal["changed"] == ["b"]
+    # The rest of the cluster now points at the promoted chunk, which lists them
+    assert index.assign_chunks([chunk("c", edited(TEXT), "c.py")]) == ["b"]
+    assert index.duplicate_patches(["b"]) == {"b": {"duplicates": '[["c.py", 1, 30]]'}}
+
+def test_promoted_near_duplicate_is_flagged_for_re_embedding(index):
+    index.assign_chunks([chunk("a", TEXT, "a.py"), chunk("c", edited(TEXT), "c.py")])
+    [(old_id, promoted, same_text)] = index.remove_chunks(["a"])["promoted"]
+    assert (old_id, promoted.id, same_text) == ("a", "c", False)
+    # It is a canonical chunk now, so new copies of it are found through its LSH buckets
+    assert index.assign_chunks([chunk("f", edited(TEXT), "f.py")]) == ["c"]
+
+def test_removing_duplicate_changes_its_canonical(index):
+    index.assign_chunks([chunk("a", TEXT, "a.py"), chunk("b", TEXT, "b.py")])
+    assert index.remove_chunks(["b"]) == {"promoted": [], "changed": ["a"]}
+    assert index.duplicate_patches(["a"]) == {"a": {"duplicates": None}}
+
+def test_removing_whole_cluster_promotes_nothing(index):
+    index.assign_chunks([chunk("a", TEXT, "a.py"), chunk("b", TEXT, "b.py")])
+    assert index.remove_chunks(["a", "b"]) == {"promoted": [], "changed": []}
+    assert len(index) == 0
+
+def test_interrupted_sync_is_detected_across_reopen(tmp_path, inline_text):
+    path = str(tmp_path / "dedup.sqlite3")
+    index = DedupIndex(path)
+    index.begin()
+    index.assign_chunks([chunk("a", TEXT, "a.py"), chunk("b", TEXT, "b.py")])
+    index.close()
+
+    reopened = DedupIndex(path)
+    assert reopened.interrupted()
+    # Only "a" reached the manifest before the run stopped
+    assert reopened.unrecorded({"a"}) == ["b"]
+    reopened.finish()
+    assert not reopened.interrupted()
+    reopened.close()
+
+def stored_vectors_match_fresh_embeddings():
+    """Every stored vector equals a fresh embedding of its chunk's text."""
+    from src.chunk_store import rehydrate
+    from src.vector_store import get_embedding_model, get_vector_store
+
+    page = get_vector_store()._collection.get(include=["embeddings", "metadatas", "documents"])
+    docs = rehydrate([Document(id=chunk_id, page_content=text or "", metadata=metadata)
+                      for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])])
+    fresh = get_embedding_model().embed_documents([doc.page_content for doc in docs])
+    return all(np.allclose(stored, vector, atol=1e-5) for stored, vector in zip(page["embeddings"], fresh))
+
+def test_sync_promotes_and_re_embeds_duplicates(store):
+    from src.db_versions import validate
+    from src.ingest import sync_codebase
+
+    tree = str(store / "tree")
+    write(tree, "a/lib.py", python_module(1))
+    write(tree, "b/copy.py", python_module(1))
+    write(tree, "c/near.py", edited(python_module(1)))
+    quiet(sync_codebase, tree)
+    assert stored_vectors_match_fresh_embeddings()
+
+    # An edited file must get vectors for its new text, not its old cluster's
+    write(tree, "a/lib.py", python_module(1) + "\n# trailing comment\n")
+    quiet(sync_codebase, tree)
+    assert stored_vectors_match_fresh_embeddings()
+
+    for path in ("a/lib.py", "b/copy.py"):
+        os.remove(os.path.join(tree, path))
+        quiet(sync_codebase, tree)
+        assert stored_vectors_match_fresh_embeddings()
+        validate(config.CHROMA_DB_PATH)
+
+def test_sync_recovers_from_interrupted_run(store, monkeypatch):
+    from src import pipeline
+    from src.db_versions import validate
+    from src.ingest import sync_codebase
+
+    tree = str(store / "tree")
+    write(tree, "a.py", python_module(1))
+    quiet(sync_codebase, tree)
+
+    # The next run records the new file's chunks in the dedup index, then dies before storing them
+    write(tree, "b.py", python_module(1) + "\n" + python_module(3))
+    def fail(*args, **kwargs):
+        raise RuntimeError("killed mid-run")
+    monkeypatch.setattr(pipeline, "upsert_chunks", fail)
+    with pytest.raises(RuntimeError):
+        quiet(sync_codebase, tree)
+    monkeypatch.undo()
+
+    from src.dedup import DedupIndex as Index
+    leftover = Index()
+    assert leftover.interrupted()
+    leftover.close()
+
+    quiet(sync_codebase, tree)
+    report = validate(config.CHROMA_DB_PATH)
+    assert report["files"] == 2
+    recovered = Index()
+    assert not recovered.interrupted()
+    recovered.close()
@@ -0,0 +1,135 @@
+# tests/test_embedding_scheduler.py
+import pytest
+
+from src import embedding_scheduler
+from src.embedding_scheduler import EmbeddingScheduler, TokenBucket
+from src.fakes import FakeEmbeddings, FakeRateLimitError, fake_vector
+from tests.helpers import FakeClock
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(embedding_scheduler, "time", fake)
+    return fake
+
+class ScriptedEmbeddings(FakeEmbeddings):
+    """Fails its first calls with the given errors, then embeds normally."""
+
+    def __init__(self, *errors: Exception):
+        super().__init__(dim=8)
+        self.errors = list(errors)
+
+    def embed_documents(self, texts):
+        self.stats["calls"] += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [fake_vector(text, self.dim) for text in texts]
+
+def scheduler(client, **kwargs) -> EmbeddingScheduler:
+    kwargs = {"max_in_flight": 8, "requests_per_minute": 10 ** 6, "tokens_per_minute": 10 ** 9,
+              "max_retries": 3, "backoff_base_seconds": 0.001, "backoff_max_seconds": 0.01, **kwargs}
+    return EmbeddingScheduler(client, **kwargs)
+
+def test_bucket_starts_full_then_waits_for_refill(clock):
+    bucket = TokenBucket(rate_per_minute=60, capacity=10)
+    for _ in range(10):
+        bucket.acquire()
+    assert clock.slept == []
+    bucket.acquire(2)
+    # One token per second: two tokens are a two-second wait
+    assert sum(clock.slept) == pytest.approx(2.0)
+
+def test_bucket_clamps_requests_to_capacity(clock):
+    bucket = TokenBucket(rate_per_minute=60, capacity=5)
+    bucket.acquire(50)
+    assert clock.slept == []
+    bucket.acquire(50)
+    assert sum(clock.slept) == pytest.approx(5.0)
+
+def test_bucket_refill_is_capped_at_capacity(clock):
+    bucket = TokenBucket(rate_per_minute=60, capacity=5)
+    bucket.acquire(5)
+    clock.sleep(3600)
+    clock.slept.clear()
+    bucket.acquire(5)
+    assert clock.slept == []
+    bucket.acquire(1)
+    assert sum(clock.slept) == pytest.approx(1.0)
+
+def test_throttle_halves_concurrency_down_to_one():
+    embedder = scheduler(FakeEmbeddings(dim=8))
+    limits = []
+    for attempt in range(5):
+        embedder._on_throttle(attempt)
+        limits.append(embedder.concurrency_limit)
+    assert limits == [4, 2, 1, 1, 1]
+    assert embedder.stats["throttled"] == 5
+    embedder.shutdown()
+
+def test_success_run_adds_one_slot_up_to_the_maximum():
+    embedder = scheduler(FakeEmbeddings(dim=8), max_in_flight=4, increase_after=3)
+    embedder._on_throttle(0)
+    embedder._on_throttle(0)
+    assert embedder.concurrency_limit == 1
+    limits = []
+    for _ in range(12):
+        embedder._on_success(1)
+        limits.append(embedder.concurrency_limit)
+    assert limits == [1, 1, 2, 2, 2, 3, 3, 3, 4, 4, 4, 4]
+    embedder.shutdown()
+
+def test_throttle_restarts_the_success_run():
+    embedder = scheduler(FakeEmbeddings(dim=8), max_in_flight=4, increase_after=3)
+    embedder._on_throttle(0)
+    embedder._on_success(1)
+    embedder._on_success(1)
+    embedder._on_throttle(0)
+    embedder._on_success(1)
+    embedder._on_success(1)
+    assert embedder.concurrency_limit == 1
+    embedder.shutdown()
+
+def test_backoff_is_jittered_exponential_and_capped():
+    embedder = scheduler(FakeEmbeddings(dim=8), backoff_base_seconds=1.0, backoff_max_seconds=10.0)
+    for attempt, ceiling in [(0, 1.0), (1, 2.0), (2, 4.0), (3, 8.0), (4, 10.0), (9, 10.0)]:
+        delays = [embedder._backoff_delay(attempt) for _ in range(200)]
+        assert all(ceiling / 2 <= delay <= ceiling for delay in delays)
+    embedder.shutdown()
+
+def test_rate_limited_requests_are_retried_after_backing_off():
+    client = ScriptedEmbeddings(FakeRateLimitError(), FakeRateLimitError())
+    embedder = scheduler(client)
+    assert embedder.embed_documents(["a", "b"]) == [fake_vector("a", 8), fake_vector("b", 8)]
+    assert embedder.stats == {"requests": 3, "texts": 2, "retries": 2, "throttled": 2}
+    assert embedder.concurrency_limit == 2
+    embedder.shutdown()
+
+def test_transient_errors_are_retried_without_throttling():
+    embedder = scheduler(ScriptedEmbeddings(RuntimeError("503 Service Unavailable")))
+    assert embedder.embed_documents(["a"]) == [fake_vector("a", 8)]
+    assert embedder.stats["retries"] == 1 and embedder.stats["throttled"] == 0
+    assert embedder.concurrency_limit == 8
+    embedder.shutdown()
+
+def test_other_errors_are_raised_at_once():
+    client = ScriptedEmbeddings(ValueError("bad request"))
+    embedder = scheduler(client)
+    with pytest.raises(ValueError):
+        embedder.embed_documents(["a"])
+    assert client.stats["calls"] == 1 and embedder.stats["retries"] == 0
+    embedder.shutdown()
+
+def test_retries_give_up_after_max_retries():
+    client = ScriptedEmbeddings(*[FakeRateLimitError() for _ in range(5)])
+    embedder = scheduler(client, max_retries=2)
+    with pytest.raises(FakeRateLimitError):
+        embedder.embed_documents(["a"])
+    assert client.stats["calls"] == 3
+    embedder.shutdown()
+
+def test_batches_respect_text_and_token_limits():
+    embedder = scheduler(FakeEmbeddings(dim=8), max_batch_texts=3, max_batch_tokens=10)
+    # Four-character texts are one token each; forty-character ones ten
+    texts = ["aaaa"] * 4 + ["b" * 40] + ["cccc"] * 2
+    assert embedder.make_batches(texts) == [[0, 1, 2], [3], [4], [5, 6]]
+    embedder.shutdown()
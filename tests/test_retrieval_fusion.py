@@ -0,0 +1,60 @@
+# tests/test_retrieval_fusion.py
+import pytest
+from langchain.docstore.document import Document
+
+from src import config
+from src.lexical_index import LexicalIndex, reciprocal_rank_fusion, reciprocal_rank_scores
+from src.retriever import RetrievalService
+
+def test_scores_sum_reciprocal_ranks_over_lists():
+    scores = reciprocal_rank_scores([["a", "b", "c"], ["c", "a"]], k=60)
+    assert scores == pytest.approx({"a": 1 / 61 + 1 / 62, "b": 1 / 62, "c": 1 / 63 + 1 / 61})
+
+def test_fusion_favours_ids_ranked_well_in_several_lists():
+    # "b" tops neither list but is in both
+    assert reciprocal_rank_fusion([["a", "b"], ["d", "b"]], k=60) == ["b", "a", "d"]
+
+def test_small_k_lets_top_ranks_dominate():
+    rankings = [["a", "w", "x", "b"], ["c", "y", "z", "b"]]
+    assert reciprocal_rank_fusion(rankings, k=60)[0] == "b"
+    assert reciprocal_rank_fusion(rankings, k=1)[:2] == ["a", "c"]
+
+def test_empty_rankings():
+    assert reciprocal_rank_scores([[], []]) == {}
+    assert reciprocal_rank_fusion([]) == []
+
+def doc(chunk_id: str, text: str) -> Document:
+    return Document(id=chunk_id, page_content=text, metadata={"source": f"{chunk_id}.py"})
+
+@pytest.fixture
+def lexical(store, inline_text):
+    index = LexicalIndex(str(store / "lexical.sqlite3"))
+    index.add_chunks([
+        doc("both", "parse config loader settings"),
+        doc("shared", "parse tokens quickly"),
+        doc("other", "render widgets on screen"),
+    ])
+    yield index
+    index.close()
+
+def test_fuse_merges_vector_and_lexical_rankings(lexical):
+    vector_docs = [doc("vector_only", "semantic neighbour"), doc("shared", "parse tokens quickly")]
+    fused = RetrievalService()._fuse(lexical, "parse config", vector_docs, k=3)
+
+    # "shared" is in both rankings; the two single-list firsts tie, vector order first
+    assert [d.id for d in fused] == ["shared", "vector_only", "both"]
+    assert all(d.metadata["match"] == "hybrid" for d in fused)
+    assert fused[0].metadata["score"] == round(2 / (config.RRF_K + 2), 4)
+    assert fused[2].metadata["score"] == round(1 / (config.RRF_K + 1), 4)
+    # A lexical-only hit is fetched from the index, text included
+    assert fused[2].page_content == "parse config loader settings"
+
+def test_fuse_truncates_to_k(lexical):
+    vector_docs = [doc("vector_only", "semantic neighbour"), doc("shared", "parse tokens quickly")]
+    fused = RetrievalService()._fuse(lexical, "parse config", vector_docs, k=1)
+    assert [d.id for d in fused] == ["shared"]
+
+def test_fuse_without_lexical_hits_keeps_vector_order(lexical):
+    vector_docs = [doc("x", "first"), doc("y", "second")]
+    fused = RetrievalService()._fuse(lexical, "nothing matches", vector_docs, k=4)
+    assert [d.id for d in fused] == ["x", "y"]
@@ -0,0 +1,27 @@
+import os
+import sys
+import argparse
+
+# Add the project root to the python path
+sys.path.append(os.getcwd())
+
+from src import config
+from src.watcher import CodebaseWatcher
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the index in sync with the codebase as files change.")
+    parser.add_argument("--root", default=config.CODEBASE_ROOT, help="Codebase to watch.")
+    parser.add_argument("--backend", choices=["auto", "inotify", "polling"], default=config.WATCH_BACKEND,
+                        help="Change detection: inotify (needs watchdog), polling, or auto.")
+    parser.add_argument("--debounce", type=float, default=None, help="Quiet seconds that end a burst of changes.")
+    parser.add_argument("--poll-interval", type=float, default=None, help="Seconds between polling scans.")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.root):
+        print(f"ERROR: Codebase path does not exist: {args.root}")
+        return
+    CodebaseWatcher(args.root, backend=args.backend, debounce=args.debounce,
+                    poll_interval=args.poll_interval).run_forever()
+
+if __name__ == "__main__":
+    main()